@@ -0,0 +1,148 @@
+"""
+Interactive Picker Frame Budget
+
+This script types queries char by char into the search the interactive
+picker gets from Corpus.prefix_search, over corpora of growing size, and times
+each keystroke (extending the search and ranking the matches shown). It fails
+when a keystroke takes longer than a frame, except on the pure-Python engine
+past the size the vectorized one takes over, whose typing the picker
+debounces.
+
+Usage:
+    python -m benchmarks.bench_picker [--sizes 1000 100000 ...] [--rounds <n>]
+
+Author:
+    guidodinello
+"""
+
+import random
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import dataclass
+
+from utils.picker import FRAME_BUDGET, retype
+from utils.string_fuzzy_matcher import MIN_VECTORIZED_PAIRS, Corpus
+
+SIZES = [1_000, MIN_VECTORIZED_PAIRS, 20_000, 100_000]
+ALPHABET = "abcdefghijklmnopqrstuvwxyz-_0123456789"
+WORD_LENGTHS = (4, 24)
+# Same bound the open and cheatsheet pickers use, and a tall terminal
+MAX_DISTANCE = 3
+NUM_RESULTS = 50
+
+QUERIES = 3
+SEED = 2024
+
+
+@dataclass(frozen=True, slots=True)
+class Result:
+    size: int
+    # Module of the search Corpus.prefix_search picked
+    engine: str
+    # Best time of each keystroke over the rounds, in seconds
+    keystrokes: list[float]
+
+    @property
+    def worst(self) -> float:
+        return max(self.keystrokes)
+
+    @property
+    def debounced(self) -> bool:
+        """Whether the picker debounces the typing on this engine and size"""
+        return self.engine.endswith("string_fuzzy_matcher") and (
+            self.size >= MIN_VECTORIZED_PAIRS
+        )
+
+    def over_budget(self, budget: float = FRAME_BUDGET) -> bool:
+        return self.worst > budget and not self.debounced
+
+
+def make_corpus(size: int) -> tuple[list[str], list[str]]:
+    """Deterministic corpus and queries typed into it, corpus words with a
+    typo"""
+    rng = random.Random(f"{SEED}/{size}")
+    corpus = [
+        "".join(rng.choices(ALPHABET, k=rng.randint(*WORD_LENGTHS)))
+        for _ in range(size)
+    ]
+    queries = []
+    for _ in range(QUERIES):
+        query = list(rng.choice(corpus)[:12])
+        query[rng.randrange(len(query))] = rng.choice(ALPHABET)
+        queries.append("".join(query))
+    return corpus, queries
+
+
+def measure(size: int, rounds: int = 3) -> Result | None:
+    """Times the keystrokes of the queries over a corpus of size words, None
+    if the picker can't search it (NumPy is missing)"""
+    corpus, queries = make_corpus(size)
+    try:
+        search = Corpus(corpus).prefix_search(MAX_DISTANCE)
+    except ImportError as e:
+        print(f"Skipping {size} words: {e}")
+        return None
+
+    keystrokes = [float("inf")] * sum(map(len, queries))
+    for _ in range(rounds):
+        keystroke = 0
+        for query in queries:
+            retype(search, "")
+            for char in query:
+                started = time.perf_counter()
+                search.push(char)
+                search.best(NUM_RESULTS)
+                elapsed = time.perf_counter() - started
+                keystrokes[keystroke] = min(keystrokes[keystroke], elapsed)
+                keystroke += 1
+    return Result(size, type(search).__module__, keystrokes)
+
+
+def configure_cli_args():
+    parser = ArgumentParser(description="Interactive Picker Frame Budget")
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=3,
+        help="Number of times each query is typed, keeping the best time of "
+        "each keystroke (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=FRAME_BUDGET * 1e3,
+        help="Fail when a keystroke takes longer than this many milliseconds "
+        "(default: %(default).1f)",
+    )
+    return parser
+
+
+def main() -> int:
+    args = configure_cli_args().parse_args()
+
+    failed = False
+    for size in args.sizes:
+        result = measure(size, args.rounds)
+        if result is None:
+            continue
+        print(
+            f"{size:>9} words {result.engine:<28}"
+            f" median {statistics.median(result.keystrokes) * 1e3:>7.2f} ms"
+            f" worst {result.worst * 1e3:>7.2f} ms"
+        )
+        if result.over_budget(args.budget / 1e3):
+            print(
+                f"SLOW {size} words: a keystroke is over the {args.budget:.1f} ms budget"
+            )
+            failed = True
+        elif result.debounced and result.worst > args.budget / 1e3:
+            print(f"DEBOUNCED {size} words: install NumPy to rank on every keystroke")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Fuzzy String Matcher Benchmarks
+
+This script times find_most_similar_words for every available sfm backend
+(the pure-Python utils.string_fuzzy_matcher and, when installed, the Rust
+fuzzy_string_matcher extension) over a matrix of corpus sizes, word lengths
+and alphabets. Results are written to a JSON file, and can be compared against
+a previously saved one to fail when any case got slower than allowed.
+
+Usage:
+    python -m benchmarks.bench_sfm [--output <path>] [--sizes 10 1000 ...]
+        [--baseline <path> [--max-slowdown <ratio>]]
+
+Author:
+    guidodinello
+"""
+
+import functools
+import importlib
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable, Iterable
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from types import ModuleType
+
+from utils.sfm import BACKENDS
+
+SIZES = [10, 100, 1_000, 10_000, 100_000, 1_000_000]
+WORD_LENGTHS = {
+    "short": (4, 8),
+    "medium": (12, 24),
+    "long": (40, 80),
+}
+ALPHABETS = {
+    "ascii": "abcdefghijklmnopqrstuvwxyz-_0123456789",
+    "latin": "abcdefghijklmnopqrstuvwxyzáéíóúñüç-_",
+    "mixed": "abcdefghijklmnopqrstuvwxyz-_ñ€日本語😀",
+}
+# Same bounds the open and cheatsheet suggestions use
+NUM_RESULTS = 3
+MAX_DISTANCES = [None, 3]
+
+QUERIES_PER_CASE = 5
+SEED = 2024
+
+
+@dataclass(frozen=True, slots=True)
+class Case:
+    backend: str
+    size: int
+    length: str
+    alphabet: str
+    max_distance: int | None
+
+    @property
+    def key(self) -> str:
+        return (
+            f"{self.backend}/{self.size}/{self.length}/{self.alphabet}"
+            f"/{self.max_distance}"
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Result:
+    case: Case
+    # Best time of a single query over all the rounds
+    seconds: float
+    rounds: int
+
+
+def available_backends(names: Iterable[str]) -> dict[str, ModuleType]:
+    backends = {}
+    for name in names:
+        try:
+            backends[name] = importlib.import_module(BACKENDS[name])
+        except ImportError:
+            print(f"Skipping {name} backend: {BACKENDS[name]} is not installed")
+    return backends
+
+
+def make_corpus(size: int, length: str, alphabet: str) -> tuple[list[str], list[str]]:
+    """Deterministic corpus and queries for a case. Queries are corpus words
+    with a couple of typos, like the ones the suggestions are computed for"""
+    rng = random.Random(f"{SEED}/{size}/{length}/{alphabet}")
+    min_len, max_len = WORD_LENGTHS[length]
+    chars = ALPHABETS[alphabet]
+    corpus = [
+        "".join(rng.choices(chars, k=rng.randint(min_len, max_len)))
+        for _ in range(size)
+    ]
+
+    queries = []
+    for _ in range(QUERIES_PER_CASE):
+        query = list(rng.choice(corpus))
+        for _ in range(2):
+            query[rng.randrange(len(query))] = rng.choice(chars)
+        queries.append("".join(query))
+    return corpus, queries
+
+
+def time_case(
+    search: Callable[[str], object],
+    queries: list[str],
+    max_rounds: int,
+    time_budget: float,
+) -> tuple[float, int]:
+    """Runs all the queries up to max_rounds times, stopping early once the
+    time budget is spent, and returns the best time per query"""
+    best = float("inf")
+    rounds = 0
+    started = time.perf_counter()
+    while rounds < max_rounds:
+        round_start = time.perf_counter()
+        for query in queries:
+            search(query)
+        best = min(best, (time.perf_counter() - round_start) / len(queries))
+        rounds += 1
+        if time.perf_counter() - started > time_budget:
+            break
+    return best, rounds
+
+
+def run(
+    backends: dict[str, ModuleType],
+    matrix: Iterable[tuple[int, str, str]],
+    max_rounds: int = 5,
+    time_budget: float = 2.0,
+) -> list[Result]:
+    """Times every backend on each (size, length, alphabet) of the matrix"""
+    results = []
+    for size, length, alphabet in matrix:
+        corpus, queries = make_corpus(size, length, alphabet)
+        for (backend_name, backend), max_distance in itertools.product(
+            backends.items(),
+            MAX_DISTANCES,
+        ):
+            case = Case(backend_name, size, length, alphabet, max_distance)
+            result = Result(
+                case,
+                *time_case(
+                    functools.partial(
+                        backend.find_most_similar_words,
+                        word_list=corpus,
+                        num_results=NUM_RESULTS,
+                        max_distance=max_distance,
+                    ),
+                    queries,
+                    max_rounds,
+                    time_budget,
+                ),
+            )
+            results.append(result)
+            print(f"{case.key:<45} {result.seconds * 1e3:>12.3f} ms")
+    return results
+
+
+def save(results: list[Result], path: str) -> None:
+    report = {
+        "meta": {
+            "created": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "python": sys.version,
+            "platform": platform.platform(),
+        },
+        "results": [
+            {**asdict(result.case), "seconds": result.seconds, "rounds": result.rounds}
+            for result in results
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+
+def load_times(path: str) -> dict[str, float]:
+    """Seconds per query of a saved report, by case key"""
+    with open(path, encoding="utf-8") as file:
+        report = json.load(file)
+    times = {}
+    for entry in report["results"]:
+        seconds = entry.pop("seconds")
+        entry.pop("rounds", None)
+        times[Case(**entry).key] = seconds
+    return times
+
+
+def regressions(
+    results: list[Result],
+    baseline: dict[str, float],
+    max_slowdown: float,
+) -> list[tuple[Case, float]]:
+    """Cases that got slower than max_slowdown times their baseline time,
+    with their slowdown. Cases missing from the baseline are ignored"""
+    slower = []
+    for result in results:
+        previous = baseline.get(result.case.key)
+        if previous is None or previous <= 0:
+            continue
+        slowdown = result.seconds / previous
+        if slowdown > max_slowdown:
+            slower.append((result.case, slowdown))
+    return slower
+
+
+def configure_cli_args():
+    parser = ArgumentParser(description="Fuzzy String Matcher Benchmarks")
+    parser.add_argument(
+        "--output",
+        "-o",
+        default="bench_results.json",
+        help="Where to write the results (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=sorted(BACKENDS),
+        default=sorted(BACKENDS),
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument(
+        "--lengths",
+        nargs="+",
+        choices=list(WORD_LENGTHS),
+        default=list(WORD_LENGTHS),
+    )
+    parser.add_argument(
+        "--alphabets",
+        nargs="+",
+        choices=list(ALPHABETS),
+        default=list(ALPHABETS),
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=5,
+        help="Maximum number of timing rounds per case (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=2.0,
+        help="Seconds after which a case stops starting new rounds "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--baseline",
+        "-b",
+        help="Previous results to compare against",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="Fail when a case takes more than this times its baseline time "
+        "(default: %(default)s)",
+    )
+    return parser
+
+
+def main() -> int:
+    args = configure_cli_args().parse_args()
+
+    backends = available_backends(args.backends)
+    results = run(
+        backends,
+        itertools.product(args.sizes, args.lengths, args.alphabets),
+        args.rounds,
+        args.time_budget,
+    )
+    save(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        slower = regressions(results, load_times(args.baseline), args.max_slowdown)
+        for case, slowdown in slower:
+            print(f"REGRESSION {case.key}: {slowdown:.2f}x slower than baseline")
+        if slower:
+            return 1
+        print(f"No case is more than {args.max_slowdown}x slower than the baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
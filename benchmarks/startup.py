@@ -0,0 +1,122 @@
+"""
+Entry Point Startup Time
+
+This script measures how long importing the open and cheatsheet entry points
+takes, as reported by `python -X importtime`, and lists the modules each of
+them loads. It fails when an entry point takes longer than the budget or
+eagerly loads one of the modules that should only be imported on the code
+paths that need them.
+
+Usage:
+    python -m benchmarks.startup [--budget <ms>] [--runs <n>]
+
+Author:
+    guidodinello
+"""
+
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = ["open.open", "cheatsheet.cheatsheet"]
+# Modules only some commands need, which must not be imported at startup
+LAZY_MODULES = [
+    "fuzzy_string_matcher",
+    "utils.string_fuzzy_matcher",
+    "utils.word_index",
+]
+
+# Cumulative import time of an entry point, in milliseconds
+BUDGET_MS = 50.0
+
+
+@dataclass(frozen=True, slots=True)
+class Startup:
+    module: str
+    # Cumulative import time in milliseconds, best over the runs
+    milliseconds: float
+    imported: frozenset[str]
+
+
+def parse_importtime(stderr: str) -> dict[str, float]:
+    """Cumulative import time in milliseconds of every module listed in the
+    output of -X importtime"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e3
+    return times
+
+
+def measure(module: str, cwd: str | os.PathLike[str], runs: int = 5) -> Startup:
+    """Imports module in fresh interpreters started from cwd, so that no
+    logs directory or index ends up in the repository"""
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    best = float("inf")
+    imported: frozenset[str] = frozenset()
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times = parse_importtime(completed.stderr)
+        best = min(best, times[module])
+        imported = frozenset(times)
+    return Startup(module, best, imported)
+
+
+def configure_cli_args():
+    parser = ArgumentParser(description="Entry Point Startup Time")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=BUDGET_MS,
+        help="Fail when an entry point takes longer than this many "
+        "milliseconds to import (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Number of imports to keep the best time of (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cwd",
+        default=os.getcwd(),
+        help="Directory to run the imports from (default: current directory)",
+    )
+    return parser
+
+
+def main() -> int:
+    args = configure_cli_args().parse_args()
+
+    failed = False
+    for module in ENTRY_POINTS:
+        startup = measure(module, args.cwd, args.runs)
+        print(f"{module:<25} {startup.milliseconds:>8.1f} ms")
+        if startup.milliseconds > args.budget:
+            print(f"SLOW {module}: over the {args.budget} ms budget")
+            failed = True
+        for lazy_module in LAZY_MODULES:
+            if lazy_module in startup.imported:
+                print(f"EAGER {module}: imports {lazy_module} at startup")
+                failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,21 +4,35 @@ Cheatsheet Manager
 This script provides a command-line interface to manage and access cheatsheets
 in Markdown format. Users can open specific cheatsheets using their names,
 list all available cheatsheets, or receive suggestions for similar cheatsheet
-names using fuzzy string matching.
+names using fuzzy string matching (SFM_ALGORITHM=subsequence matches
+abbreviations rather than typos). Cheatsheets can also be searched by the
+commands, flags or words they contain.
 
 Usage:
     python cheatsheet.py <cheatsheet_name>
     python cheatsheet.py -h | --help
     python cheatsheet.py -l | --list | --show_all
+    python cheatsheet.py -s | --search <words>...
+    python cheatsheet.py -i | --interactive [<query>]
+    python cheatsheet.py --completions
 
 Options:
     <cheatsheet_name>      The name of the cheatsheet to be opened.
     -h, --help             Show usage documentation.
     -l, --list, --show_all List all available cheatsheet names.
+    -s, --search           List the cheatsheets containing all the words,
+                           with their matching lines.
+    -i, --interactive      Pick the cheatsheet from a list narrowed down as
+                           you type, starting from <query>.
+    --completions          Write the cheatsheet names cache read by the shell
+                           completion, kept up to date afterwards.
+
+Configuration:
+    - folder (in the .env file next to this script):
+        The folder path where cheatsheets in Markdown format are stored.
+        Only read when a command needs it.
 
 Global Constants:
-    - CHEATSHEETS_FOLDER:
-        The folder path where cheatsheets in Markdown format are stored.
     - SIMILARITY_THRESHOLD: A threshold for fuzzy string matching similarity.
 
 Author:
@@ -26,91 +40,190 @@ Author:
 
 """
 
+import functools
 import os
 import subprocess
 import sys
-from itertools import chain
 from pathlib import Path
 
-from utils import configreader
-from utils.functional_utils import lazy_find
+from utils import completions, configreader, dir_index
 from utils.logger import get_logger
-from utils.sfm import sfm
 
 logger = get_logger()
 
 
 PATH_DIR = os.path.join(os.path.dirname(__file__), ".env")
+INDEX_PATH = os.path.join(os.path.dirname(__file__), ".env.index")
+STEMS_PATH = os.path.join(os.path.dirname(__file__), ".env.stems")
+TEXT_INDEX_DIR = os.path.join(os.path.dirname(__file__), ".env.text_index")
+
+# Earlier extensions win when several cheatsheets share a name
+EXTENSIONS = (".md", ".txt", ".pdf")
 
 # Configurable Script Constants
-CHEATSHEETS_FOLDER = configreader.read_mapping_file(PATH_DIR)["folder"]
 SIMILARITY_THRESHOLD = 4
 
-USAGE_DOCS = f"""
+USAGE_DOCS = """
 Usage: cheatsheet <cheatsheet_name>
+       cheatsheet --search <words>...
+       cheatsheet --interactive [<query>]
 
 This command opens the <cheatsheet_name>.md
 located under FOLDER using in VSCode.
 If no file matches <cheatsheet_name>.md, it will show an error
 and print a list of similar files.
+With --search, it lists the cheatsheets containing all the words
+(e.g. a command or a flag) along with their matching lines.
+With --interactive, the cheatsheet is picked from a list of names ranked
+again on every keystroke.
 
-FOLDER={CHEATSHEETS_FOLDER}
+FOLDER={folder}
 """
 
 
-def cheatsheets():
-    extensions = ["*.md", "*.txt", "*.pdf"]
-    return chain(*(Path(CHEATSHEETS_FOLDER).glob(ext) for ext in extensions))
+@functools.cache
+def cheatsheets_folder() -> Path:
+    """Cheatsheets folder from the .env file, only read once it's needed"""
+    folder = configreader.lookup_mapping_file(PATH_DIR, "folder")
+    if folder is None:
+        raise KeyError(f"folder is not set in {PATH_DIR}")
+    return folder
+
+
+def usage_docs() -> str:
+    return USAGE_DOCS.format(folder=cheatsheets_folder())
 
 
-def open_cheatsheet(cheatsheet_path: Path):
-    path = os.path.join(CHEATSHEETS_FOLDER, cheatsheet_path)
+@functools.cache
+def cheatsheets() -> dict[str, str]:
+    """Cheatsheet file names by folded name, the folder is only listed again
+    when its contents changed since the last run"""
+    return dir_index.read_stem_index(
+        str(cheatsheets_folder()),
+        EXTENSIONS,
+        STEMS_PATH,
+    )
+
+
+def open_cheatsheet(file_name: str):
+    path = os.path.join(cheatsheets_folder(), file_name)
     # subprocess.run(["code", path], check=True)
     subprocess.run(["xdg-open", path], check=True)
 
 
+def search_cheatsheets(query: str) -> int:
+    # Only imported when needed, to keep startup fast
+    from utils import text_index  # pylint: disable=import-outside-toplevel
+
+    contents_index = text_index.TextIndex(
+        str(cheatsheets_folder()),
+        TEXT_INDEX_DIR,
+        EXTENSIONS,
+    )
+    contents_index.update()
+    results = contents_index.search(query, num_results=5)
+    if not results:
+        print(f"No cheatsheet contains: {query}")
+        return 1
+
+    for number, result in enumerate(results, start=1):
+        print(f"{number}- {Path(result.name).stem}")
+        for line_number, line in result.snippets:
+            print(f"\t{line_number:>5}: {line}")
+
+    answer = input("Open a cheatsheet? [number/n] ")
+    try:
+        number = int(answer)
+        if number < 1:
+            raise IndexError(number)
+        open_cheatsheet(results[number - 1].name)
+        return 0
+    except (ValueError, IndexError):
+        if answer != "n":
+            print("Invalid input!")
+        return 1
+
+
+def write_completions() -> int:
+    completions.write(
+        completions.cache_path(STEMS_PATH),
+        str(cheatsheets_folder()),
+        dir_index.stems(cheatsheets()),
+    )
+    return 0
+
+
+def pick_cheatsheet(query: str) -> int:
+    # Only imported when needed, to keep startup fast
+    # pylint: disable-next=import-outside-toplevel
+    from utils import picker, string_fuzzy_matcher
+
+    corpus = string_fuzzy_matcher.Corpus(cheatsheets())
+    try:
+        search = corpus.prefix_search(SIMILARITY_THRESHOLD - 1)
+    except ImportError as e:
+        print(e)
+        return 1
+    chosen = picker.pick(search, query, fold=dir_index.fold)
+    if chosen is None:
+        return 1
+    open_cheatsheet(cheatsheets()[chosen])
+    return 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] in ("-s", "--search"):
+        sys.exit(search_cheatsheets(" ".join(sys.argv[2:])))
+
+    if len(sys.argv) >= 2 and sys.argv[1] in ("-i", "--interactive"):
+        sys.exit(pick_cheatsheet(" ".join(sys.argv[2:])))
+
     if len(sys.argv) != 2:
-        print(USAGE_DOCS)
+        print(usage_docs())
         sys.exit(1)
 
     match sys.argv[1]:
         case "-h" | "--help":
-            print(USAGE_DOCS)
+            print(usage_docs())
             sys.exit(1)
+        case "--completions":
+            sys.exit(write_completions())
         case "-l" | "--list" | "--show_all":
             print("Available cheatsheets:")
-            for cheatsheet in cheatsheets():
-                print(f"\t* {cheatsheet.stem}")
+            for name in cheatsheets().values():
+                print(f"\t* {Path(name).stem}")
             sys.exit(1)
         case cheatsheet_name:
-            cheatsheet_name = cheatsheet_name.lower()  # pylint: disable=C0103
-
-            cheatsheet_file = lazy_find(
-                lambda x: x.stem.lower() == cheatsheet_name,
-                cheatsheets(),
-            )
+            cheatsheet_name = dir_index.fold(cheatsheet_name)  # pylint: disable=C0103
 
+            cheatsheet_file = cheatsheets().get(cheatsheet_name)
             if cheatsheet_file is not None:
                 open_cheatsheet(cheatsheet_file)
                 sys.exit(0)
 
             print("Cheatsheet not found. Maybe you meant:")
-            similar = sfm.find_most_similar_words(  # type: ignore[attr-defined]
-                cheatsheet_name,
-                [x.stem.lower() for x in cheatsheets()],
-                3,
-            )
-            recommendations = list(
-                filter(lambda x: x.distance < SIMILARITY_THRESHOLD, similar),
-            )
+            # Only imported when needed, to keep startup fast
+            # pylint: disable-next=import-outside-toplevel
+            from utils import sfm, word_index
+
+            stems_index = word_index.load_or_build(INDEX_PATH, cheatsheets())
+            if sfm.algorithm() == sfm.SUBSEQUENCE:
+                recommendations = sfm.sfm.find_best_subsequence_matches(
+                    cheatsheet_name,
+                    stems_index.words,
+                    3,
+                )
+            else:
+                recommendations = stems_index.search(
+                    cheatsheet_name,
+                    SIMILARITY_THRESHOLD - 1,
+                    3,
+                )
             if len(recommendations) == 0:
                 # if no good enough recommendations, show first similar
-                print(f"\t1- {similar[0].word}")
-                recommendations = [similar[0]]
-            else:
-                for index, (word, _) in enumerate(recommendations):
-                    print(f"\t{index}- {word}")
+                recommendations = stems_index.search(cheatsheet_name, num_results=1)
+            for index, (word, _) in enumerate(recommendations, start=1):
+                print(f"\t{index}- {word}")
 
             read = input("Open a similar cheatsheet? [number/n] ")
             if read == "n":
@@ -118,11 +231,7 @@ if __name__ == "__main__":
 
             try:
                 index = int(read)
-                cheatsheet_file = lazy_find(
-                    lambda x: x.stem.lower() == recommendations[index - 1].word,
-                    cheatsheets(),
-                )
-                open_cheatsheet(cheatsheet_file)  # type: ignore[arg-type]
+                open_cheatsheet(cheatsheets()[recommendations[index - 1].word])
                 sys.exit(0)
             except (ValueError, IndexError):
                 print("Invalid input!")
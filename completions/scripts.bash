@@ -0,0 +1,55 @@
+# Tab completion of the open project names and the cheatsheet names.
+# Names are read from the completion caches the scripts keep up to date (see
+# utils/completions.py), so completing doesn't start Python. A script is only
+# run to write its cache again when it's missing or older than its source.
+# Sourced from the shell configuration by setup.sh.
+
+_SCRIPTS_DIR="${_SCRIPTS_DIR:-$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)}"
+
+# _scripts_complete <script> <cache> <prefix>: sets COMPREPLY to the cached
+# names starting with prefix
+_scripts_complete() {
+    local script=$1 cache="${_SCRIPTS_DIR}/$2" prefix=$3 source="" name
+    local -a names
+    COMPREPLY=()
+    if [[ -r $cache ]]; then
+        IFS= read -r source <"$cache"
+        source=${source#\#}
+    fi
+    if [[ ! -r $cache || $source -nt $cache ]]; then
+        "${_SCRIPTS_DIR}/.venv/bin/python" "${_SCRIPTS_DIR}/${script}/${script}.py" \
+            --completions >/dev/null 2>&1 || return
+    fi
+    mapfile -t -s 1 names <"$cache"
+    for name in "${names[@]}"; do
+        [[ $name == "$prefix"* ]] && COMPREPLY+=("$name")
+    done
+}
+
+_scripts_open() {
+    local current=${COMP_WORDS[COMP_CWORD]} previous=${COMP_WORDS[COMP_CWORD - 1]}
+    case "$previous" in
+    -rp | --relative_path | -ae | --add_entry)
+        compopt -o default
+        COMPREPLY=()
+        return
+        ;;
+    esac
+    if [[ $current == -* ]]; then
+        mapfile -t COMPREPLY < <(compgen -W "--list --add_entry --relative_path --keep --interactive --debug --serve --completions --help" -- "$current")
+        return
+    fi
+    _scripts_complete open open/.env.completions "$current"
+}
+
+_scripts_cheatsheet() {
+    local current=${COMP_WORDS[COMP_CWORD]}
+    if [[ $current == -* ]]; then
+        mapfile -t COMPREPLY < <(compgen -W "--list --search --interactive --completions --help" -- "$current")
+        return
+    fi
+    _scripts_complete cheatsheet cheatsheet/.env.stems.completions "$current"
+}
+
+complete -F _scripts_open open
+complete -F _scripts_cheatsheet cheatsheet
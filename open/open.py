@@ -6,39 +6,101 @@ associated names. It allows users to register, view, and access project paths.
 The script supports adding new project entries, displaying registered projects,
 and opening project paths in the default file manager and Visual Studio Code.
 If a project name is misspelled or not found, the script provides suggestions
-for similar project names using fuzzy string matching.
+for similar project names using fuzzy string matching, by edit distance or,
+with SFM_ALGORITHM=subsequence, by abbreviation.
+Opened projects are recorded, so a prefix or a misspelled name of a project
+that's often or recently opened directly opens it.
 
 Usage:
     python project_path_manager.py [--list] [--add_entry <key> <abs_path>]
-        [project_name [--relative_path <path>] [--keep]]
+        [project_name ... [--relative_path <path>] [--keep]] [--interactive]
+        [--completions] [--serve]
+
+With --interactive, the project is picked from the registered names, ranked
+again on every keystroke by how close they start to what's typed.
+
+With --serve, the script keeps running as a daemon that holds the project
+mapping and the fuzzy matching index in memory, and later invocations forward
+their project name or --list to it over a Unix socket instead of loading them.
 
 Author:
     guidodinello
 """
 
+import functools
+import math
 import os
 import signal
 import subprocess
 import sys
-from argparse import ArgumentParser
+import time
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from contextlib import redirect_stdout
+from io import StringIO
 from logging import DEBUG
 from pathlib import Path
-from typing import Protocol
+from typing import TYPE_CHECKING, Any, NamedTuple, Protocol
+
+from utils import completions, configreader, frecency
+from utils.logger import flush_logs, get_logger
 
-from utils import configreader
-from utils.logger import get_logger
-from utils.sfm import sfm
+if TYPE_CHECKING:
+    from utils.string_fuzzy_matcher import WordDistance, WordScore
+    from utils.word_index import BKTree
 
 logger = get_logger()
 
 SIMILARITY_THRESHOLD = 4
+# A name this many typos away from an opened project opens it, fewer for short
+# names (see max_typos)
+MAX_TYPOS = 2
+# A name is allowed a typo per this many chars, so "db" doesn't open "ui"
+CHARS_PER_TYPO = 3
+# A previously opened name matching the chars of the query in order is only
+# opened right away when it's within max_typos, or scores this much above
+# every other name: one more matched char (see string_fuzzy_matcher.SCORE_MATCH)
+SUBSEQUENCE_LEAD = 16
+# Ranking a suggestion a typo farther takes twice its visits to the power of this
+TYPO_COST = 2
 PATHS_DIR = os.path.join(os.path.dirname(__file__), ".env")
+INDEX_PATH = os.path.join(os.path.dirname(__file__), ".env.index")
+HISTORY_PATH = os.path.join(os.path.dirname(__file__), ".env.history")
+# The daemon socket lives in a directory private to the user, see
+# daemon.private_directory
+SOCKET_PATH = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"open-{os.getuid()}", "open.sock"
+)
+# Environment variables a client sends to the daemon, the ones VS Code and the
+# file manager need to show up in the client's session
+LAUNCH_ENV = (
+    "PATH",
+    "HOME",
+    "LANG",
+    "DISPLAY",
+    "WAYLAND_DISPLAY",
+    "XAUTHORITY",
+    "XDG_RUNTIME_DIR",
+    "DBUS_SESSION_BUS_ADDRESS",
+)
 
 OPEN_FILE_MANAGER = False
+# Launchers still running after this many seconds are killed
+LAUNCH_TIMEOUT_SECONDS = 15
+
+
+def max_typos(name: str) -> int:
+    """Typos a name opening a project without asking may have"""
+    return min(MAX_TYPOS, len(name) // CHARS_PER_TYPO)
+
 
+def launch_env(environ: Mapping[str, str]) -> dict[str, str]:
+    """The LAUNCH_ENV variables of environ"""
+    return {name: environ[name] for name in LAUNCH_ENV if name in environ}
 
-def cleaned_env():
-    env = os.environ.copy()
+
+def cleaned_env(environ: Mapping[str, str] | None = None):
+    env = dict(os.environ if environ is None else environ)
 
     env.pop("VIRTUAL_ENV", None)
 
@@ -68,7 +130,7 @@ class HelpCommand:
 
 
 class ListProjectsCommand:
-    def __init__(self, paths: dict[str, Path]):
+    def __init__(self, paths: Mapping[str, Path]):
         self.paths = paths
 
     def execute(self):
@@ -79,10 +141,9 @@ class ListProjectsCommand:
 
 
 class AddProjectCommand:
-    def __init__(self, key: str, abs_path: str, paths: dict[str, Path], paths_dir: str):
+    def __init__(self, key: str, abs_path: str, paths_dir: str):
         self.key = key
         self.abs_path = abs_path
-        self.paths = paths
         self.paths_dir = paths_dir
 
     def execute(self):
@@ -91,123 +152,509 @@ class AddProjectCommand:
         return 0
 
 
+class WriteCompletionsCommand:
+    def __init__(self, paths_dir: str):
+        self.paths_dir = paths_dir
+
+    def execute(self):
+        paths = configreader.read_mapping_file(self.paths_dir)
+        completions.write(completions.cache_path(self.paths_dir), self.paths_dir, paths)
+        return 0
+
+
+class Launch(NamedTuple):
+    project_name: str
+    description: str
+    args: list[str]
+    env: Mapping[str, str] | None
+
+
+def run_launches(launches: Sequence[Launch], timeout: float) -> list[str | None]:
+    """Starts all the launches at once, then waits for them, so it takes about
+    as long as the slowest one.
+    Args:
+        launches (Sequence[Launch]): programs to run
+        timeout (float): seconds after which a launch still running is killed
+    Returns:
+        list[str | None]: for each launch, why it failed or None if it didn't
+    """
+    errors: list[str | None] = [None] * len(launches)
+    processes: list[tuple[int, subprocess.Popen]] = []
+    for position, launch in enumerate(launches):
+        try:
+            # waited for below, once all of them are started
+            # pylint: disable-next=consider-using-with
+            processes.append((position, subprocess.Popen(launch.args, env=launch.env)))
+        except OSError as e:
+            errors[position] = str(e)
+
+    deadline = time.monotonic() + timeout
+    for position, process in processes:
+        try:
+            returncode = process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            errors[position] = f"timed out after {timeout}s"
+            continue
+        if returncode:
+            errors[position] = f"exited with status {returncode}"
+    return errors
+
+
 class OpenProjectCommand:
+    # pylint: disable-next=too-many-arguments
     def __init__(
         self,
-        project_name: str,
-        paths: dict[str, Path],
+        project_names: Sequence[str],
+        paths: Mapping[str, Path],
         relative_path: str | None = None,
         keep_terminal: bool = False,
+        *,
+        environ: Mapping[str, str] | None = None,
+        parent_pid: int | None = None,
+        load_index: Callable[[], "BKTree"] | None = None,
     ):
-        self.project_name = project_name.lower()
+        """
+        Args:
+            project_names (Sequence[str]): projects to open, all at once
+            environ (Mapping[str, str] | None): environment VS Code is
+                started with, defaults to the one of this process
+            parent_pid (int | None): terminal to close, defaults to the
+                parent of this process
+            load_index (Callable[[], BKTree] | None): returns the index of the
+                project names used for suggestions, defaults to the persisted one
+        """
+        self.project_names = [project_name.lower() for project_name in project_names]
         self.paths = paths
         self.relative_path = relative_path
         self.keep_terminal = keep_terminal
+        self.environ = environ
+        self.parent_pid = os.getppid() if parent_pid is None else parent_pid
+        self.load_index = load_index
+
+    def execute(self) -> int:
+        exit_code = 0
+        resolved: list[str] = []
+        for project_name in self.project_names:
+            name = self._resolve(project_name)
+            if name is None:
+                exit_code = self._handle_not_found(project_name)
+                continue
+            if name != project_name:
+                logger.info("Resolved %s to:  %s", project_name, name)
+            if name not in resolved:
+                resolved.append(name)
+
+        failed: dict[str, str] = {}
+        launches = self._launches(resolved)
+        for launch, error in zip(
+            launches, run_launches(launches, LAUNCH_TIMEOUT_SECONDS)
+        ):
+            if error is None:
+                logger.info("Opened %s", launch.description)
+            else:
+                logger.error("Failed to open %s:  %s", launch.description, error)
+                failed.setdefault(launch.project_name, error)
+
+        if failed:
+            print(
+                "Failed to open: "
+                + ", ".join(f"{name} ({error})" for name, error in failed.items())
+            )
+            exit_code = 1
 
-    def execute(self):
-        if self.project_name not in self.paths:
-            return self._handle_not_found()
+        self._record([name for name in resolved if name not in failed])
 
-        path_project = self.paths[self.project_name]
-        if self.relative_path:
-            path_project = Path(path_project, self.relative_path)
+        # Close calling terminal if requested, unless there's something to read
+        if not self.keep_terminal and exit_code == 0:
+            self._close_terminal()
 
-        # Open VS Code
-        try:
-            subprocess.run(["code", path_project], env=cleaned_env(), check=True)
-            logger.info("Opened VS Code for:  %s", path_project)
-        except subprocess.SubprocessError as e:
-            logger.error("Failed to open VS Code:  %s", e)
-            return 1
+        return exit_code
 
-        if OPEN_FILE_MANAGER:
-            # Open file manager
-            try:
-                subprocess.run(["xdg-open", path_project], check=True)
-                logger.info("Opened file manager for:  %s", path_project)
-            except subprocess.SubprocessError as e:
-                logger.error("Failed to open file manager:  %s", e)
-                return 1
-
-        # Close calling terminal if requested
-        if not self.keep_terminal:
+    def _record(self, project_names: Iterable[str]) -> None:
+        history = frecency.History(HISTORY_PATH)
+        for project_name in project_names:
             try:
-                os.kill(os.getppid(), signal.SIGHUP)
-                logger.info("Closed parent terminal")
+                history.record(project_name)
             except OSError as e:
-                logger.error("Failed to close parent terminal:  %s", e)
+                logger.error("Failed to record the opened project:  %s", e)
 
-        return 0
+    def _close_terminal(self) -> None:
+        try:
+            logger.info("Closing parent terminal")
+            # the hang up may kill this process too, before the queued
+            # records get written
+            flush_logs()
+            os.kill(self.parent_pid, signal.SIGHUP)
+        except OSError as e:
+            logger.error("Failed to close parent terminal:  %s", e)
+
+    def _launches(self, project_names: Iterable[str]) -> list[Launch]:
+        # every VS Code launch shares the same environment
+        env = cleaned_env(self.environ)
+        launches = []
+        for project_name in project_names:
+            path_project = self.paths[project_name]
+            if self.relative_path:
+                path_project = Path(path_project, self.relative_path)
+            launches.append(
+                Launch(
+                    project_name,
+                    f"VS Code for:  {path_project}",
+                    ["code", str(path_project)],
+                    env,
+                )
+            )
+            if OPEN_FILE_MANAGER:
+                launches.append(
+                    Launch(
+                        project_name,
+                        f"file manager for:  {path_project}",
+                        ["xdg-open", str(path_project)],
+                        self.environ,
+                    )
+                )
+        return launches
+
+    @functools.cached_property
+    def ranking(self) -> frecency.Ranking:
+        try:
+            return frecency.History(HISTORY_PATH).ranking()
+        except OSError as e:
+            logger.error("Failed to read the opened projects:  %s", e)
+            return frecency.Ranking({})
+
+    def _resolve(self, project_name: str) -> str | None:
+        """The project named project_name, or else the most opened project
+        whose name starts with it, or else the most opened project whose name
+        is at most max_typos typos away from it. With the subsequence
+        algorithm, the most opened project containing its chars in order, if
+        it's also within max_typos or clearly the best match"""
+        if project_name in self.paths:
+            return project_name
+
+        for name in self.ranking.starting_with(project_name):
+            if name in self.paths:
+                return name
+
+        try:
+            similar = self._similar(
+                project_name, max_typos(project_name), len(self.paths)
+            )
+        # pylint: disable-next=broad-exception-caught
+        except Exception:  # noqa: BLE001 — reported with the suggestions
+            return None
+        opened = [match for match in similar if self.ranking.visits(match.word)]
+        if opened and self._is_clear_match(project_name, opened[0], similar):
+            return opened[0].word
+        return None
+
+    @staticmethod
+    def _is_clear_match(
+        project_name: str,
+        match: "WordDistance | WordScore",
+        similar: Sequence["WordDistance | WordScore"],
+    ) -> bool:
+        """Whether match can be opened without asking. Edit distance matches
+        are within max_typos, subsequence ones must be within it too, or score
+        SUBSEQUENCE_LEAD above every other name containing the chars"""
+        score = getattr(match, "score", None)
+        if score is None:
+            return True
+        runner_up = max(
+            (getattr(other, "score", 0) for other in similar if other is not match),
+            default=None,
+        )
+        if runner_up is None or score >= runner_up + SUBSEQUENCE_LEAD:
+            return True
+
+        # Only imported when needed, to keep startup fast
+        from utils import sfm  # pylint: disable=import-outside-toplevel
+
+        typos = max_typos(project_name)
+        distance = sfm.sfm.damerau_levenshtein_distance(project_name, match.word, typos)
+        return distance <= typos
+
+    def _similar(
+        self,
+        project_name: str,
+        max_distance: int | None,
+        num_results: int,
+        subsequence: bool | None = None,
+    ) -> Sequence["WordDistance | WordScore"]:
+        """Names similar to project_name, the most opened first among names at
+        a similar distance. With the subsequence algorithm (SFM_ALGORITHM, or
+        subsequence=True), names containing the chars of project_name in order
+        instead, regardless of max_distance"""
+        # Only imported when needed, to keep startup fast
+        from utils import sfm  # pylint: disable=import-outside-toplevel
+
+        now = time.time()
+        if subsequence is None:
+            subsequence = sfm.algorithm() == sfm.SUBSEQUENCE
+        if subsequence:
+            return sorted(
+                sfm.sfm.find_best_subsequence_matches(
+                    project_name, list(self.paths), num_results
+                ),
+                key=lambda match: (-match.score, -self.ranking.visits(match.word, now)),
+            )
+
+        index = (self.load_index or self._load_persisted_index)()
+        return sorted(
+            index.search(project_name, max_distance, num_results),
+            key=lambda match: match.distance * TYPO_COST
+            - math.log2(1 + self.ranking.visits(match.word, now)),
+        )
 
-    def _handle_not_found(self) -> int:
+    def _handle_not_found(self, project_name: str) -> int:
         """Handle case when project name is not found"""
-        msg = f"There's no project registered for the name: {self.project_name}\n"
+        msg = f"There's no project registered for the name: {project_name}\n"
         msg += "Maybe you meant:"
         print(msg)
 
         # Show fuzzy matched projects
-        similar = []
+        similar: Sequence[WordDistance | WordScore] = []
         try:
-            similar = sfm.find_most_similar_words(  # type: ignore[attr-defined]
-                self.project_name,
-                list(self.paths.keys()),
-                3,
-            )
+            similar = self._similar(
+                project_name, SIMILARITY_THRESHOLD - 1, len(self.paths)
+            )[:3]
+            # If there's no name good enough (above the threshold)
+            if not similar:
+                # Just show the most similar
+                similar = self._similar(project_name, None, 1, subsequence=False)
         # pylint: disable-next=broad-exception-caught
         except Exception as e:  # noqa: BLE001 — best-effort, must not crash
             logger.error("Error during fuzzy matching:  %s", e)
             print("Error finding similar project names")
 
-        recommendations = [
-            match for match in similar if match.distance < SIMILARITY_THRESHOLD
-        ]
-
-        # If there's no name good enough (above the threshold)
-        if not recommendations:
-            # Just show the most similar
-            print(f"\t* {similar[0].word}")
-        else:
-            for match in recommendations:
-                print(f"\t* {match.word}")
+        for match in similar:
+            print(f"\t* {match.word}")
 
-        logger.debug("Project not found: %s, suggestions provided", self.project_name)
+        logger.debug("Project not found: %s, suggestions provided", project_name)
 
         return 1
 
+    def _load_persisted_index(self) -> "BKTree":
+        # Only imported when needed, to keep startup fast
+        from utils import word_index  # pylint: disable=import-outside-toplevel
+
+        return word_index.load_or_build(INDEX_PATH, self.paths.keys())
+
+
+class PickProjectCommand:
+    def __init__(
+        self,
+        query: str,
+        paths: Mapping[str, Path],
+        relative_path: str | None = None,
+        keep_terminal: bool = False,
+    ):
+        self.query = query
+        self.paths = paths
+        self.opener = OpenProjectCommand([], paths, relative_path, keep_terminal)
+
+    def execute(self) -> int:
+        # Only imported when needed, to keep startup fast
+        # pylint: disable-next=import-outside-toplevel
+        from utils import picker, string_fuzzy_matcher
+
+        # the most opened first among names at the same distance
+        now = time.time()
+        names = sorted(
+            self.paths, key=lambda name: -self.opener.ranking.visits(name, now)
+        )
+        # the picker keeps the search state between keystrokes, which only
+        # the Python matcher exposes
+        corpus = string_fuzzy_matcher.Corpus(names)
+        try:
+            search = corpus.prefix_search(SIMILARITY_THRESHOLD - 1)
+        except ImportError as e:
+            logger.error("%s", e)
+            return 1
+        name = picker.pick(search, self.query)
+        if name is None:
+            return 1
+        self.opener.project_names = [name]
+        return self.opener.execute()
+
+
+class Daemon:
+    """Runs the list and open commands sent by clients, keeping the mapping and
+    the index of its names in memory. Both are reloaded when the mapping file
+    is replaced or modified"""
+
+    def __init__(self, paths_dir: str):
+        self.paths_dir = paths_dir
+        self._source: tuple[int, int, int] | None = None
+        self._paths: Mapping[str, Path] = {}
+        self._index: BKTree | None = None
+
+    def paths(self) -> Mapping[str, Path]:
+        stat = os.stat(self.paths_dir)
+        # edits replace the file, so its inode changes even within an mtime tick
+        source = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if source != self._source:
+            self._paths = configreader.read_mapping_file(self.paths_dir)
+            self._index = None
+            self._source = source
+            logger.debug("Loaded projects from:  %s", self.paths_dir)
+        return self._paths
+
+    def invalidate(self) -> None:
+        """Forces a reload on the next request"""
+        self._source = None
+
+    def index(self) -> "BKTree":
+        if self._index is None:
+            # Only imported when needed, to keep startup fast
+            from utils import word_index  # pylint: disable=import-outside-toplevel
+
+            self._index = word_index.load_or_build(INDEX_PATH, self._paths.keys())
+        return self._index
+
+    def create_command(self, request: dict[str, Any]) -> Command:
+        if request.get("project_names"):
+            return OpenProjectCommand(
+                request["project_names"],
+                self.paths(),
+                request.get("relative_path"),
+                request.get("keep", False),
+                environ=launch_env(request["env"]) if "env" in request else None,
+                parent_pid=request.get("parent_pid"),
+                load_index=self.index,
+            )
+        return ListProjectsCommand(self.paths())
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Runs the command of a client request.
+        Args:
+            request (dict[str, Any]): the project_names, relative_path, keep,
+                env and parent_pid of the client, or list
+        Returns:
+            dict[str, Any]: what the command printed as output, and its exit_code
+        """
+        output = StringIO()
+        with redirect_stdout(output):
+            try:
+                exit_code = self.create_command(request).execute()
+            # pylint: disable-next=broad-exception-caught
+            except Exception as e:
+                logger.exception("Unhandled exception")
+                print(f"An error occurred: {e}")
+                exit_code = 1
+        return {"output": output.getvalue(), "exit_code": exit_code}
+
+    def serve(self, socket_path: str) -> int:
+        # Only imported when needed, to keep startup fast
+        from utils import daemon  # pylint: disable=import-outside-toplevel
+
+        # a closed terminal would otherwise stop the daemon, reload instead
+        signal.signal(signal.SIGHUP, lambda *_: self.invalidate())
+        # exit through the server cleanup, which removes the socket
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        with daemon.Server(socket_path, self.handle) as server:
+            logger.info("Serving on:  %s", socket_path)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+
+def forward_to_daemon(args: Namespace, socket_path: str) -> int | None:
+    """Runs the command on the daemon listening on socket_path.
+    Returns:
+        int | None: the exit code of the command, or None if no daemon is
+            running and the command has to be run by this process
+    """
+    if (
+        args.debug
+        or args.add_entry
+        or args.interactive
+        or not (args.project_name or args.list)
+    ):
+        return None
+    # a running daemon always has its socket in place
+    if not os.path.exists(socket_path):
+        return None
+
+    # Only imported when needed, to keep startup fast
+    from utils import daemon  # pylint: disable=import-outside-toplevel
+
+    request = {
+        "list": args.list,
+        "env": launch_env(os.environ),
+        "parent_pid": os.getppid(),
+    }
+    if args.project_name:
+        request |= {
+            "project_names": args.project_name,
+            "relative_path": args.relative_path,
+            "keep": args.keep,
+        }
+    try:
+        response = daemon.request(socket_path, request)
+    except PermissionError as e:
+        logger.error("Not forwarding to the daemon:  %s", e)
+        return None
+    if response is None:
+        return None
+    print(response["output"], end="")
+    return response["exit_code"]
+
 
 class CommandFactory:
     @staticmethod
     def create_command(
         parser: ArgumentParser,
-        paths: dict[str, Path],
         paths_dir: str,
+        args: Namespace | None = None,
     ) -> Command:
-        args = parser.parse_args()
+        if args is None:
+            args = parser.parse_args()
 
         if args.debug:
             logger.setLevel(DEBUG)
 
+        # The mapping is only parsed by the commands that use it
+        if args.interactive:
+            return PickProjectCommand(
+                " ".join(args.project_name),
+                configreader.read_mapping_file(paths_dir),
+                args.relative_path,
+                args.keep,
+            )
+
         if args.project_name:
             return OpenProjectCommand(
                 args.project_name,
-                paths,
+                configreader.read_mapping_file(paths_dir),
                 args.relative_path,
                 args.keep,
             )
 
         if args.list:
-            return ListProjectsCommand(paths)
+            return ListProjectsCommand(configreader.read_mapping_file(paths_dir))
 
         if args.add_entry:
             key, abs_path = args.add_entry
-            return AddProjectCommand(key, abs_path, paths, paths_dir)
+            return AddProjectCommand(key, abs_path, paths_dir)
+
+        if args.completions:
+            return WriteCompletionsCommand(paths_dir)
 
         return HelpCommand(parser)
 
 
 def configure_cli_args():
     parser = ArgumentParser(description="Open Project Manager")
-    parser.add_argument("project_name", nargs="?", help="Name of the project to open")
+    parser.add_argument(
+        "project_name",
+        nargs="*",
+        help="Names of the projects to open",
+    )
     parser.add_argument(
         "--debug",
         "-d",
@@ -238,15 +685,42 @@ def configure_cli_args():
         action="store_true",
         help="Keep the terminal open after executing",
     )
+    parser.add_argument(
+        "--interactive",
+        "-i",
+        action="store_true",
+        help="Pick the project from a list narrowed down as you type, "
+        "starting from the given name",
+    )
+    parser.add_argument(
+        "--completions",
+        action="store_true",
+        help="Write the project names cache read by the shell completion, "
+        "kept up to date afterwards",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a daemon that keeps the projects loaded for later calls",
+    )
     return parser
 
 
 def main():
     try:
-        paths = configreader.read_mapping_file(PATHS_DIR)
         parser = configure_cli_args()
+        args = parser.parse_args()
+
+        if args.serve:
+            if args.debug:
+                logger.setLevel(DEBUG)
+            return Daemon(PATHS_DIR).serve(SOCKET_PATH)
+
+        exit_code = forward_to_daemon(args, SOCKET_PATH)
+        if exit_code is not None:
+            return exit_code
 
-        command = CommandFactory.create_command(parser, paths, PATHS_DIR)
+        command = CommandFactory.create_command(parser, PATHS_DIR, args)
         exit_code = command.execute()
 
         return exit_code
@@ -4,8 +4,14 @@ Organize Files and Folders
 This script provides a set of command-line functions for interacting with files
 and directories in the current working directory. Users can perform operations
 such as moving, listing, showing, and removing files based on provided
-substrings. The toolbox also supports changing the current working directory
-and displaying help documentation for each command.
+substrings, shell globs or regular expressions, optionally searching the
+subdirectories too, and finding the duplicated files among them. A watch
+mode applies move and remove rules to the files arriving in the directory.
+Moves and removals are planned first, so they can be previewed with
+dry_run=True, then run concurrently and journaled, so an interrupted run can
+be resumed or rolled back. The toolbox also supports
+changing the current working directory and displaying help documentation for
+each command.
 
 Usage:
     python file_toolbox.py
@@ -17,18 +23,48 @@ Author:
 import code
 import functools
 import os
-from collections.abc import Callable
+from collections.abc import Callable, Sequence
 
+from utils import bulkops, fswalk, inotify
+from utils.dupes import find_duplicates
 from utils.logger import get_logger
 
 logger = get_logger()
 
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), ".env.journal")
 
-def str_matcher_iterator(substr: str, case_sensitive: bool):
-    transform = (lambda x: x) if case_sensitive else (lambda x: x.lower())
-    for name in os.listdir("./"):
-        if transform(substr) in transform(name):
-            yield name
+
+def free_journal_path() -> str:
+    """JOURNAL_PATH, or the first of JOURNAL_PATH.1, JOURNAL_PATH.2... not
+    kept by a failed run, for runs that must not wait for it to be resumed"""
+    path = JOURNAL_PATH
+    number = 0
+    while os.path.exists(path):
+        number += 1
+        path = f"{JOURNAL_PATH}.{number}"
+    return path
+
+
+# pylint: disable-next=too-many-arguments
+def str_matcher_iterator(
+    substr: str,
+    case_sensitive: bool,
+    *,
+    syntax: str = "substring",
+    recursive: bool = False,
+    max_depth: int | None = None,
+    exclude: Sequence[str] = (),
+):
+    """Lazily yields the paths, relative to the current directory, of the
+    entries whose name matches substr (see fswalk.compile_pattern)"""
+    matches = fswalk.compile_pattern(substr, syntax, case_sensitive)
+    yield from fswalk.walk(
+        ".",
+        matches,
+        recursive=recursive,
+        max_depth=max_depth,
+        exclude=exclude,
+    )
 
 
 def foreach(
@@ -36,28 +72,218 @@ def foreach(
     substr: str,
     case_sensitive: bool = False,
     debug: bool = True,
+    **walk_options,
 ):
-    for file in str_matcher_iterator(substr, case_sensitive):
+    """Performs action over every entry matching substr, as soon as it's found.
+    walk_options are the syntax of substr ("substring", "glob" or "regex"),
+    recursive, max_depth and exclude globs, see fswalk.walk
+    Example: foreach(print, "*.pdf", syntax="glob", recursive=True)
+    """
+    for file in str_matcher_iterator(substr, case_sensitive, **walk_options):
         if debug:
             print(f"{action.__name__} performed over {file}")
         action(file)
 
 
-def move(dst: str, *args, **kwargs):
-    """Move files that match the substr to the (absolute) destination
+def run_plan(
+    plan: bulkops.Plan,
+    dry_run: bool = False,
+    debug: bool = True,
+    journal_path: str | None = None,
+):
+    """Prints the plan when dry_run, otherwise runs it, journaled at
+    journal_path (JOURNAL_PATH by default), and reports the failures"""
+    if dry_run or plan.conflicts:
+        print(plan)
+        if not dry_run:
+            print("Nothing done, solve the conflicts first")
+        return plan
+    if plan:
+        journal_path = journal_path or JOURNAL_PATH
+        report_run(bulkops.run(plan, journal_path), debug, journal_path)
+    return None
+
+
+def report_run(
+    report: bulkops.Report, debug: bool = True, journal_path: str | None = None
+):
+    for operation, error in report.failed:
+        print(f"Failed to {operation}: {error}")
+    for operation, error in report.lost:
+        print(f"Can't undo {operation}: {error}")
+    if debug:
+        print(f"{report.done} done, {len(report.failed)} failed")
+    if report.failed:
+        journal = "" if journal_path in (None, JOURNAL_PATH) else repr(journal_path)
+        print(
+            f"Call resume({journal}) to retry the failed operations, "
+            f"or rollback({journal})"
+        )
+
+
+def move(
+    dst: str,
+    substr: str,
+    case_sensitive: bool = False,
+    debug: bool = True,
+    dry_run: bool = False,
+    **walk_options,
+):
+    """Move files that match the substr to the (absolute) destination, files
+    found in subdirectories are moved right into it. With dry_run=True, only
+    shows the moves. Takes the options of foreach
     Example: move("/home/user/Downloads", substr="pdf")
     """
+    paths = str_matcher_iterator(substr, case_sensitive, **walk_options)
+    return run_plan(bulkops.plan_move(paths, dst), dry_run, debug)
+
+
+def remove(
+    substr: str,
+    case_sensitive: bool = False,
+    debug: bool = True,
+    dry_run: bool = False,
+    **walk_options,
+):
+    """Remove files that has the substr. With dry_run=True, only shows the
+    removals. Takes the options of foreach"""
+    paths = str_matcher_iterator(substr, case_sensitive, **walk_options)
+    return run_plan(bulkops.plan_remove(paths), dry_run, debug)
+
+
+# pylint: disable-next=too-many-arguments
+def dupes(
+    substr: str = "",
+    case_sensitive: bool = False,
+    debug: bool = True,
+    *,
+    remove_copies: bool = False,
+    move_copies_to: str | None = None,
+    dry_run: bool = False,
+    **walk_options,
+):
+    """Show the files that match the substr with the same contents, the
+    oldest file of each group first. The other copies can be removed with
+    remove_copies=True or moved to the (absolute) move_copies_to, as move and
+    remove do, copies whose name is taken there are numbered as "name (1).ext".
+    Takes the options of foreach
+    Example: dupes("*.jpg", syntax="glob", recursive=True, remove_copies=True)
+    """
+    paths = str_matcher_iterator(substr, case_sensitive, **walk_options)
+    groups = find_duplicates(paths)
+    for original, *others in groups:
+        print(original)
+        for other in others:
+            print(f"\t{other}")
+
+    copies = [copy for group in groups for copy in group[1:]]
+    if move_copies_to is not None:
+        # copies usually share their name
+        plan = bulkops.plan_move(copies, move_copies_to, rename_taken=True)
+        return run_plan(plan, dry_run, debug)
+    if remove_copies:
+        return run_plan(bulkops.plan_remove(copies), dry_run, debug)
+    return None
+
+
+# (pattern, "remove") or (pattern, "move", destination)
+Rule = tuple[str, ...]
+CompiledRule = tuple[fswalk.NameMatcher, Callable[[list[str]], bulkops.Plan]]
+
+
+def compile_rules(
+    rules: Sequence[Rule], syntax: str, case_sensitive: bool
+) -> list[CompiledRule]:
+    """Pairs the matcher of each rule pattern with its planning function"""
+    compiled: list[CompiledRule] = []
+    for pattern, action, *destination in rules:
+        plan: Callable[[list[str]], bulkops.Plan]
+        if action == "move" and len(destination) == 1:
+            plan = functools.partial(bulkops.plan_move, destination=destination[0])
+        elif action == "remove" and not destination:
+            plan = bulkops.plan_remove
+        else:
+            raise ValueError(f"Invalid rule {(pattern, action, *destination)}")
+        compiled.append((fswalk.compile_pattern(pattern, syntax, case_sensitive), plan))
+    return compiled
+
+
+def apply_rules(
+    rules: Sequence[CompiledRule], names: Sequence[str], debug: bool = True
+):
+    """Runs one bulk operation per rule over the names its pattern matches
+    first. Names in conflict are reported and left alone, the others are
+    handled anyway"""
+    matched: list[list[str]] = [[] for _ in rules]
+    for name in names:
+        for (matches, _), rule_names in zip(rules, matched):
+            if matches(name):
+                rule_names.append(name)
+                break
+    for (_, plan_rule), rule_names in zip(rules, matched):
+        if not rule_names:
+            continue
+        plan = plan_rule(rule_names)
+        # the names left out won't be seen again, so the rest still run
+        for conflict in plan.conflicts:
+            print(f"Skipped, {conflict}")
+        # a failed run keeps its journal, which mustn't stop the next ones
+        run_plan(
+            bulkops.Plan(plan.operations, []),
+            debug=debug,
+            journal_path=free_journal_path(),
+        )
+
+
+# pylint: disable-next=too-many-arguments
+def watch(
+    rules: Sequence[Rule],
+    case_sensitive: bool = False,
+    debug: bool = True,
+    *,
+    syntax: str = "glob",
+    existing: bool = True,
+    debounce: float = 1.0,
+    max_delay: float = 10.0,
+):
+    """Apply the rules to the files completed in the current directory, until
+    interrupted with Ctrl+C. A rule is (pattern, "remove") or (pattern,
+    "move", destination), the first rule matching a name applies. Files are
+    handled in batches once none arrived for debounce seconds, or max_delay
+    seconds after the first one, one bulk operation per rule. With
+    existing=True, the files already there are handled first. Linux only
+    Example: watch([("*.pdf", "move", "/home/user/pdfs"), ("*.part", "remove")])
+    """
+    compiled = compile_rules(rules, syntax, case_sensitive)
+    if existing:
+        with os.scandir(".") as entries:
+            files = [
+                entry.name for entry in entries if entry.is_file(follow_symlinks=False)
+            ]
+        apply_rules(compiled, files, debug)
+    try:
+        for names in inotify.batches(".", debounce, max_delay):
+            apply_rules(compiled, names, debug)
+    except KeyboardInterrupt:
+        pass
+
+
+def resume(journal_path: str | None = None):
+    """Resume the interrupted or failed move or remove, journaled at
+    JOURNAL_PATH unless watch reported another journal_path"""
+    journal_path = journal_path or JOURNAL_PATH
+    report_run(bulkops.resume(journal_path), journal_path=journal_path)
 
-    def move_action(name):
-        os.rename(name, dst=f"{dst}/{name}")
 
-    foreach(move_action, *args, **kwargs)
+def rollback(journal_path: str | None = None):
+    """Move back the files of the interrupted or failed move, journaled at
+    JOURNAL_PATH unless watch reported another journal_path"""
+    journal_path = journal_path or JOURNAL_PATH
+    report_run(bulkops.rollback(journal_path), journal_path=journal_path)
 
 
 show = functools.partial(foreach, print, debug=False)
-show.__doc__ = "Show files that has the substr"
-remove = functools.partial(foreach, os.remove)
-remove.__doc__ = "Remove files that has the substr"
+show.__doc__ = "Show files that has the substr, takes the options of foreach"
 
 ls = functools.partial(show, substr="")
 cd = os.chdir
@@ -66,7 +292,9 @@ cd = os.chdir
 # pylint: disable=W0622
 def help(specific_command: str = ""):
     if specific_command == "":
-        print("Available commands: move, show, remove, ls, cd, help")
+        print(
+            "Available commands: move, show, remove, dupes, watch, resume, rollback, ls, cd, help"
+        )
     else:
         print(f"Help for {specific_command}")
         print(globals()[specific_command].__doc__)
@@ -0,0 +1,108 @@
+//! Damerau-Levenshtein (optimal string alignment) distance kernel.
+
+/// Scratch memory for `osa_distance`, meant to be reused across a whole word
+/// list so that computing a distance doesn't allocate once it has grown to the
+/// longest word.
+#[derive(Default)]
+pub struct Workspace {
+    /// The last three rows of the matrix, laid out one after the other.
+    rows: Vec<usize>,
+}
+
+/// Damerau-Levenshtein (optimal string alignment) distance between two words,
+/// given as bytes when both are ASCII and as chars otherwise.
+///
+/// When `max_distance` is given only the cells within `max_distance` of the
+/// diagonal are computed, and the computation is abandoned as soon as a whole
+/// row exceeds it, returning `max_distance + 1`.
+pub fn osa_distance<T: Copy + PartialEq>(
+    word1: &[T],
+    word2: &[T],
+    max_distance: Option<usize>,
+    workspace: &mut Workspace,
+) -> usize {
+    let word1_len = word1.len();
+    let word2_len = word2.len();
+
+    // No distance exceeds the longest length, which also keeps limit from overflowing
+    let longest = word1_len.max(word2_len);
+    let max_distance = max_distance.map_or(longest, |max| max.min(longest));
+    let limit = max_distance + 1;
+    if word1_len.abs_diff(word2_len) > max_distance {
+        return limit;
+    }
+
+    // Rows are used round-robin: row i lives at (i % 3) * width. Only the band
+    // is written, plus the cell on each side of it which hold the limit value
+    // (or the first column), so stale values from older rows are never read.
+    let width = word2_len + 2;
+    let rows = &mut workspace.rows;
+    if rows.len() < 3 * width {
+        rows.resize(3 * width, 0);
+    }
+
+    let first_row_end = word2_len.min(max_distance);
+    for j in 0..=first_row_end {
+        rows[j] = j;
+    }
+    rows[first_row_end + 1] = limit;
+
+    for i in 1..=word1_len {
+        let current = (i % 3) * width;
+        let previous = ((i - 1) % 3) * width;
+        let before_previous = ((i + 1) % 3) * width;
+
+        let band_start = i.saturating_sub(max_distance).max(1);
+        let band_end = word2_len.min(i + max_distance);
+
+        rows[current] = if i <= max_distance { i } else { limit };
+        if band_start > 1 {
+            rows[current + band_start - 1] = limit;
+        }
+        let mut row_min = rows[current];
+
+        let char1 = word1[i - 1];
+        for j in band_start..=band_end {
+            let char2 = word2[j - 1];
+            let cost = usize::from(char1 != char2);
+
+            let mut distance = std::cmp::min(
+                rows[previous + j] + 1,
+                std::cmp::min(rows[current + j - 1] + 1, rows[previous + j - 1] + cost),
+            );
+
+            if i > 1 && j > 1 && char1 == word2[j - 2] && word1[i - 2] == char2 {
+                distance = std::cmp::min(distance, rows[before_previous + j - 2] + cost);
+            }
+
+            let distance = std::cmp::min(distance, limit);
+            rows[current + j] = distance;
+            row_min = std::cmp::min(row_min, distance);
+        }
+        rows[current + band_end + 1] = limit;
+
+        // Every alignment goes through this row (a transposition skipping it
+        // costs at least one more than its previous row), so it bounds the result
+        if row_min > max_distance {
+            return limit;
+        }
+    }
+
+    rows[(word1_len % 3) * width + word2_len]
+}
+
+/// Same as `osa_distance`, for words that haven't been decoded yet.
+pub fn damerau_levenshtein(word1: &str, word2: &str, max_distance: Option<usize>) -> usize {
+    let mut workspace = Workspace::default();
+    if word1.is_ascii() && word2.is_ascii() {
+        return osa_distance(
+            word1.as_bytes(),
+            word2.as_bytes(),
+            max_distance,
+            &mut workspace,
+        );
+    }
+    let chars1: Vec<char> = word1.chars().collect();
+    let chars2: Vec<char> = word2.chars().collect();
+    osa_distance(&chars1, &chars2, max_distance, &mut workspace)
+}
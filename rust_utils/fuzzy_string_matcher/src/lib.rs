@@ -1,4 +1,21 @@
+mod distance;
+mod search;
+mod subsequence;
+
+use std::collections::HashMap;
+use std::sync::{Arc, Mutex, OnceLock, PoisonError};
+
+use pyo3::exceptions::{PyIndexError, PyValueError};
 use pyo3::prelude::*;
+use pyo3::types::{PyIterator, PyString};
+use rayon::{ThreadPool, ThreadPoolBuilder};
+
+use distance::damerau_levenshtein;
+use search::{EncodedWords, Query};
+
+/// Word lists shorter than this are scanned on the calling thread, since
+/// splitting them across cores costs more than it saves.
+const DEFAULT_PARALLEL_THRESHOLD: usize = 4096;
 
 /// Represents a word and its distance from a target word.
 ///
@@ -65,83 +82,493 @@ impl WordDistance {
     }
 }
 
+/// Represents a word and its subsequence match score, the higher the better.
+///
+/// It can be unpacked in Python like a tuple.
+///
+/// Attributes:
+///     word (str): The word containing the query
+///     score (int): The subsequence score of the query in the word
+#[pyclass(from_py_object)]
+#[derive(Clone)]
+pub struct WordScore {
+    #[pyo3(get)]
+    pub word: String,
+    #[pyo3(get)]
+    pub score: i64,
+}
 
-fn damerau_levenshtein(word1: &str, word2: &str) -> usize {
-    let word1_len = word1.chars().count();
-    let word2_len = word2.chars().count();
+#[pymethods]
+impl WordScore {
+    fn __iter__<'py>(slf: PyRef<'py, Self>) -> PyResult<Bound<'py, PyIterator>> {
+        (slf.word.clone(), slf.score)
+            .into_pyobject(slf.py())?
+            .try_iter()
+    }
+}
 
-    let mut matrix = vec![vec![0; word2_len + 1]; word1_len + 1];
+/// Thread pool with `num_threads` workers, built on first use and then reused.
+fn thread_pool(num_threads: usize) -> PyResult<Arc<ThreadPool>> {
+    static POOLS: OnceLock<Mutex<HashMap<usize, Arc<ThreadPool>>>> = OnceLock::new();
 
-    for i in 0..=word1_len {
-        matrix[i][0] = i;
-    }
-    for j in 0..=word2_len {
-        matrix[0][j] = j;
+    let mut pools = POOLS
+        .get_or_init(Default::default)
+        .lock()
+        .unwrap_or_else(PoisonError::into_inner);
+    if let Some(pool) = pools.get(&num_threads) {
+        return Ok(Arc::clone(pool));
     }
 
-    for (i, char1) in word1.chars().enumerate() {
-        for (j, char2) in word2.chars().enumerate() {
-            let cost = if char1 == char2 { 0 } else { 1 };
-
-            matrix[i + 1][j + 1] = std::cmp::min(
-                matrix[i][j + 1] + 1,
-                std::cmp::min(matrix[i + 1][j] + 1, matrix[i][j] + cost),
-            );
-
-            if i > 0
-                && j > 0
-                && char1 == word2.chars().nth(j - 1).unwrap()
-                && char2 == word1.chars().nth(i - 1).unwrap()
-            {
-                matrix[i + 1][j + 1] =
-                    std::cmp::min(matrix[i + 1][j + 1], matrix[i - 1][j - 1] + cost);
+    let pool = ThreadPoolBuilder::new()
+        .num_threads(num_threads)
+        .thread_name(|index| format!("fuzzy-string-matcher-{index}"))
+        .build()
+        .map(Arc::new)
+        .map_err(|err| PyValueError::new_err(err.to_string()))?;
+    pools.insert(num_threads, Arc::clone(&pool));
+    Ok(pool)
+}
+
+/// Searches `words` without holding the GIL, splitting the scan across cores
+/// when there are at least `parallel_threshold` words.
+///
+/// Returns `(distance, index)` pairs sorted by distance, ties in index order.
+fn search_detached(
+    py: Python<'_>,
+    words: &EncodedWords,
+    obj_word: &str,
+    num_results: usize,
+    max_distance: Option<usize>,
+    num_threads: Option<usize>,
+    parallel_threshold: usize,
+) -> PyResult<Vec<(usize, usize)>> {
+    let parallel = words.len() >= parallel_threshold && num_threads != Some(1);
+    let pool = match num_threads {
+        Some(num_threads) if parallel => Some(thread_pool(num_threads)?),
+        _ => None,
+    };
+
+    Ok(py.detach(|| {
+        let query = Query::new(obj_word);
+        if !parallel {
+            words.top_k(&query, num_results, max_distance)
+        } else if let Some(pool) = pool {
+            pool.install(|| words.par_top_k(&query, num_results, max_distance))
+        } else {
+            words.par_top_k(&query, num_results, max_distance)
+        }
+    }))
+}
+
+/// Searches `words` for every query in a single call without holding the
+/// GIL, spreading the queries across cores when the query × word grid has at
+/// least `parallel_threshold` cells.
+///
+/// Returns `(distance, index)` pairs per query, like `search_detached`.
+fn search_batch_detached(
+    py: Python<'_>,
+    words: &EncodedWords,
+    obj_words: &[String],
+    num_results: usize,
+    max_distance: Option<usize>,
+    num_threads: Option<usize>,
+    parallel_threshold: usize,
+) -> PyResult<Vec<Vec<(usize, usize)>>> {
+    let parallel = obj_words.len() > 1
+        && obj_words.len().saturating_mul(words.len()) >= parallel_threshold
+        && num_threads != Some(1);
+    let pool = match num_threads {
+        Some(num_threads) if parallel => Some(thread_pool(num_threads)?),
+        _ => None,
+    };
+
+    Ok(py.detach(|| {
+        let queries: Vec<Query> = obj_words.iter().map(|word| Query::new(word)).collect();
+        match pool {
+            Some(pool) => {
+                pool.install(|| words.batch_top_k(&queries, num_results, max_distance, true))
             }
+            None => words.batch_top_k(&queries, num_results, max_distance, parallel),
         }
+    }))
+}
+
+/// A list of words decoded once, to be searched repeatedly.
+///
+/// Every word is converted up front into a single compact buffer, so a search
+/// only converts the query and doesn't marshal the word list again. Searches
+/// run without holding the GIL and only build Python objects for the results.
+///
+/// Args:
+///     words (list[str]): Words to search through
+///     num_threads (int | None): Number of worker threads for parallel scans.
+///         Defaults to None, meaning the global rayon pool.
+///     parallel_threshold (int): Minimum number of words to scan in parallel.
+///         Defaults to 4096.
+///
+/// Examples:
+///     >>> corpus = Corpus(["helo", "world", "help"])
+///     >>> corpus.search("hello", 2)
+///     [WordDistance(word="helo", distance=1), WordDistance(word="help", distance=2)]
+///     >>> corpus.search_indices("hello", 2)
+///     [(0, 1), (2, 2)]
+#[pyclass(frozen)]
+pub struct Corpus {
+    words: Vec<Py<PyString>>,
+    encoded: EncodedWords,
+    num_threads: Option<usize>,
+    parallel_threshold: usize,
+}
+
+#[pymethods]
+impl Corpus {
+    #[new]
+    #[pyo3(signature = (words, *, num_threads=None, parallel_threshold=DEFAULT_PARALLEL_THRESHOLD))]
+    fn new(
+        words: Vec<Bound<'_, PyString>>,
+        num_threads: Option<usize>,
+        parallel_threshold: usize,
+    ) -> PyResult<Self> {
+        let texts = words
+            .iter()
+            .map(|word| word.to_str())
+            .collect::<PyResult<Vec<&str>>>()?;
+        let encoded = EncodedWords::new(&texts);
+        Ok(Self {
+            words: words.into_iter().map(Bound::unbind).collect(),
+            encoded,
+            num_threads,
+            parallel_threshold,
+        })
+    }
+
+    fn __len__(&self) -> usize {
+        self.words.len()
+    }
+
+    fn __getitem__(&self, py: Python<'_>, index: usize) -> PyResult<Py<PyString>> {
+        self.words
+            .get(index)
+            .map(|word| word.clone_ref(py))
+            .ok_or_else(|| PyIndexError::new_err("corpus index out of range"))
     }
 
-    matrix[word1_len][word2_len]
+    /// Find the words closest to obj_word.
+    ///
+    /// Args:
+    ///     obj_word (str): The target word to match against
+    ///     num_results (int): Maximum number of results to return. Defaults to 10.
+    ///     max_distance (int | None): Discard words farther than this distance.
+    ///         Defaults to None, meaning no limit.
+    ///
+    /// Returns:
+    ///     list[WordDistance]: WordDistance objects sorted by distance, ties in corpus order
+    #[pyo3(signature = (obj_word, num_results=10, max_distance=None))]
+    fn search(
+        &self,
+        py: Python<'_>,
+        obj_word: &str,
+        num_results: usize,
+        max_distance: Option<usize>,
+    ) -> PyResult<Vec<WordDistance>> {
+        self.search_indices(py, obj_word, num_results, max_distance)?
+            .into_iter()
+            .map(|(index, distance)| {
+                Ok(WordDistance {
+                    word: self.words[index].bind(py).to_str()?.to_owned(),
+                    distance,
+                })
+            })
+            .collect()
+    }
+
+    /// Same as search, but returns corpus indices instead of words.
+    ///
+    /// Returns:
+    ///     list[tuple[int, int]]: (index, distance) pairs sorted by distance, ties in corpus order
+    #[pyo3(signature = (obj_word, num_results=10, max_distance=None))]
+    fn search_indices(
+        &self,
+        py: Python<'_>,
+        obj_word: &str,
+        num_results: usize,
+        max_distance: Option<usize>,
+    ) -> PyResult<Vec<(usize, usize)>> {
+        let best = search_detached(
+            py,
+            &self.encoded,
+            obj_word,
+            num_results,
+            max_distance,
+            self.num_threads,
+            self.parallel_threshold,
+        )?;
+        Ok(best
+            .into_iter()
+            .map(|(distance, index)| (index, distance))
+            .collect())
+    }
+
+    /// Find the words closest to each of obj_words, all the searches running
+    /// in one call without holding the GIL.
+    ///
+    /// Returns:
+    ///     list[list[WordDistance]]: the search results of every word of obj_words, in order
+    #[pyo3(signature = (obj_words, num_results=10, max_distance=None))]
+    fn search_batch(
+        &self,
+        py: Python<'_>,
+        obj_words: Vec<String>,
+        num_results: usize,
+        max_distance: Option<usize>,
+    ) -> PyResult<Vec<Vec<WordDistance>>> {
+        let results = search_batch_detached(
+            py,
+            &self.encoded,
+            &obj_words,
+            num_results,
+            max_distance,
+            self.num_threads,
+            self.parallel_threshold,
+        )?;
+        results
+            .into_iter()
+            .map(|best| {
+                best.into_iter()
+                    .map(|(distance, index)| {
+                        Ok(WordDistance {
+                            word: self.words[index].bind(py).to_str()?.to_owned(),
+                            distance,
+                        })
+                    })
+                    .collect()
+            })
+            .collect()
+    }
+
+    /// Same as find_best_subsequence_matches over the corpus, the char masks
+    /// of the words being computed once when the corpus is built.
+    ///
+    /// Returns:
+    ///     list[WordScore]: WordScore objects sorted by score, ties shortest first then in corpus order
+    #[pyo3(signature = (query, num_results=10))]
+    fn subsequence_search(
+        &self,
+        py: Python<'_>,
+        query: &str,
+        num_results: usize,
+    ) -> PyResult<Vec<WordScore>> {
+        py.detach(|| self.encoded.subsequence_top_k(query, num_results))
+            .into_iter()
+            .map(|(score, index)| {
+                Ok(WordScore {
+                    word: self.words[index].bind(py).to_str()?.to_owned(),
+                    score,
+                })
+            })
+            .collect()
+    }
+}
+
+/// Calculate the Damerau-Levenshtein (optimal string alignment) distance between two words.
+///
+/// Args:
+///     str1 (str): The first word
+///     str2 (str): The second word
+///     max_distance (int | None): Stop computing once the distance is known to
+///         exceed this value. Defaults to None, meaning no limit.
+///
+/// Returns:
+///     int: The number of insertions, deletions, substitutions and adjacent
+///     transpositions needed to turn str1 into str2, or max_distance + 1 if it
+///     exceeds max_distance
+///
+/// Examples:
+///     >>> damerau_levenshtein_distance("hello", "hlelo")
+///     1
+#[pyfunction]
+#[pyo3(signature = (str1, str2, max_distance=None))]
+fn damerau_levenshtein_distance(str1: &str, str2: &str, max_distance: Option<usize>) -> usize {
+    damerau_levenshtein(str1, str2, max_distance)
 }
 
 /// Find the most similar words to a target word using Damerau-Levenshtein distance.
 ///
 /// This function calculates the Damerau-Levenshtein edit distance between the target
 /// word and each word in the provided list, then returns the N most similar matches
-/// sorted by distance (lowest distance first).
+/// sorted by distance (lowest distance first, ties in list order).
+///
+/// The scan runs without holding the GIL, so other Python threads keep running
+/// meanwhile, and word lists of at least `parallel_threshold` words are split
+/// across cores.
 ///
 /// Args:
 ///     obj_word (str): The target word to match against
 ///     word_list (list[str]): List of words to search through
 ///     num_results (int): Maximum number of results to return
+///     max_distance (int | None): Discard words farther than this distance.
+///         Defaults to None, meaning no limit.
+///     num_threads (int | None): Number of worker threads for parallel scans.
+///         Defaults to None, meaning the global rayon pool (one thread per core,
+///         or RAYON_NUM_THREADS).
+///     parallel_threshold (int): Minimum word list length to scan in parallel.
+///         Defaults to 4096.
 ///
 /// Returns:
 ///     list[WordDistance]: List of WordDistance objects sorted by similarity (closest matches first)
 ///
+/// Raises:
+///     ValueError: If the thread pool can't be built
+///
 /// Examples:
 ///     >>> find_most_similar_words("hello", ["helo", "world", "help"], 2)
 ///     [WordDistance(word="helo", distance=1), WordDistance(word="help", distance=2)]
 #[pyfunction]
-#[pyo3(signature = (obj_word, word_list, num_results))]
+#[pyo3(signature = (
+    obj_word,
+    word_list,
+    num_results,
+    max_distance=None,
+    *,
+    num_threads=None,
+    parallel_threshold=DEFAULT_PARALLEL_THRESHOLD,
+))]
 fn find_most_similar_words(
+    py: Python<'_>,
     obj_word: String,
     word_list: Vec<String>,
     num_results: usize,
+    max_distance: Option<usize>,
+    num_threads: Option<usize>,
+    parallel_threshold: usize,
 ) -> PyResult<Vec<WordDistance>> {
-    let mut distances: Vec<WordDistance> = word_list
-        .iter()
-        .map(|word| {
-            let distance = damerau_levenshtein(&obj_word, word);
-            WordDistance {
-                word: word.clone(),
-                distance,
-            }
+    let encoded = py.detach(|| EncodedWords::new(&word_list));
+    let best = search_detached(
+        py,
+        &encoded,
+        &obj_word,
+        num_results,
+        max_distance,
+        num_threads,
+        parallel_threshold,
+    )?;
+
+    let distances = best
+        .into_iter()
+        .map(|(distance, index)| WordDistance {
+            word: word_list[index].clone(),
+            distance,
         })
         .collect();
-
-    distances.sort_by(|a, b| a.distance.cmp(&b.distance));
-    distances.truncate(num_results);
     Ok(distances)
 }
 
+/// Find the most similar words to each of several target words.
+///
+/// Same as calling find_most_similar_words for every target word, but the word
+/// list is converted once and the whole query × word grid is searched in a
+/// single call without holding the GIL, the target words being spread across
+/// cores when the grid has at least `parallel_threshold` cells.
+///
+/// Args:
+///     obj_words (list[str]): The target words to match against
+///     word_list (list[str]): List of words to search through
+///     num_results (int): Maximum number of results per target word. Defaults to 10.
+///     max_distance (int | None): Discard words farther than this distance.
+///         Defaults to None, meaning no limit.
+///     num_threads (int | None): Number of worker threads for parallel scans.
+///         Defaults to None, meaning the global rayon pool.
+///     parallel_threshold (int): Minimum grid size to search in parallel.
+///         Defaults to 4096.
+///
+/// Returns:
+///     list[list[WordDistance]]: The matches of every target word, in order
+///
+/// Raises:
+///     ValueError: If the thread pool can't be built
+///
+/// Examples:
+///     >>> find_most_similar_words_batch(["hello", "wrld"], ["helo", "world"], 1)
+///     [[WordDistance(word="helo", distance=1)], [WordDistance(word="world", distance=1)]]
+#[pyfunction]
+#[pyo3(signature = (
+    obj_words,
+    word_list,
+    num_results=10,
+    max_distance=None,
+    *,
+    num_threads=None,
+    parallel_threshold=DEFAULT_PARALLEL_THRESHOLD,
+))]
+fn find_most_similar_words_batch(
+    py: Python<'_>,
+    obj_words: Vec<String>,
+    word_list: Vec<String>,
+    num_results: usize,
+    max_distance: Option<usize>,
+    num_threads: Option<usize>,
+    parallel_threshold: usize,
+) -> PyResult<Vec<Vec<WordDistance>>> {
+    let encoded = py.detach(|| EncodedWords::new(&word_list));
+    let results = search_batch_detached(
+        py,
+        &encoded,
+        &obj_words,
+        num_results,
+        max_distance,
+        num_threads,
+        parallel_threshold,
+    )?;
+
+    Ok(results
+        .into_iter()
+        .map(|best| {
+            best.into_iter()
+                .map(|(distance, index)| WordDistance {
+                    word: word_list[index].clone(),
+                    distance,
+                })
+                .collect()
+        })
+        .collect())
+}
+
+/// Find the words containing the chars of a query in order, ignoring case, with
+/// the best subsequence scores.
+///
+/// Matched chars score points, gaps between them cost, and chars at the start
+/// of the word, after separators or on camelCase humps score bonuses, so
+/// abbreviations like "pmgr" find "project-manager". Words lacking some char of
+/// the query are rejected by a char bitmask before being scanned. The scan runs
+/// without holding the GIL.
+///
+/// Args:
+///     query (str): The chars to find
+///     word_list (list[str]): List of words to search through
+///     num_results (int): Maximum number of results to return. Defaults to 10.
+///
+/// Returns:
+///     list[WordScore]: WordScore objects sorted by score, ties shortest first then in list order
+///
+/// Examples:
+///     >>> find_best_subsequence_matches("pmgr", ["programmer", "project-manager"])
+///     [WordScore(word="project-manager", score=71)]
+#[pyfunction]
+#[pyo3(signature = (query, word_list, num_results=10))]
+fn find_best_subsequence_matches(
+    py: Python<'_>,
+    query: String,
+    word_list: Vec<String>,
+    num_results: usize,
+) -> Vec<WordScore> {
+    let best = py.detach(|| EncodedWords::new(&word_list).subsequence_top_k(&query, num_results));
+    best.into_iter()
+        .map(|(score, index)| WordScore {
+            word: word_list[index].clone(),
+            score,
+        })
+        .collect()
+}
 
 /// Fuzzy string matching module using Damerau-Levenshtein distance.
 ///
@@ -151,12 +578,22 @@ fn find_most_similar_words(
 ///
 /// Classes:
 ///     WordDistance: Container for a word and its distance from a target
+///     WordScore: Container for a word and its subsequence score
+///     Corpus: Word list decoded once, to be searched repeatedly
 ///
 /// Functions:
+///     damerau_levenshtein_distance: Edit distance between two words
 ///     find_most_similar_words: Find N most similar words from a list
+///     find_most_similar_words_batch: Same, for several target words at once
+///     find_best_subsequence_matches: Find N best subsequence matches from a list
 #[pymodule]
 fn fuzzy_string_matcher(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<WordDistance>()?;
+    m.add_class::<WordScore>()?;
+    m.add_class::<Corpus>()?;
+    m.add_function(wrap_pyfunction!(damerau_levenshtein_distance, m)?)?;
     m.add_function(wrap_pyfunction!(find_most_similar_words, m)?)?;
+    m.add_function(wrap_pyfunction!(find_most_similar_words_batch, m)?)?;
+    m.add_function(wrap_pyfunction!(find_best_subsequence_matches, m)?)?;
     Ok(())
 }
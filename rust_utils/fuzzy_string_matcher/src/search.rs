@@ -0,0 +1,276 @@
+//! Top-k search over a list of words decoded once into compact buffers.
+
+use std::cmp::Reverse;
+use std::collections::BinaryHeap;
+use std::ops::Range;
+
+use rayon::prelude::*;
+
+use crate::distance::{osa_distance, Workspace};
+use crate::subsequence::{char_mask, fold, subsequence_score};
+
+/// A word stored in `EncodedWords`.
+enum Word<'a> {
+    Ascii(&'a [u8]),
+    Unicode(&'a [char]),
+}
+
+/// Where a word is stored: ASCII words live in the byte buffer, the others
+/// in the char buffer.
+struct Span {
+    start: usize,
+    end: usize,
+    ascii: bool,
+}
+
+/// Words decoded into two contiguous buffers: ASCII words as bytes, so they
+/// take the kernel's byte path, and the others as chars.
+pub struct EncodedWords {
+    bytes: Vec<u8>,
+    chars: Vec<char>,
+    spans: Vec<Span>,
+    /// `char_mask` of each word, prefiltering subsequence searches
+    masks: Vec<u64>,
+}
+
+/// A search query, decoded once for all the words it is compared against.
+pub struct Query {
+    chars: Vec<char>,
+    bytes: Option<Vec<u8>>,
+}
+
+impl Query {
+    pub fn new(word: &str) -> Self {
+        Self {
+            chars: word.chars().collect(),
+            bytes: word.is_ascii().then(|| word.as_bytes().to_vec()),
+        }
+    }
+}
+
+/// Per-thread scratch memory, reused across the whole word list.
+#[derive(Default)]
+struct Scratch {
+    workspace: Workspace,
+    /// ASCII word widened to chars, to be compared against a non-ASCII query
+    widened: Vec<char>,
+}
+
+impl EncodedWords {
+    pub fn new<S: AsRef<str>>(words: &[S]) -> Self {
+        let mut bytes = Vec::new();
+        let mut chars = Vec::new();
+        let mut spans = Vec::with_capacity(words.len());
+        let mut masks = Vec::with_capacity(words.len());
+        for word in words {
+            let word = word.as_ref();
+            let span = if word.is_ascii() {
+                bytes.extend_from_slice(word.as_bytes());
+                Span {
+                    start: bytes.len() - word.len(),
+                    end: bytes.len(),
+                    ascii: true,
+                }
+            } else {
+                let start = chars.len();
+                chars.extend(word.chars());
+                Span {
+                    start,
+                    end: chars.len(),
+                    ascii: false,
+                }
+            };
+            masks.push(if span.ascii {
+                char_mask(&bytes[span.start..span.end])
+            } else {
+                char_mask(&chars[span.start..span.end])
+            });
+            spans.push(span);
+        }
+        bytes.shrink_to_fit();
+        chars.shrink_to_fit();
+        Self {
+            bytes,
+            chars,
+            spans,
+            masks,
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.spans.len()
+    }
+
+    fn word(&self, index: usize) -> Word<'_> {
+        let span = &self.spans[index];
+        if span.ascii {
+            Word::Ascii(&self.bytes[span.start..span.end])
+        } else {
+            Word::Unicode(&self.chars[span.start..span.end])
+        }
+    }
+
+    fn distance(
+        &self,
+        query: &Query,
+        index: usize,
+        max_distance: Option<usize>,
+        scratch: &mut Scratch,
+    ) -> usize {
+        match (self.word(index), &query.bytes) {
+            (Word::Ascii(word), Some(query)) => {
+                osa_distance(query, word, max_distance, &mut scratch.workspace)
+            }
+            (Word::Ascii(word), None) => {
+                scratch.widened.clear();
+                scratch
+                    .widened
+                    .extend(word.iter().map(|&byte| char::from(byte)));
+                osa_distance(
+                    &query.chars,
+                    &scratch.widened,
+                    max_distance,
+                    &mut scratch.workspace,
+                )
+            }
+            (Word::Unicode(word), _) => {
+                osa_distance(&query.chars, word, max_distance, &mut scratch.workspace)
+            }
+        }
+    }
+
+    /// `(distance, index)` of the `num_results` words closest to `query`,
+    /// sorted by distance with ties in index order.
+    pub fn top_k(
+        &self,
+        query: &Query,
+        num_results: usize,
+        max_distance: Option<usize>,
+    ) -> Vec<(usize, usize)> {
+        self.top_k_range(query, 0..self.len(), num_results, max_distance)
+    }
+
+    /// Same as `top_k`, but the words are split in chunks scanned on the
+    /// current rayon pool, and the per-chunk results merged afterwards.
+    pub fn par_top_k(
+        &self,
+        query: &Query,
+        num_results: usize,
+        max_distance: Option<usize>,
+    ) -> Vec<(usize, usize)> {
+        let len = self.len();
+        let chunk_size = len.div_ceil(rayon::current_num_threads() * 4).max(256);
+
+        let mut best: Vec<(usize, usize)> = (0..len.div_ceil(chunk_size))
+            .into_par_iter()
+            .flat_map_iter(|chunk| {
+                let range = chunk * chunk_size..len.min((chunk + 1) * chunk_size);
+                self.top_k_range(query, range, num_results, max_distance)
+            })
+            .collect();
+
+        best.sort_unstable();
+        best.truncate(num_results);
+        best
+    }
+
+    /// `top_k` of every query. In parallel, the queries are spread over the
+    /// current rayon pool, each one scanning the words on a single thread.
+    pub fn batch_top_k(
+        &self,
+        queries: &[Query],
+        num_results: usize,
+        max_distance: Option<usize>,
+        parallel: bool,
+    ) -> Vec<Vec<(usize, usize)>> {
+        if parallel {
+            queries
+                .par_iter()
+                .map(|query| self.top_k(query, num_results, max_distance))
+                .collect()
+        } else {
+            queries
+                .iter()
+                .map(|query| self.top_k(query, num_results, max_distance))
+                .collect()
+        }
+    }
+
+    /// The candidates are kept in a bounded max-heap; once it is full the
+    /// worst distance in it tightens the bound passed to the distance
+    /// computation.
+    fn top_k_range(
+        &self,
+        query: &Query,
+        range: Range<usize>,
+        num_results: usize,
+        max_distance: Option<usize>,
+    ) -> Vec<(usize, usize)> {
+        if num_results == 0 {
+            return Vec::new();
+        }
+        let mut best: BinaryHeap<(usize, usize)> =
+            BinaryHeap::with_capacity(num_results.min(range.len()) + 1);
+        let mut scratch = Scratch::default();
+
+        let mut bound = max_distance;
+        for index in range {
+            let distance = self.distance(query, index, bound, &mut scratch);
+            if bound.is_some_and(|bound| distance > bound) {
+                continue;
+            }
+
+            best.push((distance, index));
+            if best.len() > num_results {
+                best.pop();
+            }
+            if best.len() == num_results {
+                // later words must be strictly closer to displace the worst one
+                let worst = best.peek().map_or(0, |&(distance, _)| distance);
+                if worst == 0 {
+                    break;
+                }
+                bound = Some(bound.map_or(worst - 1, |bound| bound.min(worst - 1)));
+            }
+        }
+
+        best.into_sorted_vec()
+    }
+
+    /// `(score, index)` of the `num_results` words containing `query` as a
+    /// subsequence with the best scores, sorted by score then shortest first,
+    /// ties in index order. Words whose char mask lacks bits of the query's
+    /// aren't scanned.
+    pub fn subsequence_top_k(&self, query: &str, num_results: usize) -> Vec<(i64, usize)> {
+        if num_results == 0 {
+            return Vec::new();
+        }
+        let query: Vec<char> = query.chars().map(fold).collect();
+        let query_mask = char_mask(&query);
+        // max-heap of the worst (Reverse(score), length, index) kept so far
+        let mut best: BinaryHeap<(Reverse<i64>, usize, usize)> =
+            BinaryHeap::with_capacity(num_results.min(self.len()) + 1);
+
+        for (index, &mask) in self.masks.iter().enumerate() {
+            if query_mask & !mask != 0 {
+                continue;
+            }
+            let (score, length) = match self.word(index) {
+                Word::Ascii(word) => (subsequence_score(&query, word), word.len()),
+                Word::Unicode(word) => (subsequence_score(&query, word), word.len()),
+            };
+            let Some(score) = score else {
+                continue;
+            };
+            best.push((Reverse(score), length, index));
+            if best.len() > num_results {
+                best.pop();
+            }
+        }
+
+        best.into_sorted_vec()
+            .into_iter()
+            .map(|(Reverse(score), _, index)| (score, index))
+            .collect()
+    }
+}
@@ -0,0 +1,170 @@
+//! Subsequence (fzf-style) scoring, mirroring `utils/string_fuzzy_matcher.py`.
+
+/// Score of a matched char.
+pub const SCORE_MATCH: i64 = 16;
+/// Cost of the first unmatched char of a gap between matched chars.
+pub const SCORE_GAP_START: i64 = -3;
+/// Cost of each other unmatched char of a gap.
+pub const SCORE_GAP_EXTENSION: i64 = -1;
+/// Bonus of chars at the start of the word or after a separator.
+pub const BONUS_BOUNDARY: i64 = SCORE_MATCH / 2;
+/// Bonus of camelCase humps and of digits after other chars.
+pub const BONUS_CAMEL: i64 = BONUS_BOUNDARY + SCORE_GAP_EXTENSION;
+/// Minimum bonus of the chars following a matched char.
+pub const BONUS_CONSECUTIVE: i64 = -(SCORE_GAP_START + SCORE_GAP_EXTENSION);
+/// The bonus of the first char of the query counts this many times.
+pub const BONUS_FIRST_CHAR_MULTIPLIER: i64 = 2;
+
+#[derive(Clone, Copy, PartialEq)]
+enum CharClass {
+    Other,
+    Letter,
+    Upper,
+    Digit,
+}
+
+/// Case folded char, chars lowering to several chars are kept as is.
+pub fn fold(char: char) -> char {
+    let mut lowered = char.to_lowercase();
+    match (lowered.next(), lowered.next()) {
+        (Some(lowered), None) => lowered,
+        _ => char,
+    }
+}
+
+/// Bitmask of the case folded chars, 64 bits wide. A word can only contain a
+/// query as a subsequence if its mask has all the bits of the query's.
+pub fn char_mask<T: Copy + Into<char>>(word: &[T]) -> u64 {
+    word.iter().fold(0, |mask, &char| {
+        let char = fold(char.into());
+        let bit = match char {
+            'a'..='z' => char as u32 - 'a' as u32,
+            '0'..='9' => 26 + char as u32 - '0' as u32,
+            _ => 36 + char as u32 % 28,
+        };
+        mask | 1 << bit
+    })
+}
+
+fn char_class(char: char) -> CharClass {
+    if char.is_numeric() {
+        CharClass::Digit
+    } else if char.is_uppercase() {
+        CharClass::Upper
+    } else if char.is_alphabetic() {
+        CharClass::Letter
+    } else {
+        CharClass::Other
+    }
+}
+
+fn bonus(previous: CharClass, class: CharClass) -> i64 {
+    match (previous, class) {
+        (_, CharClass::Other) => 0,
+        (CharClass::Other, _) => BONUS_BOUNDARY,
+        (CharClass::Letter, CharClass::Upper) => BONUS_CAMEL,
+        (previous, CharClass::Digit) if previous != CharClass::Digit => BONUS_CAMEL,
+        _ => 0,
+    }
+}
+
+/// Score of the chars of `query`, case folded, appearing in order in `word`
+/// ignoring case, or None if they don't.
+///
+/// The match ending first is shrunk from its end to the shortest one, then
+/// scored in a single pass, so the cost is linear in the length of the word.
+pub fn subsequence_score<T: Copy + Into<char>>(query: &[char], word: &[T]) -> Option<i64> {
+    if query.is_empty() {
+        return Some(0);
+    }
+    let folded = |index: usize| fold(word[index].into());
+
+    let mut end = 0;
+    for (position, &char) in query.iter().enumerate() {
+        let from = if position == 0 { 0 } else { end + 1 };
+        end = (from..word.len()).find(|&index| folded(index) == char)?;
+    }
+    let mut start = end;
+    for &char in query[..query.len() - 1].iter().rev() {
+        start = (0..start).rev().find(|&index| folded(index) == char)?;
+    }
+
+    let (mut score, mut in_gap, mut consecutive, mut first_bonus) = (0, false, 0, 0);
+    let mut previous_class = match start {
+        0 => CharClass::Other,
+        _ => char_class(word[start - 1].into()),
+    };
+    let mut query_index = 0;
+    for index in start..=end {
+        let class = char_class(word[index].into());
+        if folded(index) == query[query_index] {
+            score += SCORE_MATCH;
+            let mut char_bonus = bonus(previous_class, class);
+            if consecutive == 0 {
+                first_bonus = char_bonus;
+            } else {
+                // a consecutive run keeps the bonus of its first char
+                if char_bonus >= BONUS_BOUNDARY && char_bonus > first_bonus {
+                    first_bonus = char_bonus;
+                }
+                char_bonus = char_bonus.max(first_bonus).max(BONUS_CONSECUTIVE);
+            }
+            score += if query_index == 0 {
+                char_bonus * BONUS_FIRST_CHAR_MULTIPLIER
+            } else {
+                char_bonus
+            };
+            in_gap = false;
+            consecutive += 1;
+            query_index += 1;
+        } else {
+            score += if in_gap {
+                SCORE_GAP_EXTENSION
+            } else {
+                SCORE_GAP_START
+            };
+            in_gap = true;
+            consecutive = 0;
+            first_bonus = 0;
+        }
+        previous_class = class;
+    }
+    Some(score)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn score(query: &str, word: &str) -> Option<i64> {
+        let query: Vec<char> = query.chars().map(fold).collect();
+        let word: Vec<char> = word.chars().collect();
+        subsequence_score(&query, &word)
+    }
+
+    #[test]
+    fn scores_like_python() {
+        // values from utils.string_fuzzy_matcher.subsequence_score
+        assert_eq!(score("pmgr", "project-manager"), Some(71));
+        assert_eq!(score("pmgr", "PackageManager"), Some(71));
+        assert_eq!(score("pm", "open-pm"), Some(56));
+        assert_eq!(score("pm", "programmer"), Some(41));
+        assert_eq!(score("pmgr", "programmer"), None);
+        assert_eq!(score("", "anything"), Some(0));
+        assert_eq!(score("pkm", "PackageManager"), Some(62));
+    }
+
+    #[test]
+    fn bytes_and_chars_agree() {
+        let query: Vec<char> = "pmgr".chars().collect();
+        let chars: Vec<char> = "project-manager".chars().collect();
+        assert_eq!(
+            subsequence_score(&query, b"project-manager"),
+            subsequence_score(&query, &chars)
+        );
+        assert_eq!(
+            char_mask(b"Project"),
+            char_mask(&['p', 'r', 'o', 'j', 'e', 'c', 't'])
+        );
+    }
+}
@@ -1,6 +1,7 @@
 #!/bin/bash
 SCRIPTS_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 supported_scripts=("open" "cheatsheet" "organize")
+completed_scripts=("open" "cheatsheet")
 # Colors for output
 GREEN='\033[0;32m'
 YELLOW='\033[0;33m'
@@ -47,9 +48,36 @@ function setup_aliases() {
     done
 }
 
+function write_completion_caches() {
+    for script in "$@"; do
+        if "${SCRIPTS_DIR}/.venv/bin/python" "${SCRIPTS_DIR}/${script}/${script}.py" --completions >/dev/null 2>&1; then
+            echo -e "${GREEN}Wrote the completion cache of ${script}${NC}"
+        else
+            echo -e "${YELLOW}Couldn't write the completion cache of ${script} yet, it will be written on its first completion${NC}"
+        fi
+    done
+}
+
+function add_completions() {
+    local shell_config="$1"
+    local completions_file="${SCRIPTS_DIR}/completions/scripts.bash"
+    if [ "$(basename "$SHELL")" = "zsh" ]; then
+        completions_file="${SCRIPTS_DIR}/completions/scripts.zsh"
+    fi
+    if grep -qF "source '${completions_file}'" "${shell_config}"; then
+        echo -e "${YELLOW}Completions are already sourced in ${shell_config}${NC}"
+        return
+    fi
+    echo -e "${GREEN}Adding completions to ${shell_config}${NC}"
+    # after the aliases, which the zsh completions rely on
+    echo "source '${completions_file}'" >>"${shell_config}"
+}
+
 # Get shell config file
 SHELL_CONFIG=$(shell_config_file)
 echo -e "${BLUE}Setting up aliases in ${SHELL_CONFIG}${NC}"
 
 setup_aliases "$SHELL_CONFIG" "${supported_scripts[@]}"
-echo -e "${GREEN}Alias setup complete. Please run 'source ${SHELL_CONFIG}' to apply changes.${NC}"
+write_completion_caches "${completed_scripts[@]}"
+add_completions "$SHELL_CONFIG"
+echo -e "${GREEN}Alias and completion setup complete. Please run 'source ${SHELL_CONFIG}' to apply changes.${NC}"
@@ -0,0 +1,24 @@
+"""
+Tests for the picker frame budget benchmark.
+"""
+
+from benchmarks import bench_picker
+from utils.string_fuzzy_matcher import MIN_VECTORIZED_PAIRS
+
+
+def test_keystrokes_are_timed():
+    result = bench_picker.measure(200, rounds=1)
+    _, queries = bench_picker.make_corpus(200)
+    assert result.engine == "utils.string_fuzzy_matcher"
+    assert len(result.keystrokes) == sum(map(len, queries))
+
+
+def test_over_budget():
+    slow = [0.001, 0.1]
+    python = "utils.string_fuzzy_matcher"
+    assert bench_picker.Result(100, python, slow).over_budget(0.05)
+    assert not bench_picker.Result(100, python, slow).over_budget(0.2)
+    # the picker debounces large corpora searched without NumPy
+    assert not bench_picker.Result(MIN_VECTORIZED_PAIRS, python, slow).over_budget(0.05)
+    numpy = "utils.vectorized_distance"
+    assert bench_picker.Result(MIN_VECTORIZED_PAIRS, numpy, slow).over_budget(0.05)
@@ -0,0 +1,27 @@
+"""
+Tests for the sfm benchmark suite's regression gating.
+"""
+
+from benchmarks import bench_sfm
+
+
+def test_regressions_against_saved_baseline(tmp_path):
+    """Test that results are saved and compared against a baseline."""
+    backends = bench_sfm.available_backends(["python"])
+    matrix = [(10, "short", "ascii"), (10, "short", "mixed")]
+    results = bench_sfm.run(backends, matrix, 1, 0.0)
+    assert len(results) == 2 * len(bench_sfm.MAX_DISTANCES)
+
+    baseline_path = str(tmp_path / "baseline.json")
+    bench_sfm.save(results, baseline_path)
+    baseline = bench_sfm.load_times(baseline_path)
+    assert set(baseline) == {result.case.key for result in results}
+
+    # Same timings never regress, twice slower ones do
+    assert not bench_sfm.regressions(results, baseline, 1.0)
+    halved = {key: seconds / 2 for key, seconds in baseline.items()}
+    slower = bench_sfm.regressions(results, halved, 1.5)
+    assert [case for case, _ in slower] == [result.case for result in results]
+
+    # Cases missing from the baseline are ignored
+    assert not bench_sfm.regressions(results, {}, 1.0)
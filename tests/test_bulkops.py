@@ -0,0 +1,185 @@
+"""Tests for the planned, journaled bulk operations of utils.bulkops"""
+
+import errno
+import os
+
+import pytest
+
+from utils import bulkops
+
+
+@pytest.fixture
+def files(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for number in range(20):
+        (source / f"{number}.txt").write_text(str(number), encoding="utf-8")
+    (tmp_path / "destination").mkdir()
+    return source
+
+
+def test_plan_move(files, tmp_path):
+    destination = tmp_path / "destination"
+    (destination / "3.txt").write_text("taken", encoding="utf-8")
+
+    plan = bulkops.plan_move(
+        [files / "1.txt", files / "3.txt", tmp_path / "1.txt"], str(destination)
+    )
+
+    assert plan.operations == [
+        bulkops.Operation("move", str(files / "1.txt"), str(destination / "1.txt"))
+    ]
+    assert plan.conflicts == [
+        f"{destination / '3.txt'} already exists, not moving {files / '3.txt'}",
+        (
+            f"{tmp_path / '1.txt'} and {files / '1.txt'} would both be moved to "
+            f"{destination / '1.txt'}"
+        ),
+    ]
+    with pytest.raises(ValueError):
+        bulkops.run(plan, str(tmp_path / "journal"))
+    assert (files / "1.txt").exists()
+
+
+def test_plan_move_skips_nested_paths(files, tmp_path):
+    nested = files / "nested"
+    (nested / "deeper").mkdir(parents=True)
+    (nested / "deeper" / "file.txt").write_text("file", encoding="utf-8")
+    paths = [nested / "deeper" / "file.txt", nested / "deeper", nested, files / "1.txt"]
+    destination = tmp_path / "destination"
+
+    plan = bulkops.plan_move(paths, str(destination))
+    assert [operation.source for operation in plan.operations] == [
+        str(nested),
+        str(files / "1.txt"),
+    ]
+
+    assert bulkops.run(plan, str(tmp_path / "journal")) == bulkops.Report(2, [])
+    assert (destination / "nested" / "deeper" / "file.txt").exists()
+
+
+def test_run(files, tmp_path):
+    destination = tmp_path / "destination"
+    journal = str(tmp_path / "journal")
+    paths = sorted(str(path) for path in files.iterdir())
+
+    report = bulkops.run(bulkops.plan_move(paths[:10], str(destination)), journal)
+    assert report == bulkops.Report(10, [])
+    report = bulkops.run(bulkops.plan_remove(paths[10:]), journal, workers=2)
+    assert report == bulkops.Report(10, [])
+
+    assert not os.listdir(files)
+    assert sorted(os.listdir(destination)) == sorted(map(os.path.basename, paths[:10]))
+    assert not os.path.exists(journal)
+
+
+def test_cross_device_move_copies(files, tmp_path, monkeypatch):
+    def rename(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(bulkops, "rename_noreplace", rename)
+    os.chmod(files / "1.txt", 0o640)
+    plan = bulkops.plan_move([files / "1.txt"], str(tmp_path / "destination"))
+
+    assert bulkops.run(plan, str(tmp_path / "journal")).done == 1
+
+    moved = tmp_path / "destination" / "1.txt"
+    assert moved.read_text(encoding="utf-8") == "1"
+    assert moved.stat().st_mode & 0o777 == 0o640
+    assert not (files / "1.txt").exists()
+
+
+@pytest.mark.parametrize("renameat2", [True, False])
+def test_move_never_replaces(files, tmp_path, monkeypatch, renameat2):
+    if not renameat2:
+        # hard links, and a check for what can't be linked
+        monkeypatch.setattr(bulkops, "_renameat2", lambda: None)
+    destination = tmp_path / "destination"
+    (files / "folder").mkdir()
+    paths = [files / "1.txt", files / "2.txt", files / "folder"]
+    plan = bulkops.plan_move(paths, str(destination))
+    # created after planning
+    (destination / "1.txt").write_text("new", encoding="utf-8")
+    (destination / "folder").mkdir()
+
+    report = bulkops.run(plan, str(tmp_path / "journal"))
+
+    assert report.done == 1
+    assert sorted(
+        (os.path.basename(operation.source), error.split("]")[0])
+        for operation, error in report.failed
+    ) == [("1.txt", f"[Errno {errno.EEXIST}"), ("folder", f"[Errno {errno.EEXIST}")]
+    assert (destination / "1.txt").read_text(encoding="utf-8") == "new"
+    assert (files / "1.txt").read_text(encoding="utf-8") == "1"
+    assert (destination / "2.txt").read_text(encoding="utf-8") == "2"
+    assert (files / "folder").is_dir()
+
+
+def interrupted_run(files, tmp_path, monkeypatch):
+    """Runs a move of the files that fails half way through"""
+    apply = bulkops.apply
+    applied = []
+
+    def failing_apply(operation):
+        if len(applied) >= 10:
+            raise OSError(errno.EIO, "I/O error")
+        applied.append(operation)
+        apply(operation)
+
+    monkeypatch.setattr(bulkops, "apply", failing_apply)
+    monkeypatch.setattr(bulkops, "JOURNAL_BATCH", 4)
+    plan = bulkops.plan_move(sorted(files.iterdir()), str(tmp_path / "destination"))
+    report = bulkops.run(plan, str(tmp_path / "journal"), workers=1)
+    monkeypatch.undo()
+    return report
+
+
+def test_resume(files, tmp_path, monkeypatch):
+    journal = str(tmp_path / "journal")
+    report = interrupted_run(files, tmp_path, monkeypatch)
+    assert report.done == 10
+    assert len(report.failed) == 10
+    with pytest.raises(FileExistsError):
+        bulkops.run(bulkops.plan_remove([]), journal)
+
+    assert bulkops.resume(journal) == bulkops.Report(20, [])
+    assert not os.listdir(files)
+    assert not os.path.exists(journal)
+
+
+def test_rollback(files, tmp_path, monkeypatch):
+    before = sorted(os.listdir(files))
+    interrupted_run(files, tmp_path, monkeypatch)
+
+    assert bulkops.rollback(str(tmp_path / "journal")) == bulkops.Report(10, [])
+    assert sorted(os.listdir(files)) == before
+    assert not os.listdir(tmp_path / "destination")
+
+
+def test_rollback_keeps_the_journal_to_retry(files, tmp_path, monkeypatch):
+    journal = str(tmp_path / "journal")
+    paths = sorted(str(path) for path in files.iterdir())
+    plan = bulkops.plan_move(paths[:2], str(tmp_path / "destination"))
+    plan.operations += bulkops.plan_remove(paths[2:3]).operations
+    bulkops.run(plan, journal)
+    bulkops.Journal(journal).start(plan)
+
+    apply = bulkops.apply
+
+    def failing_apply(operation):
+        if operation.destination == paths[0]:
+            raise OSError(errno.EIO, "I/O error")
+        apply(operation)
+
+    monkeypatch.setattr(bulkops, "apply", failing_apply)
+    report = bulkops.rollback(journal)
+    assert report.done == 1
+    assert [operation.destination for operation, _ in report.failed] == paths[:1]
+    assert [operation.kind for operation, _ in report.lost] == ["remove"]
+    assert os.path.exists(journal)
+
+    # lost files alone don't keep it
+    monkeypatch.undo()
+    report = bulkops.rollback(journal)
+    assert (report.done, report.failed, len(report.lost)) == (1, [], 1)
+    assert not os.path.exists(journal)
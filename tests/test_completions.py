@@ -0,0 +1,80 @@
+"""Tests for the completion caches read by the shell completion functions"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from utils import completions, configreader, dir_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cached_names(cache):
+    with open(cache, encoding="utf-8") as file:
+        return file.read().splitlines()[1:]
+
+
+def test_mapping_changes_refresh_the_cache(tmp_path, monkeypatch):
+    mapping = str(tmp_path / ".env")
+    configreader.add_to_mapping_file({"scripts": "/home/scripts"}, mapping)
+    cache = completions.cache_path(mapping)
+    # only the caches that setup.sh created are kept up to date
+    assert not os.path.exists(cache)
+
+    completions.write(cache, mapping, configreader.read_mapping_file(mapping))
+    configreader.add_to_mapping_file({"web": "/srv/web"}, mapping)
+    assert cached_names(cache) == ["scripts", "web"]
+    configreader.remove_form_mapping_file(["scripts"], mapping)
+    assert cached_names(cache) == ["web"]
+
+    # edited by hand, refreshed on the next read
+    with open(mapping, "a", encoding="utf-8") as file:
+        file.write("docs=/srv/docs\n")
+    configreader.read_mapping_file(mapping)
+    assert cached_names(cache) == ["web", "docs"]
+    with open(cache, encoding="utf-8") as file:
+        assert file.readline() == f"#{mapping}\n"
+
+    # rebuilding the mapping cache alone leaves the completions alone
+    monkeypatch.setattr(configreader, "RACY_SECONDS", -1)
+    monkeypatch.setattr(completions, "refresh", None)
+    os.remove(configreader.cache_path(mapping))
+    assert "docs" in configreader.read_mapping_file(mapping)
+
+
+def test_folder_changes_refresh_the_cache(tmp_path):
+    folder = tmp_path / "cheatsheets"
+    folder.mkdir()
+    (folder / "Git.md").touch()
+    index_path = str(tmp_path / ".env.stems")
+    cache = completions.cache_path(index_path)
+    completions.write(cache, str(folder), [])
+
+    dir_index.read_stem_index(str(folder), (".md",), index_path)
+    assert cached_names(cache) == ["Git"]
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash is not installed")
+def test_bash_completion_reads_the_cache(tmp_path):
+    (tmp_path / "open").mkdir()
+    mapping = tmp_path / "open" / ".env"
+    mapping.write_text("proj=/a\nprog=/b\nweb=/c\n", encoding="utf-8")
+    completions.write(
+        completions.cache_path(str(mapping)), str(mapping), ["proj", "prog", "web"]
+    )
+
+    # there's no Python in tmp_path, it would fail if the cache wasn't used
+    script = (
+        f"source {ROOT}/completions/scripts.bash; "
+        'COMP_WORDS=(open pro); COMP_CWORD=1; _scripts_open; printf "%s\\n" "${COMPREPLY[@]}"'
+    )
+    result = subprocess.run(
+        ["bash", "-c", script],
+        env={**os.environ, "_SCRIPTS_DIR": str(tmp_path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.splitlines() == ["proj", "prog"]
@@ -0,0 +1,148 @@
+"""Tests for utils.configreader"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from utils import configreader
+
+
+@pytest.fixture
+def mapping_file(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text(
+        "# projects\nalpha=/home/alpha\n\nbeta=/srv/a=b\nalpha=/home/alpha2\n",
+        encoding="utf-8",
+    )
+    return str(path)
+
+
+def test_read_mapping_file(mapping_file):
+    mapping = configreader.read_mapping_file(mapping_file)
+
+    assert dict(mapping) == {"alpha": Path("/home/alpha2"), "beta": Path("/srv/a=b")}
+    assert "beta" in mapping
+    assert configreader.lookup_mapping_file(mapping_file, "beta") == Path("/srv/a=b")
+    assert configreader.lookup_mapping_file(mapping_file, "gamma") is None
+
+
+def test_cache_is_used_and_validated(mapping_file):
+    configreader.read_mapping_file(mapping_file)
+    cache = configreader.cache_path(mapping_file)
+    assert os.path.exists(cache)
+
+    # A cache built from other contents is never used, even with the same
+    # size and modification time
+    stat = os.stat(mapping_file)
+    with open(mapping_file, "r+", encoding="utf-8") as file:
+        file.write("#")
+    os.utime(mapping_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert "alpha" in configreader.read_mapping_file(mapping_file)
+
+    with open(mapping_file, "a", encoding="utf-8") as file:
+        file.write("gamma=/g\n")
+    assert "gamma" in configreader.read_mapping_file(mapping_file)
+
+
+def test_settled_file_is_validated_by_its_stat(mapping_file, monkeypatch):
+    monkeypatch.setattr(configreader, "RACY_SECONDS", -1)
+    configreader.read_mapping_file(mapping_file)
+
+    # Once the file is older than RACY_SECONDS it isn't read, so contents
+    # changed without changing the stat go unnoticed
+    stat = os.stat(mapping_file)
+    with open(mapping_file, "r+", encoding="utf-8") as file:
+        file.write("#")
+    os.utime(mapping_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    monkeypatch.setattr(configreader, "compile_mapping", None)
+    assert "alpha" in configreader.read_mapping_file(mapping_file)
+
+
+def test_edits_update_the_cache(mapping_file, monkeypatch):
+    configreader.add_to_mapping_file({"gamma": "/g", "delta": "/d"}, mapping_file)
+    configreader.remove_form_mapping_file(["alpha", "missing"], mapping_file)
+
+    # The cache matches the file, so reading it doesn't compile anything
+    monkeypatch.setattr(configreader, "compile_mapping", None)
+    mapping = configreader.read_mapping_file(mapping_file)
+    assert dict(mapping) == {
+        "beta": Path("/srv/a=b"),
+        "gamma": Path("/g"),
+        "delta": Path("/d"),
+    }
+    monkeypatch.undo()
+
+    os.remove(configreader.cache_path(mapping_file))
+    assert configreader.read_mapping_file(mapping_file) == mapping
+
+
+def test_add_to_file_without_trailing_newline(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("alpha=/a", encoding="utf-8")
+
+    configreader.add_to_mapping_file({"beta": "/b"}, str(path))
+
+    assert path.read_text(encoding="utf-8") == "alpha=/a\nbeta=/b\n"
+
+
+def test_edit_mapping_file(mapping_file):
+    configreader.edit_mapping_file(
+        mapping_file,
+        add={"alpha": "/new", "gamma": "/g"},
+        remove=["missing"],
+        rename={"beta": "b"},
+    )
+
+    with open(mapping_file, encoding="utf-8") as file:
+        assert file.read() == "# projects\nalpha=/new\n\nb=/srv/a=b\ngamma=/g\n"
+    assert dict(configreader.read_mapping_file(mapping_file)) == {
+        "alpha": Path("/new"),
+        "b": Path("/srv/a=b"),
+        "gamma": Path("/g"),
+    }
+
+    with pytest.raises(ValueError):
+        configreader.edit_mapping_file(mapping_file, add={"b": "/"}, remove=["b"])
+
+
+def test_rename_missing_key(tmp_path):
+    path = tmp_path / "mapping"
+    path.write_text("alpha=/a\nbeta=/b\n", encoding="utf-8")
+
+    with pytest.raises(KeyError):
+        configreader.edit_mapping_file(str(path), rename={"ghost": "beta"})
+
+    assert path.read_text(encoding="utf-8") == "alpha=/a\nbeta=/b\n"
+    assert not list(tmp_path.glob(".mapping-*"))
+
+
+def test_edit_mapping_file_is_atomic(mapping_file, tmp_path):
+    with open(mapping_file, "a", encoding="utf-8") as file:
+        file.write("not an entry\n")
+    with open(mapping_file, encoding="utf-8") as file:
+        original = file.read()
+
+    with pytest.raises(ValueError):
+        configreader.edit_mapping_file(mapping_file, remove=["alpha"])
+
+    with open(mapping_file, encoding="utf-8") as file:
+        assert file.read() == original
+    assert not list(tmp_path.glob(".mapping-*"))
+
+
+def test_concurrent_adds(tmp_path):
+    path = str(tmp_path / ".env")
+
+    def add(index):
+        configreader.add_to_mapping_file({f"key{index}": f"/{index}"}, path)
+        configreader.edit_mapping_file(path, add={f"edit{index}": f"/{index}"})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(add, range(40)))
+
+    mapping = configreader.read_mapping_file(path)
+    assert len(mapping) == 80
+    os.remove(configreader.cache_path(path))
+    assert configreader.read_mapping_file(path) == mapping
@@ -0,0 +1,116 @@
+"""Tests for utils.daemon and the daemon mode of open"""
+
+import importlib
+import os
+import threading
+
+import pytest
+
+from utils import daemon
+
+open_script = importlib.import_module("open.open")
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "run" / "open.sock")
+
+
+@pytest.fixture
+def serve(socket_path):
+    servers = []
+
+    def start(handler):
+        server = daemon.Server(socket_path, handler)
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_request(serve, socket_path):
+    serve(lambda request: {"echo": request["name"]})
+
+    assert daemon.is_serving(socket_path)
+    assert daemon.request(socket_path, {"name": "scripts"}) == {"echo": "scripts"}
+    assert oct(os.stat(socket_path).st_mode & 0o777) == oct(0o600)
+    assert oct(os.stat(os.path.dirname(socket_path)).st_mode & 0o777) == oct(0o700)
+
+    with pytest.raises(OSError):
+        daemon.Server(socket_path, lambda request: request)
+
+
+def test_socket_directory_must_be_private(socket_path, monkeypatch):
+    os.mkdir(os.path.dirname(socket_path), 0o755)
+    with pytest.raises(PermissionError):
+        daemon.Server(socket_path, lambda request: request)
+    with pytest.raises(PermissionError):
+        daemon.request(socket_path, {})
+
+    # the peer runs as another user
+    os.chmod(os.path.dirname(socket_path), 0o700)
+    with daemon.Server(socket_path, lambda request: request) as server:
+        threading.Thread(target=server.handle_request, daemon=True).start()
+        monkeypatch.setattr(daemon, "peer_uid", lambda connection: os.getuid() + 1)
+        with pytest.raises(PermissionError):
+            daemon.request(socket_path, {})
+
+
+def test_no_server(socket_path, tmp_path):
+    assert daemon.request(socket_path, {}) is None
+
+    # left behind by a server that was killed
+    stale = daemon.Server(socket_path, lambda request: request)
+    stale.socket.close()
+    assert os.path.exists(socket_path)
+    assert daemon.request(socket_path, {}) is None
+
+    with daemon.Server(socket_path, lambda request: request):
+        assert not daemon.is_serving(str(tmp_path / "run" / "other.sock"))
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_reloads_mapping(tmp_path, monkeypatch):
+    paths_dir = tmp_path / ".env"
+    paths_dir.write_text("scripts=/home/scripts\n", encoding="utf-8")
+    monkeypatch.setattr(open_script, "INDEX_PATH", str(tmp_path / ".env.index"))
+    server = open_script.Daemon(str(paths_dir))
+
+    response = server.handle({"list": True})
+    assert response["exit_code"] == 0
+    assert "/home/scripts" in response["output"]
+
+    response = server.handle({"project_names": ["scrpits"]})
+    assert response["exit_code"] == 1
+    assert "\t* scripts\n" in response["output"]
+
+    open_script.configreader.add_to_mapping_file(
+        {"notes": "/home/notes"}, str(paths_dir)
+    )
+    response = server.handle({"project_names": ["nots"]})
+    assert "\t* notes\n" in response["output"]
+
+
+def test_forward_to_daemon(serve, socket_path, capsys):
+    parser = open_script.configure_cli_args()
+    args = parser.parse_args(["--list"])
+    assert open_script.forward_to_daemon(args, socket_path) is None
+
+    requests = []
+    serve(
+        lambda request: requests.append(request)
+        or {"output": "listed\n", "exit_code": 0}
+    )
+    assert open_script.forward_to_daemon(args, socket_path) == 0
+    assert capsys.readouterr().out == "listed\n"
+    assert requests[0]["list"]
+    # only what launching needs is sent, not secrets of the environment
+    assert set(requests[0]["env"]) <= set(open_script.LAUNCH_ENV)
+
+    # adding entries is always done by the client
+    args = parser.parse_args(["--add_entry", "scripts", "/home/scripts"])
+    assert open_script.forward_to_daemon(args, socket_path) is None
@@ -0,0 +1,58 @@
+"""Tests for utils.dir_index"""
+
+import os
+
+from utils import dir_index
+
+EXTENSIONS = (".md", ".txt", ".pdf")
+
+
+def make_files(directory, *names):
+    for name in names:
+        (directory / name).write_text(name, encoding="utf-8")
+
+
+def test_scan_stems(tmp_path):
+    make_files(tmp_path, "Git.txt", "git.md", "Docker.pdf", "notes.rst", "ÉTÉ.md")
+    (tmp_path / "folder.md").mkdir()
+
+    assert dir_index.scan_stems(str(tmp_path), EXTENSIONS) == {
+        "docker": "Docker.pdf",
+        "git": "git.md",
+        "été": "ÉTÉ.md",
+    }
+
+
+def test_read_stem_index_is_persisted(tmp_path, monkeypatch):
+    folder = tmp_path / "cheatsheets"
+    folder.mkdir()
+    make_files(folder, "git.md")
+    index_path = str(tmp_path / "index")
+    # pretend the folder was last modified a while ago
+    os.utime(folder, (0, 0))
+
+    assert dir_index.read_stem_index(str(folder), EXTENSIONS, index_path) == {
+        "git": "git.md",
+    }
+
+    # an unchanged folder isn't listed again
+    monkeypatch.setattr(dir_index, "scan_stems", None)
+    assert dir_index.read_stem_index(str(folder), EXTENSIONS, index_path) == {
+        "git": "git.md",
+    }
+    monkeypatch.undo()
+
+    make_files(folder, "docker.txt")
+    assert dir_index.read_stem_index(str(folder), EXTENSIONS, index_path) == {
+        "docker": "docker.txt",
+        "git": "git.md",
+    }
+
+
+def test_recently_modified_folder_is_not_persisted(tmp_path):
+    make_files(tmp_path, "git.md")
+    index_path = str(tmp_path.parent / f"{tmp_path.name}.index")
+
+    dir_index.read_stem_index(str(tmp_path), EXTENSIONS, index_path)
+
+    assert not os.path.exists(index_path)
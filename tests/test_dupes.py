@@ -0,0 +1,121 @@
+"""Tests for the staged duplicate finder of utils.dupes"""
+
+import importlib
+import os
+
+from utils import dupes
+
+organize = importlib.import_module("organize.organize")
+
+
+def write(path, content, mtime):
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_find_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(dupes, "PARTIAL_BYTES", 16)
+    large = b"head" + b"x" * 100 + b"tail"
+    newer = write(tmp_path / "newer.bin", large, 2000)
+    older = write(tmp_path / "older.bin", large, 1000)
+    # same head, tail and size, differs in the middle only
+    middle = write(tmp_path / "middle.bin", large.replace(b"xxx", b"xyx", 1), 500)
+    small = write(tmp_path / "small.txt", b"small", 1000)
+    small_copy = write(tmp_path / "small copy.txt", b"small", 1000)
+    write(tmp_path / "other.txt", b"other", 1000)
+    write(tmp_path / "empty", b"", 1000)
+    write(tmp_path / "empty copy", b"", 1000)
+    os.link(small, tmp_path / "z hardlink.txt")
+    os.symlink(small, tmp_path / "symlink.txt")
+    (tmp_path / "directory").mkdir()
+
+    paths = sorted(str(path) for path in tmp_path.iterdir()) + [str(tmp_path / "gone")]
+    assert dupes.find_duplicates(paths) == [[older, newer], [small_copy, small]]
+    assert middle not in dupes.find_duplicates(paths)[0]
+
+
+def test_full_hashes_on_a_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(dupes, "PARTIAL_BYTES", 4)
+    monkeypatch.setattr(dupes, "MIN_FILES_PER_POOL", 2)
+    paths = [write(tmp_path / f"{n}", b"same content", n) for n in range(3)]
+
+    assert dupes.find_duplicates(paths) == [paths]
+
+
+def test_unreadable_files_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(dupes, "PARTIAL_BYTES", 4)
+    paths = [write(tmp_path / f"{n}", b"same content", n) for n in range(3)]
+    partial_hash = dupes.partial_hash
+
+    def unreadable(path, size):
+        if path == paths[1]:
+            raise PermissionError(13, "Permission denied", path)
+        return partial_hash(path, size)
+
+    monkeypatch.setattr(dupes, "partial_hash", unreadable)
+    # truncated after being listed
+    full_hash = dupes.full_hash
+
+    def truncated(path):
+        if path == paths[2]:
+            with open(path, "wb"):
+                pass
+        return full_hash(path)
+
+    monkeypatch.setattr(dupes, "full_hash", truncated)
+    assert dupes.find_duplicates(paths) == []
+
+    monkeypatch.setattr(dupes, "full_hash", full_hash)
+    write(tmp_path / "2", b"same content", 2)
+    assert dupes.find_duplicates(paths) == [[paths[0], paths[2]]]
+
+
+def test_dupes_command(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(organize, "JOURNAL_PATH", str(tmp_path / "journal"))
+    write(tmp_path / "a.txt", b"same", 1000)
+    write(tmp_path / "b.txt", b"same", 2000)
+    write(tmp_path / "c.txt", b"different", 1000)
+
+    organize.dupes(".txt", dry_run=True, remove_copies=True)
+    assert capsys.readouterr().out.startswith("a.txt\n\tb.txt\n")
+    assert (tmp_path / "b.txt").exists()
+
+    (tmp_path / "copies").mkdir()
+    organize.dupes(".txt", move_copies_to=str(tmp_path / "copies"), debug=False)
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "c.txt", "copies"]
+    assert os.listdir(tmp_path / "copies") == ["b.txt"]
+
+
+def test_move_same_named_copies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(organize, "JOURNAL_PATH", str(tmp_path / "journal"))
+    for mtime, folder in enumerate(["a", "b", "c", "d"]):
+        (tmp_path / folder).mkdir()
+        write(tmp_path / folder / "x.jpg", b"same", 1000 + mtime)
+    # a copy of another group, with the same name too
+    write(tmp_path / "a" / "y.jpg", b"other", 1000)
+    write(tmp_path / "b" / "x (1).jpg", b"other", 2000)
+    (tmp_path / "copies").mkdir()
+    write(tmp_path / "copies" / "x.jpg", b"unrelated", 1000)
+
+    organize.dupes(
+        "*.jpg",
+        syntax="glob",
+        recursive=True,
+        move_copies_to=str(tmp_path / "copies"),
+        exclude=["copies"],
+        debug=False,
+    )
+
+    assert sorted(os.listdir(tmp_path / "copies")) == [
+        "x (1).jpg",
+        "x (2).jpg",
+        "x (3).jpg",
+        "x (4).jpg",
+        "x.jpg",
+    ]
+    assert (tmp_path / "copies" / "x.jpg").read_bytes() == b"unrelated"
+    assert sorted(os.listdir(tmp_path / "a")) == ["x.jpg", "y.jpg"]
+    assert not os.listdir(tmp_path / "c")
@@ -0,0 +1,96 @@
+"""Tests for the visits ranking of utils.frecency"""
+
+import importlib
+import os
+
+import pytest
+
+from utils import frecency
+
+open_script = importlib.import_module("open.open")
+
+DAY = 24 * 60 * 60
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def history(tmp_path):
+    return frecency.History(str(tmp_path / "history"))
+
+
+def test_ranking_blends_frequency_and_recency(history):
+    for days_ago in (30, 29, 28, 27):
+        history.record("scripts-old", NOW - days_ago * DAY)
+    history.record("scripts", NOW - DAY)
+    history.record("scratch", NOW - 2 * DAY)
+
+    ranking = history.ranking()
+    assert ranking.starting_with("scr") == ["scripts", "scratch", "scripts-old"]
+    assert ranking.starting_with("scripts-") == ["scripts-old"]
+    assert ranking.starting_with("docs") == []
+    assert ranking.visits("scripts", NOW) == pytest.approx(0.5 ** (1 / 7))
+    assert ranking.visits("docs", NOW) == 0
+
+    # enough visits outweigh older ones
+    for _ in range(4):
+        history.record("scratch", NOW)
+    assert history.ranking().starting_with("scr")[0] == "scratch"
+
+
+def test_log_is_compacted(history, monkeypatch):
+    monkeypatch.setattr(frecency, "COMPACT_SLACK_LINES", 4)
+    history.record("forgotten", NOW - 365 * DAY)
+    for days_ago in range(6):
+        history.record("scripts", NOW - days_ago * DAY)
+    # recording only appends
+    with open(history.log_path, encoding="utf-8") as file:
+        assert len(file.readlines()) == 7
+
+    visits = history.ranking(NOW).visits("scripts", NOW)
+    with open(history.log_path, encoding="utf-8") as file:
+        assert [line.split("\t")[1] for line in file] == ["scripts\n"]
+    assert history.ranking(NOW).visits("scripts", NOW) == pytest.approx(visits)
+    assert history.ranking(NOW).starting_with("f") == []
+
+
+def test_compaction_keeps_visits_recorded_meanwhile(history, monkeypatch):
+    monkeypatch.setattr(frecency, "COMPACT_SLACK_LINES", 0)
+    history.record("scripts", NOW)
+    history.record("scripts", NOW)
+    with open(history.log_path, encoding="utf-8") as file:
+        ranking = frecency.parse_log(file)
+        stat = os.fstat(file.fileno())
+    history.record("notes", NOW)
+
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    assert history._compact(ranking, key, NOW) == (ranking, key)
+    assert history.ranking(NOW).starting_with("n") == ["notes"]
+
+
+def test_open_resolves_to_opened_project(tmp_path, monkeypatch):
+    monkeypatch.setattr(open_script, "HISTORY_PATH", str(tmp_path / "history"))
+    monkeypatch.setattr(open_script, "INDEX_PATH", str(tmp_path / "index"))
+    paths = {"scripts": "/s", "scratch": "/c", "notes": "/n"}
+    history = frecency.History(open_script.HISTORY_PATH)
+
+    def resolve(name):
+        return open_script.OpenProjectCommand([name], paths)._resolve(name)
+
+    assert resolve("notes") == "notes"
+    # unopened projects are only suggested
+    assert resolve("scr") is None
+    assert resolve("ntoes") is None
+
+    history.record("scratch")
+    history.record("notes")
+    assert resolve("scr") == "scratch"
+    assert resolve("ntoes") == "notes"
+    assert resolve("nothing") is None
+
+    # short names are allowed fewer typos
+    paths.update({"db": "/d", "ui": "/u", "web": "/w"})
+    history.record("ui")
+    history.record("web")
+    assert resolve("db") == "db"
+    assert resolve("uj") is None
+    assert resolve("wbe") == "web"
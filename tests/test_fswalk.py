@@ -0,0 +1,81 @@
+"""Tests for the name matchers and the walks of utils.fswalk"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from utils import fswalk
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for path in (
+        "Report.PDF",
+        "notes.txt",
+        "docs/guide.pdf",
+        "docs/old/archive.pdf",
+        "node_modules/lib/readme.pdf",
+    ):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path, encoding="utf-8")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    ("pattern", "syntax", "case_sensitive", "expected"),
+    [
+        ("pdf", "substring", False, ["Report.PDF", "guide.pdf", "a.pdf.txt"]),
+        ("pdf", "substring", True, ["guide.pdf", "a.pdf.txt"]),
+        ("", "substring", True, ["Report.PDF", "guide.pdf", "a.pdf.txt"]),
+        ("*.pdf", "glob", False, ["Report.PDF", "guide.pdf"]),
+        ("r[e]*", "glob", True, []),
+        (r"^(report|a)\.", "regex", False, ["Report.PDF", "a.pdf.txt"]),
+    ],
+)
+def test_compile_pattern(pattern, syntax, case_sensitive, expected):
+    matches = fswalk.compile_pattern(pattern, syntax, case_sensitive)
+    names = ["Report.PDF", "guide.pdf", "a.pdf.txt"]
+    assert [name for name in names if matches(name)] == expected
+
+
+def test_compile_pattern_errors():
+    with pytest.raises(ValueError):
+        fswalk.compile_pattern("*", "shell")
+    with pytest.raises(ValueError):
+        fswalk.compile_pattern("(", "regex")
+
+
+def test_walk(tree):
+    matches = fswalk.compile_pattern("*.pdf", "glob")
+    assert list(fswalk.walk(str(tree), matches)) == ["Report.PDF"]
+
+    found = fswalk.walk(
+        str(tree), matches, recursive=True, exclude=["node_modules"], workers=3
+    )
+    assert sorted(found) == sorted(
+        ["Report.PDF", "docs/guide.pdf", os.path.join("docs", "old", "archive.pdf")]
+    )
+
+    found = fswalk.walk(str(tree), matches, recursive=True, max_depth=1)
+    assert sorted(found) == ["Report.PDF", "docs/guide.pdf"]
+
+
+def test_walk_stops_early(tree, monkeypatch):
+    monkeypatch.setattr(fswalk, "RESULTS_SIZE", 1)
+    monkeypatch.setattr(fswalk, "BATCH_SIZE", 1)
+    for number in range(100):
+        (tree / "docs" / f"{number}.md").write_text("", encoding="utf-8")
+
+    threads = threading.active_count()
+    walk = fswalk.walk(str(tree), recursive=True, workers=2)
+    first = next(walk)
+    walk.close()
+
+    assert (tree / first).exists()
+    # the workers blocked on the full queue give up
+    deadline = time.monotonic() + 5
+    while threading.active_count() > threads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == threads
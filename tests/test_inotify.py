@@ -0,0 +1,134 @@
+"""Tests for the debounced inotify batches of utils.inotify and the watch
+mode of organize"""
+
+import importlib
+import os
+import sys
+import threading
+
+import pytest
+
+from utils import inotify
+
+organize = importlib.import_module("organize.organize")
+
+pytestmark = pytest.mark.skipif(sys.platform != "linux", reason="inotify is Linux only")
+
+
+def test_batches(tmp_path):
+    batches = inotify.batches(str(tmp_path), debounce=0.2)
+
+    def burst():
+        for number in range(100):
+            (tmp_path / f"{number}.txt").write_text("written", encoding="utf-8")
+        os.rename(tmp_path / "0.txt", tmp_path / "renamed.txt")
+        (tmp_path / "1.txt").unlink()
+
+    threading.Timer(0.1, burst).start()
+    # a single batch, without the files gone since
+    assert next(batches) == [f"{number}.txt" for number in range(2, 100)] + [
+        "renamed.txt"
+    ]
+
+    for path in tmp_path.iterdir():
+        path.unlink()
+    threading.Timer(0.1, tmp_path.rmdir).start()
+    assert next(batches, None) is None
+
+
+def test_apply_rules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(organize, "JOURNAL_PATH", str(tmp_path / "journal"))
+    (tmp_path / "pdfs").mkdir()
+    for name in ["a.pdf", "b.PDF", "c.part", "d.pdf.part", "e.txt"]:
+        (tmp_path / name).write_text(name, encoding="utf-8")
+
+    rules = organize.compile_rules(
+        [("*.part", "remove"), ("*.pdf", "move", str(tmp_path / "pdfs"))],
+        "glob",
+        case_sensitive=False,
+    )
+    organize.apply_rules(rules, sorted(os.listdir(tmp_path)), debug=False)
+
+    assert sorted(os.listdir(tmp_path)) == ["e.txt", "pdfs"]
+    assert sorted(os.listdir(tmp_path / "pdfs")) == ["a.pdf", "b.PDF"]
+    with pytest.raises(ValueError):
+        organize.compile_rules([("*.pdf", "move")], "glob", False)
+
+
+def test_short_timeouts_wait(monkeypatch):
+    timeouts = []
+
+    class Poll:
+        def register(self, *_):
+            pass
+
+        def poll(self, timeout):
+            timeouts.append(timeout)
+            return []
+
+    monkeypatch.setattr(inotify.select, "poll", Poll)
+    with inotify.Inotify() as watcher:
+        for timeout in (0.0004, 0, 0.0105, None):
+            assert watcher.read(timeout) == []
+    assert timeouts == [1, 1, 11, None]
+
+
+def test_failed_batch_keeps_watching(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(organize, "JOURNAL_PATH", str(tmp_path / "journal"))
+    (tmp_path / "pdfs").mkdir()
+    rules = organize.compile_rules(
+        [("*.pdf", "move", str(tmp_path / "pdfs"))], "glob", case_sensitive=False
+    )
+    apply = organize.bulkops.apply
+
+    def failing_apply(operation):
+        if operation.source.endswith("a.pdf"):
+            raise OSError(5, "Input/output error")
+        apply(operation)
+
+    monkeypatch.setattr(organize.bulkops, "apply", failing_apply)
+    for name in ["a.pdf", "b.pdf"]:
+        (tmp_path / name).write_text(name, encoding="utf-8")
+        organize.apply_rules(rules, [name], debug=False)
+
+    # the second batch ran with its own journal
+    assert sorted(os.listdir(tmp_path / "pdfs")) == ["b.pdf"]
+    assert os.path.exists(tmp_path / "journal")
+    assert "Call resume() to retry" in capsys.readouterr().out
+
+    monkeypatch.setattr(organize.bulkops, "apply", apply)
+    organize.resume()
+    assert sorted(os.listdir(tmp_path / "pdfs")) == ["a.pdf", "b.pdf"]
+    assert not os.path.exists(tmp_path / "journal")
+
+
+def test_conflicts_only_skip_their_names(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(organize, "JOURNAL_PATH", str(tmp_path / "journal"))
+    (tmp_path / "pdfs").mkdir()
+    (tmp_path / "pdfs" / "a.pdf").write_text("taken", encoding="utf-8")
+    for name in ["a.pdf", "b.pdf"]:
+        (tmp_path / name).write_text(name, encoding="utf-8")
+    rules = organize.compile_rules(
+        [("*.pdf", "move", str(tmp_path / "pdfs"))], "glob", case_sensitive=False
+    )
+
+    organize.apply_rules(rules, ["a.pdf", "b.pdf"], debug=False)
+
+    assert sorted(os.listdir(tmp_path / "pdfs")) == ["a.pdf", "b.pdf"]
+    assert (tmp_path / "a.pdf").exists()
+    assert "Skipped" in capsys.readouterr().out
+
+
+def test_existing_directories_are_left_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(organize, "JOURNAL_PATH", str(tmp_path / "journal"))
+    monkeypatch.setattr(organize.inotify, "batches", lambda *_: iter([]))
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "file.txt").write_text("file", encoding="utf-8")
+
+    organize.watch([("*", "remove")], debug=False)
+
+    assert os.listdir(tmp_path) == ["folder"]
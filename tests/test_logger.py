@@ -0,0 +1,146 @@
+"""Tests for the queued logging of utils.logger"""
+
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from utils.logger import CustomLogger, DefaultSettings
+
+
+@pytest.fixture
+def make_logger(tmp_path, request):
+    created = []
+
+    def make(**settings):
+        custom_logger = CustomLogger(
+            log_dir=tmp_path / "logs",
+            settings=DefaultSettings(**settings),
+        )
+        logger = custom_logger.get_logger(f"{request.node.name}{len(created)}")
+        logger.propagate = False
+        created.append((custom_logger, logger))
+        return custom_logger, logger
+
+    yield make
+    for custom_logger, logger in created:
+        custom_logger.stop()
+        for handler in logger.handlers:
+            handler.close()
+        logger.handlers.clear()
+
+
+def log_lines(tmp_path):
+    (log_file,) = (tmp_path / "logs").iterdir()
+    return log_file.read_text(encoding="utf-8").splitlines()
+
+
+def test_queued_writes_in_background(make_logger, tmp_path):
+    custom_logger, logger = make_logger(queued=True)
+
+    logger.debug("first %s", "record")
+    assert custom_logger.listener is not None
+    custom_logger.flush()
+    assert log_lines(tmp_path)[-1].endswith("| first record")
+
+    # still logging after a flush
+    logger.info("second")
+    custom_logger.stop()
+    assert log_lines(tmp_path)[-1].endswith("| second")
+
+
+@pytest.mark.parametrize("queued", [False, True])
+def test_json_output(make_logger, tmp_path, queued):
+    custom_logger, logger = make_logger(queued=queued, json=True)
+
+    logger.warning("ñandú %d", 3)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    custom_logger.stop()
+
+    entries = [json.loads(line) for line in log_lines(tmp_path)]
+    assert entries[0]["message"] == "ñandú 3"
+    assert entries[0]["level"] == "WARNING"
+    assert entries[1]["level"] == "ERROR"
+    assert entries[1]["message"] == "failed"
+    assert "ValueError: boom" in entries[1]["exception"]
+
+
+def test_queued_exception_in_plain_format(make_logger, tmp_path):
+    custom_logger, logger = make_logger(queued=True)
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed %s", "badly")
+    custom_logger.stop()
+
+    lines = log_lines(tmp_path)
+    assert lines[0].endswith("| failed badly")
+    assert lines[-1] == "ValueError: boom"
+
+
+def test_console_is_written_in_order(make_logger, capsys):
+    custom_logger, logger = make_logger(queued=True)
+
+    print("before")
+    logger.info("logged")
+    print("after")
+
+    assert custom_logger.listener is not None
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "before"
+    assert lines[1].endswith("| logged\x1b[0m")
+    assert lines[2] == "after"
+
+
+def test_levels_are_respected(make_logger, tmp_path):
+    custom_logger, logger = make_logger(queued=True)
+    logger.setLevel(logging.WARNING)
+
+    logger.info("hidden")
+    logger.error("shown")
+    custom_logger.stop()
+
+    assert [line.rsplit("| ", 1)[1] for line in log_lines(tmp_path)] == ["shown"]
+
+
+# the listener thread is the point of the test
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded")
+def test_forked_child_writes_its_records(make_logger, tmp_path):
+    custom_logger, logger = make_logger(queued=True)
+    logger.info("parent")
+    assert custom_logger.listener is not None
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logger.info("child")
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    custom_logger.stop()
+
+    assert sorted(line.rsplit("| ", 1)[1] for line in log_lines(tmp_path)) == [
+        "child",
+        "parent",
+    ]
+
+
+def log_in_worker(log_dir):
+    logger = CustomLogger(log_dir=log_dir).get_logger("worker")
+    logger.propagate = False
+    logger.info("worker")
+
+
+def test_worker_process_writes_its_records(tmp_path):
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        executor.submit(log_in_worker, tmp_path / "logs").result()
+
+    assert log_lines(tmp_path)[-1].endswith("| worker")
@@ -0,0 +1,103 @@
+"""Tests for opening several projects at once with open"""
+
+import importlib
+import sys
+import time
+
+open_script = importlib.import_module("open.open")
+
+
+def python_launch(name, code):
+    return open_script.Launch(name, name, [sys.executable, "-c", code], None)
+
+
+def test_run_launches_concurrently():
+    launches = [
+        python_launch("slow", "import time; time.sleep(0.5)"),
+        python_launch("slower", "import time; time.sleep(0.6)"),
+        python_launch("failing", "raise SystemExit(3)"),
+        open_script.Launch("missing", "missing", ["/nonexistent/code"], None),
+        python_launch("hanging", "import time; time.sleep(60)"),
+    ]
+
+    start = time.monotonic()
+    errors = open_script.run_launches(launches, timeout=1)
+
+    assert time.monotonic() - start < 3
+    assert errors[:3] == [None, None, "exited with status 3"]
+    assert "No such file" in errors[3]
+    assert errors[4] == "timed out after 1s"
+
+
+def test_open_several_projects(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(open_script, "HISTORY_PATH", str(tmp_path / "history"))
+    monkeypatch.setattr(open_script, "INDEX_PATH", str(tmp_path / "index"))
+    opened = tmp_path / "opened"
+    code = tmp_path / "bin" / "code"
+    code.parent.mkdir()
+    code.write_text(
+        f'#!/bin/sh\n[ "$1" = /web ] && exit 1\necho "$1" >> {opened}\n',
+        encoding="utf-8",
+    )
+    code.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{code.parent}:/usr/bin:/bin")
+    paths = {"api": "/api", "web": "/web", "infra": "/infra"}
+
+    command = open_script.OpenProjectCommand(
+        ["API", "web", "infra", "nothing", "api"], paths, keep_terminal=True
+    )
+    assert command.execute() == 1
+
+    assert sorted(opened.read_text(encoding="utf-8").split()) == ["/api", "/infra"]
+    output = capsys.readouterr().out
+    assert "There's no project registered for the name: nothing" in output
+    assert "Failed to open: web (exited with status 1)" in output
+    ranking = open_script.frecency.History(open_script.HISTORY_PATH).ranking()
+    assert sorted(ranking.weights) == ["api", "infra"]
+
+
+def test_subsequence_suggestions(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(open_script, "HISTORY_PATH", str(tmp_path / "history"))
+    monkeypatch.setattr(open_script, "INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.setenv("SFM_ALGORITHM", "subsequence")
+    paths = {"project-manager": "/pm", "programmer": "/p", "notes": "/notes"}
+
+    command = open_script.OpenProjectCommand(["pmgr"], paths, keep_terminal=True)
+    assert command.execute() == 1
+    assert capsys.readouterr().out.endswith("Maybe you meant:\n\t* project-manager\n")
+
+    # nothing contains the chars in order, the closest name is suggested
+    command = open_script.OpenProjectCommand(["nodes"], paths, keep_terminal=True)
+    assert command.execute() == 1
+    assert capsys.readouterr().out.endswith("\t* notes\n")
+
+
+def test_subsequence_opens_clear_matches_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(open_script, "HISTORY_PATH", str(tmp_path / "history"))
+    monkeypatch.setattr(open_script, "INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.setenv("SFM_ALGORITHM", "subsequence")
+    paths = {"project-manager": "/pm", "programmer": "/p", "notes": "/notes"}
+    history = open_script.frecency.History(open_script.HISTORY_PATH)
+    for name in paths:
+        history.record(name)
+    command = open_script.OpenProjectCommand([], paths, keep_terminal=True)
+
+    # the only name containing the chars
+    assert command._resolve("pmgr") == "project-manager"
+    # scores clearly above the other name containing them
+    assert command._resolve("pgr") == "programmer"
+    # both score about the same: suggested, not opened
+    assert command._resolve("pmr") is None
+
+    # note-sync scores best but was never opened
+    monkeypatch.setattr(open_script, "HISTORY_PATH", str(tmp_path / "notes"))
+    history = open_script.frecency.History(open_script.HISTORY_PATH)
+    paths = {"notes": "/n", "my-notes": "/m", "note-sync": "/s"}
+    history.record("my-notes")
+    command = open_script.OpenProjectCommand([], paths, keep_terminal=True)
+    assert command._resolve("nots") is None
+    # a typo away, whatever the scores
+    history.record("notes")
+    history.record("notes")
+    command = open_script.OpenProjectCommand([], paths, keep_terminal=True)
+    assert command._resolve("nots") == "notes"
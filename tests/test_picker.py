@@ -0,0 +1,116 @@
+"""Tests for the interactive picker, driven without a terminal"""
+
+import curses
+
+from utils import picker
+from utils.string_fuzzy_matcher import PrefixSearch
+
+WORDS = ["project-manager", "programmer", "open", "organize", "cheatsheet"]
+
+
+def test_picker_keys():
+    state = picker.Picker(PrefixSearch(WORDS, 0), "Pro")
+    state.update(3)
+    assert [match.word for match in state.matches] == ["programmer", "project-manager"]
+
+    for key in "j":
+        assert not state.handle(key)
+    state.update(3)
+    assert [match.word for match in state.matches] == ["project-manager"]
+
+    # deleting goes back to the earlier rows
+    state.handle(curses.KEY_BACKSPACE)
+    state.update(3)
+    state.handle(curses.KEY_DOWN)
+    assert state.search.query == "pro"
+    assert state.handle("\n")
+    assert state.chosen == "project-manager"
+
+
+def test_picker_cancel():
+    state = picker.Picker(PrefixSearch(WORDS), "x")
+    state.handle("\x15")
+    state.update(10)
+    assert [match.word for match in state.matches] == WORDS
+    assert state.handle("\x1b")
+    assert state.chosen is None
+
+
+def test_retype():
+    search = PrefixSearch(WORDS, 2)
+    picker.retype(search, "orga")
+    levels = search.levels[:3]
+    picker.retype(search, "open")
+    assert search.query == "open"
+    # the rows of the shared prefix are kept
+    assert search.levels[:2] == levels[:2]
+    assert search.best(1)[0].word == "open"
+
+
+class FakeScreen:
+    """The curses window calls of the picker, returning the given keys, None
+    standing for a pause in the typing"""
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.timeouts = []
+        self.queries = []
+
+    def get_wch(self):
+        key = self.keys.pop(0)
+        if key is None:
+            raise curses.error("no input")
+        return key
+
+    def timeout(self, delay):
+        self.timeouts.append(delay)
+
+    def getmaxyx(self):
+        return 10, 40
+
+    def addnstr(self, row, _, text, *__):
+        if row == 0:
+            self.queries.append(text)
+
+    def addstr(self, *_):
+        pass
+
+    def erase(self):
+        pass
+
+    def clrtoeol(self):
+        pass
+
+    def move(self, *_):
+        pass
+
+    def refresh(self):
+        pass
+
+
+class CountingSearch(PrefixSearch):
+    rankings = 0
+
+    def best(self, num_results=10):
+        self.rankings += 1
+        return super().best(num_results)
+
+
+def test_slow_search_is_debounced(monkeypatch):
+    monkeypatch.setattr(curses, "set_escdelay", lambda _: None)
+
+    # a fast search ranks the keys read together without waiting
+    search = CountingSearch(WORDS)
+    screen = FakeScreen(["o", "p", None, "e", None, "\n"])
+    assert picker._run(screen, picker.Picker(search), "> ") == "open"
+    assert search.rankings == 3
+    assert picker.DEBOUNCE_MS not in screen.timeouts
+
+    # a slow one echoes the keys and ranks once the typing pauses
+    monkeypatch.setattr(picker, "FRAME_BUDGET", -1)
+    search = CountingSearch(WORDS)
+    screen = FakeScreen(["o", "p", "e", None, "\n"])
+    assert picker._run(screen, picker.Picker(search), "> ") == "open"
+    assert search.rankings == 2
+    assert picker.DEBOUNCE_MS in screen.timeouts
+    assert screen.queries[-3:] == ["> op", "> ope", "> ope"]
@@ -2,12 +2,29 @@
 Tests for the sfm module's find_most_similar_words function.
 """
 
+import random
+import time
+import types
+
 import pytest
 
-from utils.sfm import sfm as fsm
+from utils import sfm as sfm_module
+from utils import string_fuzzy_matcher
+from utils.sfm import sfm
+
+# The selected backend plus the pure-Python fallback, which is otherwise
+# untested when the Rust extension is installed
+BACKENDS = list(
+    {backend.__name__: backend for backend in (sfm, string_fuzzy_matcher)}.values(),
+)
+
+
+@pytest.fixture(name="fsm", params=BACKENDS, ids=lambda backend: backend.__name__)
+def fixture_fsm(request):
+    return request.param
 
 
-def test_find_most_similar_words():
+def test_find_most_similar_words(fsm):
     """Test that find_most_similar_words returns expected results."""
     corpus = [
         "hello",
@@ -49,7 +66,7 @@ def test_find_most_similar_words():
     assert len(limited_results) <= 3
 
 
-def test_edge_cases():
+def test_edge_cases(fsm):
     """Test edge cases for find_most_similar_words."""
     corpus = ["hello", "world", "test"]
 
@@ -63,5 +80,342 @@ def test_edge_cases():
     assert exact_match[0].distance == 0
 
 
+def test_max_distance(fsm):
+    """Test that max_distance discards words that are too far away."""
+    corpus = ["hello", "help", "world", "hell", "yellow"]
+
+    bounded = fsm.find_most_similar_words("helo", corpus, len(corpus), 1)
+    assert [match.word for match in bounded] == ["hello", "help", "hell"]
+    assert all(match.distance <= 1 for match in bounded)
+
+    # Ties keep the corpus order and only num_results are returned
+    limited = fsm.find_most_similar_words("helo", corpus, 2, 3)
+    assert [match.word for match in limited] == ["hello", "help"]
+
+    assert fsm.damerau_levenshtein_distance("hello", "world") == 4
+    assert fsm.damerau_levenshtein_distance("hello", "world", 2) == 3
+    assert fsm.damerau_levenshtein_distance("hello", "hlelo", 1) == 1
+
+
+def test_corpus_search(fsm):
+    """Test that a Corpus returns the same results as find_most_similar_words."""
+    rng = random.Random(0)
+    words = list(
+        dict.fromkeys(
+            "".join(rng.choices("abcde", k=rng.randint(0, 8))) for _ in range(200)
+        ),
+    )
+    corpus = fsm.Corpus(words)
+    assert len(corpus) == len(words)
+    assert corpus[3] == words[3]
+
+    for query in ("", "abc", "edcba", "aaaaaaaa"):
+        for max_distance in (None, 0, 2):
+            expected = fsm.find_most_similar_words(query, words, 5, max_distance)
+            found = corpus.search(query, 5, max_distance)
+            assert [tuple(match) for match in found] == [
+                tuple(match) for match in expected
+            ]
+            assert corpus.search_indices(query, 5, max_distance) == [
+                (words.index(match.word), match.distance) for match in expected
+            ]
+
+
+@pytest.mark.parametrize("min_vectorized_pairs", [0, 1 << 30])
+def test_search_batch(fsm, monkeypatch, min_vectorized_pairs):
+    """Test that batch searches return the same results as one search per word,
+    with the vectorized engine and without it."""
+    monkeypatch.setattr(
+        string_fuzzy_matcher, "MIN_VECTORIZED_PAIRS", min_vectorized_pairs
+    )
+    rng = random.Random(1)
+    words = ["".join(rng.choices("abcé€", k=rng.randint(0, 20))) for _ in range(300)]
+    queries = ["", "a" * 64, "b" * 70, "ab€", "unknown", *rng.sample(words, 10)]
+    corpus = fsm.Corpus(words)
+
+    for max_distance in (None, 0, 3):
+        expected = [
+            [tuple(match) for match in corpus.search(query, 4, max_distance)]
+            for query in queries
+        ]
+        found = corpus.search_batch(queries, 4, max_distance)
+        assert [[tuple(match) for match in matches] for matches in found] == expected
+        found = fsm.find_most_similar_words_batch(queries, words, 4, max_distance)
+        assert [[tuple(match) for match in matches] for matches in found] == expected
+
+
+def prefix_ranking(query, words, max_distance):
+    """PrefixSearch ranking, computed from scratch"""
+    ranked = []
+    for index, word in enumerate(words):
+        distance = min(
+            string_fuzzy_matcher.damerau_levenshtein_distance_dp(query, word[:end])
+            for end in range(len(word) + 1)
+        )
+        if max_distance is None or distance <= max_distance:
+            ranked.append((distance if query else 0, len(word) if query else 0, index))
+    return [(words[index], distance) for distance, _, index in sorted(ranked)]
+
+
+@pytest.mark.parametrize("vectorized", [False, True])
+@pytest.mark.parametrize("alphabet", ["ab", "abcd", "aé€😀"])
+def test_prefix_search(alphabet, vectorized):
+    """Test that a query typed and deleted char by char ranks the words as
+    computing every distance again would."""
+    rng = random.Random(alphabet)
+    words = ["".join(rng.choices(alphabet, k=rng.randint(0, 12))) for _ in range(40)]
+    for max_distance in (None, 0, 2):
+        if vectorized:
+            vectorized_distance = pytest.importorskip("utils.vectorized_distance")
+            search = vectorized_distance.PrefixSearch(
+                words, vectorized_distance.EncodedBuckets(words), max_distance
+            )
+        else:
+            search = string_fuzzy_matcher.PrefixSearch(words, max_distance)
+        for _ in range(20):
+            if search.query and rng.random() < 0.3:
+                search.pop()
+            else:
+                search.push(rng.choice(alphabet + "z"))
+            expected = prefix_ranking(search.query, words, max_distance)
+            assert len(search) == len(expected)
+            assert [tuple(match) for match in search.best(5)] == expected[:5]
+
+
+def test_prefix_search_needs_numpy_for_large_corpora(monkeypatch):
+    """Test the pure-Python prefix search is refused past its size limit."""
+    monkeypatch.setattr(string_fuzzy_matcher, "MAX_PYTHON_PREFIX_WORDS", 2)
+    corpus = string_fuzzy_matcher.Corpus(["open", "organize", "cheatsheet"])
+    with pytest.raises(ImportError):
+        corpus.prefix_search(3)
+
+    monkeypatch.setattr(string_fuzzy_matcher, "MAX_PYTHON_PREFIX_WORDS", 3)
+    assert isinstance(corpus.prefix_search(3), string_fuzzy_matcher.PrefixSearch)
+
+
+@pytest.mark.parametrize("alphabet", ["ab", "abcd", "aé€😀"])
+def test_bit_parallel_matches_dp(alphabet):
+    """Test the bit-parallel engine against the dynamic programming one."""
+    rng = random.Random(alphabet)
+    for _ in range(2000):
+        str1 = "".join(rng.choices(alphabet, k=rng.randint(0, 80)))
+        str2 = "".join(rng.choices(alphabet, k=rng.randint(0, 80)))
+        max_distance = rng.choice([None, 0, 1, 3, 10])
+        assert string_fuzzy_matcher.damerau_levenshtein_distance(
+            str1,
+            str2,
+            max_distance,
+        ) == string_fuzzy_matcher.damerau_levenshtein_distance_dp(
+            str1,
+            str2,
+            max_distance,
+        )
+
+
+def test_subsequence_matches(fsm):
+    """Test the subsequence scores favor boundaries, prefixes and tight matches."""
+    corpus = ["programmer", "project-manager", "pm", "PackageManager", "open-pm"]
+
+    matches = fsm.find_best_subsequence_matches("pmgr", corpus, 10)
+    assert [match.word for match in matches] == ["PackageManager", "project-manager"]
+    assert matches[0].score == matches[1].score
+
+    matches = fsm.find_best_subsequence_matches("PM", corpus, 3)
+    assert [tuple(match) for match in matches] == [
+        ("pm", matches[0].score),
+        ("open-pm", matches[0].score),
+        ("PackageManager", matches[2].score),
+    ]
+    assert matches[0].score > matches[2].score
+
+    assert fsm.find_best_subsequence_matches("xyz", corpus, 10) == []
+    assert len(fsm.find_best_subsequence_matches("", corpus, 2)) == 2
+    corpus_matches = fsm.Corpus(corpus).subsequence_search("pmgr", 10)
+    assert [tuple(match) for match in corpus_matches] == [
+        tuple(match) for match in fsm.find_best_subsequence_matches("pmgr", corpus)
+    ]
+
+
+@pytest.mark.parametrize("alphabet", ["abcd", "aB-1é", "aé€😀"])
+def test_char_mask_prefilter(alphabet):
+    """Test the char masks never rule out a word containing the query."""
+    rng = random.Random(alphabet)
+    for _ in range(2000):
+        word = "".join(rng.choices(alphabet, k=rng.randint(0, 12)))
+        query = "".join(rng.choices(alphabet, k=rng.randint(0, 4)))
+        folded = "".join(map(string_fuzzy_matcher.fold, query))
+        score = string_fuzzy_matcher.subsequence_score(folded, word)
+        mask = string_fuzzy_matcher.char_mask(folded)
+        if score is not None:
+            assert mask & ~string_fuzzy_matcher.char_mask(word) == 0
+
+
+def test_backend_selection(monkeypatch):
+    """Test the backends are selected by argument or with SFM_BACKEND."""
+    python = sfm_module.backend("python")
+    assert (
+        python.find_most_similar_words is string_fuzzy_matcher.find_most_similar_words
+    )
+
+    monkeypatch.setenv("SFM_BACKEND", "python")
+    assert sfm.__name__ == "utils.string_fuzzy_matcher"
+    monkeypatch.setenv("SFM_BACKEND", "unknown")
+    with pytest.raises(ValueError):
+        sfm.find_most_similar_words("a", ["a"], 1)
+    with pytest.raises(ValueError):
+        sfm_module.backend("unknown")
+
+
+def test_calibration(tmp_path):
+    """Test calls are routed to the fastest backend of their size bucket."""
+    calls = []
+
+    def fake_backend(name, overhead, seconds_per_word):
+        def find_most_similar_words(obj_word, word_list, num_results):
+            calls.append(name)
+            time.sleep(overhead + seconds_per_word * len(word_list))
+            return [obj_word, num_results]
+
+        return types.SimpleNamespace(find_most_similar_words=find_most_similar_words)
+
+    # the extension pays a fixed cost per call, the fallback one per word
+    backends = {
+        "extension": fake_backend("extension", 0.004, 0),
+        "fallback": fake_backend("fallback", 0, 0.0001),
+    }
+    path = str(tmp_path / "calibration")
+    calibration = sfm_module.Calibration(backends, path)
+
+    found = calibration.call("find_most_similar_words", "a", iter(["a"] * 200), 3)
+    assert found == ["a", 3]
+    # timed on the sample, then called once on the fastest
+    assert len(calls) == 2 * sfm_module.CALIBRATION_ROUNDS + 1
+    assert calls[-1] == "extension"
+    calibration.call("find_most_similar_words", "a", ["a"] * 2, num_results=3)
+
+    # persisted, later calls only run the fastest backend for their size
+    calls.clear()
+    calibration = sfm_module.Calibration(backends, path)
+    calibration.call(
+        "find_most_similar_words", "b", word_list=["b"] * 150, num_results=1
+    )
+    calibration.call("find_most_similar_words", "b", ["b"] * 3, 1)
+    assert calls == ["extension", "fallback"]
+
+
+def test_calibration_sample(tmp_path, monkeypatch):
+    """Test calibrating times the backends at the smallest size of the
+    bucket, and passes the num_results default the Rust extension requires."""
+    sizes = []
+
+    def find_most_similar_words(obj_word, word_list, num_results):
+        sizes.append(len(word_list))
+        return [obj_word, num_results]
+
+    backends = {
+        "only": types.SimpleNamespace(find_most_similar_words=find_most_similar_words)
+    }
+    calibration = sfm_module.Calibration(backends, str(tmp_path / "calibration"))
+
+    assert calibration.call("find_most_similar_words", "a", ["a"] * 100) == ["a", 10]
+    assert sizes == [64] * sfm_module.CALIBRATION_ROUNDS + [100]
+
+    # long calls are only timed once
+    sizes.clear()
+    monkeypatch.setattr(sfm_module, "CALIBRATION_LONG_CALL", -1)
+    found = calibration.call("find_most_similar_words", "a", word_list=["a"] * 300)
+    assert found == ["a", 10]
+    assert sizes == [256, 300]
+
+
+@pytest.mark.parametrize("max_distance", [None, 0, 3])
+def test_rust_parallel_matches_serial(max_distance):
+    """Test parallel scans return the same matches, in the same order, as
+    serial ones, whatever the number of threads."""
+    rust = pytest.importorskip("fuzzy_string_matcher")
+    rng = random.Random(max_distance)
+    # a small alphabet, so that many words tie and their order is checked
+    words = ["".join(rng.choices("abc", k=rng.randint(0, 8))) for _ in range(5000)]
+    queries = ["".join(rng.choices("abc", k=rng.randint(0, 8))) for _ in range(5)]
+    serial = {"parallel_threshold": 10**9}
+    settings = [
+        {"parallel_threshold": 0},
+        {"parallel_threshold": 0, "num_threads": 1},
+        {"parallel_threshold": 0, "num_threads": 4},
+    ]
+
+    def as_tuples(matches):
+        return [tuple(match) for match in matches]
+
+    expected = [
+        as_tuples(
+            rust.find_most_similar_words(query, words, 50, max_distance, **serial)
+        )
+        for query in queries
+    ]
+    for options in settings:
+        for query, matches in zip(queries, expected):
+            assert (
+                as_tuples(
+                    rust.find_most_similar_words(
+                        query, words, 50, max_distance, **options
+                    )
+                )
+                == matches
+            )
+            assert (
+                as_tuples(rust.Corpus(words, **options).search(query, 50, max_distance))
+                == matches
+            )
+        batch = rust.find_most_similar_words_batch(
+            queries, words, 50, max_distance, **options
+        )
+        assert [as_tuples(matches) for matches in batch] == expected
+
+
+@pytest.mark.parametrize("alphabet", ["abcd", "aé€😀", "ab-é"])
+def test_rust_matches_python(alphabet):
+    """Test the Rust kernel against the Python implementation."""
+    rust = pytest.importorskip("fuzzy_string_matcher")
+    rng = random.Random(alphabet)
+    for _ in range(200):
+        words = [
+            "".join(rng.choices(alphabet, k=rng.randint(0, 30))) for _ in range(50)
+        ]
+        query = "".join(rng.choices(alphabet, k=rng.randint(0, 30)))
+        max_distance = rng.choice([None, 0, 2, 5])
+        for word in words:
+            assert rust.damerau_levenshtein_distance(
+                query,
+                word,
+                max_distance,
+            ) == string_fuzzy_matcher.damerau_levenshtein_distance_dp(
+                query,
+                word,
+                max_distance,
+            )
+        assert [
+            tuple(match)
+            for match in rust.find_most_similar_words(query, words, 10, max_distance)
+        ] == [
+            tuple(match)
+            for match in string_fuzzy_matcher.find_most_similar_words(
+                query,
+                words,
+                10,
+                max_distance,
+            )
+        ]
+        assert [
+            tuple(match)
+            for match in rust.find_best_subsequence_matches(query[:4], words)
+        ] == [
+            tuple(match)
+            for match in string_fuzzy_matcher.find_best_subsequence_matches(
+                query[:4], words
+            )
+        ]
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,30 @@
+"""Startup budget of the open and cheatsheet entry points"""
+
+import os
+
+import pytest
+
+from benchmarks import startup
+
+# Generous by default since CI machines are slow, tighten it locally
+BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", startup.BUDGET_MS * 4))
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   utils.sfm\n"
+        "import time:      3365 |      26217 | open.open\n"
+    )
+    assert startup.parse_importtime(stderr) == {"utils.sfm": 0.12, "open.open": 26.217}
+
+
+@pytest.mark.parametrize("module", startup.ENTRY_POINTS)
+def test_entry_point_startup(module, tmp_path):
+    result = startup.measure(module, tmp_path, runs=3)
+
+    assert result.milliseconds <= BUDGET_MS
+    for lazy_module in startup.LAZY_MODULES:
+        assert lazy_module not in result.imported
+    # logging handlers are only created once something is logged
+    assert not (tmp_path / "logs").exists()
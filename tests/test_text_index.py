@@ -0,0 +1,98 @@
+"""Tests for the cheatsheet full-text index of utils.text_index"""
+
+import os
+
+import pytest
+
+from utils import text_index
+
+EXTENSIONS = (".md", ".txt")
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / "cheatsheets"
+    path.mkdir()
+    (path / "git.md").write_text(
+        "# Git\n\ngit rebase -i HEAD~3\ngit push --force-with-lease\n",
+        encoding="utf-8",
+    )
+    (path / "tar.txt").write_text(
+        "tar -xzf archive.tar.gz\ntar -czf archive.tar.gz folder\n",
+        encoding="utf-8",
+    )
+    (path / "notes.rst").write_text("git rebase\n", encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def index(folder, tmp_path):
+    return text_index.TextIndex(str(folder), str(tmp_path / "index"), EXTENSIONS)
+
+
+def test_line_tokens():
+    assert text_index.line_tokens("git push --force-with-lease.") == {
+        "git",
+        "push",
+        "--force-with-lease",
+        "force",
+        "with",
+        "lease",
+    }
+
+
+def test_search(index):
+    assert index.update() == 2
+
+    (result,) = index.search("--force")
+    assert result.name == "git.md"
+    assert result.snippets == [(4, "git push --force-with-lease")]
+
+    (result,) = index.search("ARCHIVE -czf")
+    assert result.name == "tar.txt"
+    assert result.snippets == [
+        (1, "tar -xzf archive.tar.gz"),
+        (2, "tar -czf archive.tar.gz folder"),
+    ]
+    # the lines matching most words are preferred
+    (result,) = index.search("ARCHIVE -czf", num_snippets=1)
+    assert result.snippets == [(2, "tar -czf archive.tar.gz folder")]
+
+    assert not index.search("rebase tar")
+    assert not index.search("")
+
+
+def test_update_is_incremental(index, folder, monkeypatch):
+    index.update()
+
+    extracted = []
+    extract_lines = text_index.extract_lines
+    monkeypatch.setattr(
+        text_index,
+        "extract_lines",
+        lambda path: extracted.append(os.path.basename(path)) or extract_lines(path),
+    )
+    assert index.update() == 0
+
+    (folder / "git.md").write_text("git stash pop\n", encoding="utf-8")
+    (folder / "tar.txt").unlink()
+    assert index.update() == 2
+    assert extracted == ["git.md"]
+
+    assert not index.search("rebase")
+    assert not index.search("archive")
+    assert [result.name for result in index.search("stash")] == ["git.md"]
+
+
+def test_segments_are_merged(index, folder, monkeypatch):
+    monkeypatch.setattr(text_index, "MAX_SEGMENTS", 2)
+    index.update()
+
+    for round_number in range(6):
+        (folder / "tar.txt").write_text(f"tar round{round_number}\n", encoding="utf-8")
+        index.update()
+        assert len(index._read_meta()["segments"]) <= 2
+
+    assert [result.name for result in index.search("round5")] == ["tar.txt"]
+    assert not index.search("round4")
+    assert [result.name for result in index.search("rebase")] == ["git.md"]
@@ -0,0 +1,68 @@
+"""
+Tests for the BK-tree index over fuzzy matching corpora.
+"""
+
+import random
+import string
+
+import pytest
+
+from utils.sfm import sfm as fsm
+from utils.word_index import BKTree, load_or_build
+
+
+def random_corpus(seed: int, size: int) -> list[str]:
+    rng = random.Random(seed)
+    words = {
+        "".join(rng.choices(string.ascii_lowercase[:6], k=rng.randint(0, 8)))
+        for _ in range(size)
+    }
+    return sorted(words)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_search_matches_linear_scan(seed):
+    """Test that the index returns the same results as a full scan."""
+    corpus = random_corpus(seed, 300)
+    tree = BKTree(corpus)
+    rng = random.Random(seed)
+
+    for _ in range(30):
+        query = "".join(rng.choices(string.ascii_lowercase[:6], k=rng.randint(0, 8)))
+        expected = fsm.find_most_similar_words(query, corpus, len(corpus))
+
+        for max_distance in (0, 1, 3):
+            within = [
+                (w.word, w.distance) for w in expected if w.distance <= max_distance
+            ]
+            found = tree.search(query, max_distance, 5)
+            assert [(w.word, w.distance) for w in found] == within[:5]
+
+        nearest = tree.search(query, num_results=3)
+        assert [(w.word, w.distance) for w in nearest] == [
+            (w.word, w.distance) for w in expected[:3]
+        ]
+
+
+def test_load_or_build_persists_index(tmp_path):
+    """Test that the index is reused while the corpus is unchanged."""
+    index_path = str(tmp_path / ".env.index")
+    corpus = ["hello", "world", "help"]
+
+    tree = load_or_build(index_path, corpus)
+    assert tree.search("helo", 1, 3)[0].word == "hello"
+
+    reloaded = BKTree.load(index_path, tree.fingerprint)
+    assert reloaded is not None
+    assert reloaded.words == tree.words
+    assert reloaded.children == tree.children
+
+    rebuilt = load_or_build(index_path, [*corpus, "yellow"])
+    assert len(rebuilt) == 4
+    assert BKTree.load(index_path, tree.fingerprint) is None
+
+
+def test_empty_index():
+    """Test searching an index without words."""
+    assert not BKTree().search("test")
+    assert not BKTree(["test"]).search("test", num_results=0)
@@ -0,0 +1,476 @@
+import contextlib
+import errno
+import functools
+import json
+import os
+import shutil
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+# Threads applying the operations, renames and unlinks release the GIL
+DEFAULT_WORKERS = 8
+
+# Completed operations are appended to the journal in batches of this many,
+# instead of one write per file
+JOURNAL_BATCH = 512
+
+JOURNAL_VERSION = 1
+
+# Operations handed to a thread at once, a task per file would cost more
+# than a rename
+CHUNK_SIZE = 64
+
+# Bytes copied per system call across filesystems
+COPY_CHUNK = 1 << 30
+
+# copy_file_range and sendfile errors meaning the kernel can't copy between
+# these files, so the copy falls back to the next method
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+# renameat2 flag failing with EEXIST instead of replacing the destination
+RENAME_NOREPLACE = 1
+_AT_FDCWD = -100
+# renameat2 errors meaning the kernel or filesystem doesn't support the flag
+_NOREPLACE_UNSUPPORTED = {errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+# link errors meaning the source can't be hard linked (e.g. directories)
+_LINK_UNSUPPORTED = {errno.EPERM, errno.EOPNOTSUPP, errno.EMLINK, errno.ENOSYS}
+
+
+class Operation(NamedTuple):
+    kind: str  # "move" or "remove"
+    source: str
+    destination: str | None = None
+
+    def __str__(self) -> str:
+        if self.kind == "move":
+            return f"move {self.source} -> {self.destination}"
+        return f"remove {self.source}"
+
+
+class Plan:
+    """Operations to run, built beforehand so they can be inspected as a dry
+    run. Operations that can't run are left out of the plan as conflicts"""
+
+    def __init__(self, operations: list[Operation], conflicts: list[str]):
+        self.operations = operations
+        self.conflicts = conflicts
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def __repr__(self) -> str:
+        return (
+            f"Plan({len(self.operations)} operations, {len(self.conflicts)} conflicts)"
+        )
+
+    def __str__(self) -> str:
+        lines = [str(operation) for operation in self.operations]
+        lines += [f"conflict: {conflict}" for conflict in self.conflicts]
+        return "\n".join(lines)
+
+
+class Report(NamedTuple):
+    done: int
+    # operations that can be retried with resume, or rolled back
+    failed: list[tuple[Operation, str]]
+    # operations rollback can't undo, which no retry helps
+    lost: tuple[tuple[Operation, str], ...] = ()
+
+
+def plan_move(
+    paths: Iterable[str], destination: str, rename_taken: bool = False
+) -> Plan:
+    """Plans moving each path right into the destination directory. Paths
+    inside another of the directories moved go along with it, so they aren't
+    planned on their own.
+    Args:
+        paths (Iterable[str]): files or directories to move
+        destination (str): existing directory to move them into
+        rename_taken (bool, optional): move a path whose name is taken in the
+            destination, or by an earlier path, as "name (1).ext", "name
+            (2).ext"... instead of reporting a conflict. Defaults to False.
+    Returns:
+        Plan: the moves, with absolute paths so it can run from anywhere
+    """
+    destination = os.path.abspath(destination)
+    try:
+        # a single listing instead of checking every target
+        existing = set(os.listdir(destination))
+    except (NotADirectoryError, FileNotFoundError):
+        return Plan([], [f"{destination} isn't a directory"])
+
+    sources = list(_absolute(paths))
+    moved = set(sources)
+    operations: list[Operation] = []
+    conflicts: list[str] = []
+    # the source planned to each name, and the names existing or planned
+    planned: dict[str, str] = {}
+    taken = set(existing)
+    for source in sources:
+        if _has_ancestor_in(source, moved):
+            continue
+        name = os.path.basename(source)
+        target = os.path.join(destination, name)
+        if source == target:
+            continue
+        if name in taken:
+            if not rename_taken:
+                conflicts.append(
+                    f"{target} already exists, not moving {source}"
+                    if name in existing
+                    else f"{source} and {planned[name]} would both be moved to {target}"
+                )
+                continue
+            name = _free_name(name, taken)
+            target = os.path.join(destination, name)
+        taken.add(name)
+        planned[name] = source
+        operations.append(Operation("move", source, target))
+    return Plan(operations, conflicts)
+
+
+def _has_ancestor_in(path: str, paths: set[str]) -> bool:
+    parent = os.path.dirname(path)
+    while parent != path:
+        if parent in paths:
+            return True
+        path, parent = parent, os.path.dirname(parent)
+    return False
+
+
+def _free_name(name: str, taken: set[str]) -> str:
+    """name numbered as "name (1).ext", "name (2).ext"... the first one not
+    taken"""
+    stem, extension = os.path.splitext(name)
+    number = 1
+    while f"{stem} ({number}){extension}" in taken:
+        number += 1
+    return f"{stem} ({number}){extension}"
+
+
+def plan_remove(paths: Iterable[str]) -> Plan:
+    """Plans removing each file"""
+    return Plan([Operation("remove", source) for source in _absolute(paths)], [])
+
+
+def _absolute(paths: Iterable[str]) -> Iterator[str]:
+    # os.path.abspath gets the current directory again for every path
+    cwd = os.getcwd()
+    for path in paths:
+        yield os.path.normpath(os.path.join(cwd, path))
+
+
+def _copy_file_range(source_fd: int, destination_fd: int, offset: int) -> int:
+    # pylint: disable-next=no-member
+    return os.copy_file_range(source_fd, destination_fd, COPY_CHUNK, offset, offset)
+
+
+def _sendfile(source_fd: int, destination_fd: int, offset: int) -> int:
+    return os.sendfile(destination_fd, source_fd, offset, COPY_CHUNK)
+
+
+# copy_file_range can share the blocks (e.g. on btrfs or XFS), it's missing
+# on some platforms and Python builds
+_KERNEL_COPIES = [_sendfile]
+if hasattr(os, "copy_file_range"):
+    _KERNEL_COPIES.insert(0, _copy_file_range)
+
+
+def _copy_range(source_fd: int, destination_fd: int) -> None:
+    """Copies source_fd into destination_fd inside the kernel, only pairs of
+    files the kernel can't copy between are copied in userspace"""
+    for kernel_copy in _KERNEL_COPIES:
+        offset = 0
+        try:
+            while copied := kernel_copy(source_fd, destination_fd, offset):
+                offset += copied
+            return
+        except OSError as e:
+            # after a partial copy the error is real
+            if offset or e.errno not in _UNSUPPORTED:
+                raise
+
+    with (
+        open(source_fd, "rb", closefd=False) as source,
+        open(destination_fd, "wb", closefd=False) as destination,
+    ):
+        shutil.copyfileobj(source, destination)
+
+
+def copy2(source: str, destination: str) -> str:
+    """shutil.copy2 with the contents copied by the kernel, never replacing
+    an existing destination"""
+    with open(source, "rb") as source_file, open(destination, "xb") as dest_file:
+        _copy_range(source_file.fileno(), dest_file.fileno())
+    shutil.copystat(source, destination)
+    return destination
+
+
+@functools.cache
+def _renameat2():
+    """libc's renameat2, None where it's missing (not Linux, old glibc)"""
+    # Only imported when needed, to keep startup fast
+    # pylint: disable-next=import-outside-toplevel
+    import ctypes
+
+    try:
+        function = ctypes.CDLL(None, use_errno=True).renameat2
+    except (AttributeError, OSError, TypeError):
+        return None
+    function.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    ]
+    return function
+
+
+def _exists_error(destination: str) -> FileExistsError:
+    return FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), destination)
+
+
+def rename_noreplace(source: str, destination: str) -> None:
+    """os.rename that fails with FileExistsError instead of replacing the
+    destination, atomically with renameat2 where the kernel supports it.
+    Otherwise files are hard linked then unlinked, and only what can't be
+    linked is checked right before the rename"""
+    renameat2 = _renameat2()
+    if renameat2 is not None:
+        # pylint: disable-next=import-outside-toplevel
+        import ctypes
+
+        if (
+            renameat2(
+                _AT_FDCWD,
+                os.fsencode(source),
+                _AT_FDCWD,
+                os.fsencode(destination),
+                RENAME_NOREPLACE,
+            )
+            == 0
+        ):
+            return
+        error = ctypes.get_errno()
+        if error not in _NOREPLACE_UNSUPPORTED:
+            raise OSError(error, os.strerror(error), source, None, destination)
+
+    try:
+        os.link(source, destination, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+        if os.path.lexists(destination):
+            raise _exists_error(destination) from None
+        os.rename(source, destination)
+    else:
+        os.unlink(source)
+
+
+def apply(operation: Operation) -> None:
+    if operation.kind == "move":
+        assert operation.destination is not None
+        try:
+            # the plan checked the destination is free, but it may have been
+            # created since
+            rename_noreplace(operation.source, operation.destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # a kernel copy then a removal across filesystems. shutil.move
+            # would move into an existing directory
+            if os.path.lexists(operation.destination):
+                raise _exists_error(operation.destination) from None
+            shutil.move(operation.source, operation.destination, copy_function=copy2)
+    else:
+        os.remove(operation.source)
+
+
+def is_applied(operation: Operation) -> bool:
+    """Whether the operation ran, judging by the files"""
+    if os.path.lexists(operation.source):
+        return False
+    return operation.kind == "remove" or os.path.lexists(operation.destination or "")
+
+
+class Journal:
+    """A plan, then the indexes of its completed operations, appended in
+    batches as JSON lines"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def start(self, plan: Plan) -> None:
+        # the plan must survive a crash, the batches don't have to be synced
+        # since the operations they list are recognized by their files
+        self._append({"version": JOURNAL_VERSION, "operations": plan.operations})
+        with open(self.path, "rb") as file:
+            os.fsync(file.fileno())
+
+    def record(self, done: list[int]) -> None:
+        if done:
+            self._append(done)
+
+    def load(self) -> tuple[Plan, set[int]]:
+        """The plan of the journal and its completed operations.
+        Raises:
+            FileNotFoundError: if there's no journal
+            ValueError: if the journal wasn't written by this version
+        """
+        with open(self.path, encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != JOURNAL_VERSION:
+                raise ValueError(f"Unsupported journal version: {self.path}")
+            done: set[int] = set()
+            for line in file:
+                try:
+                    done.update(json.loads(line))
+                except ValueError:
+                    # the batch being written when the run was interrupted
+                    break
+        operations = [Operation(*operation) for operation in header["operations"]]
+        return Plan(operations, []), done
+
+    def remove(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    def _append(self, entry: object) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+
+
+def _apply_chunk(chunk: list[tuple[int, Operation]]) -> list[str | None]:
+    """Applies the operations, returning why each one failed or None"""
+    errors: list[str | None] = []
+    for _, operation in chunk:
+        try:
+            apply(operation)
+            errors.append(None)
+        except OSError as e:
+            errors.append(str(e))
+    return errors
+
+
+def _chunks(
+    operations: Iterable[tuple[int, Operation]],
+) -> Iterator[list[tuple[int, Operation]]]:
+    chunk = []
+    for item in operations:
+        chunk.append(item)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _execute(
+    operations: Iterable[tuple[int, Operation]],
+    journal: Journal | None,
+    workers: int,
+) -> Report:
+    """Applies the operations on a pool of threads in chunks, journaling the
+    indexes of the completed ones. Only a few chunks per thread are queued at
+    once"""
+    done = 0
+    failed: list[tuple[Operation, str]] = []
+    batch: list[int] = []
+    in_flight: dict[Future[list[str | None]], list[tuple[int, Operation]]] = {}
+
+    def collect(futures: Iterable[Future[list[str | None]]]) -> None:
+        nonlocal done, batch
+        for future in futures:
+            chunk = in_flight.pop(future)
+            for (index, operation), error in zip(chunk, future.result()):
+                if error is not None:
+                    failed.append((operation, error))
+                    continue
+                done += 1
+                batch.append(index)
+            if journal is not None and len(batch) >= JOURNAL_BATCH:
+                journal.record(batch)
+                batch = []
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk in _chunks(operations):
+                if len(in_flight) >= 2 * workers:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                in_flight[pool.submit(_apply_chunk, chunk)] = chunk
+            collect(list(in_flight))
+    finally:
+        if journal is not None:
+            journal.record(batch)
+    return Report(done, failed)
+
+
+def _pending(plan: Plan, done: set[int]) -> Iterator[tuple[int, Operation]]:
+    for index, operation in enumerate(plan.operations):
+        if index not in done:
+            yield index, operation
+
+
+def run(plan: Plan, journal_path: str, workers: int = DEFAULT_WORKERS) -> Report:
+    """Runs the plan, journaled at journal_path while it runs. The journal is
+    kept when operations failed or the run was interrupted, see resume and
+    rollback.
+    Raises:
+        ValueError: if the plan has conflicts
+        FileExistsError: if a previous run wasn't resumed or rolled back
+    """
+    if plan.conflicts:
+        raise ValueError("The plan has conflicts:\n" + "\n".join(plan.conflicts))
+    journal = Journal(journal_path)
+    if journal.exists():
+        raise FileExistsError(
+            f"An interrupted run is journaled at {journal_path}, resume it or roll it back"
+        )
+
+    journal.start(plan)
+    report = _execute(_pending(plan, set()), journal, workers)
+    if not report.failed:
+        journal.remove()
+    return report
+
+
+def resume(journal_path: str, workers: int = DEFAULT_WORKERS) -> Report:
+    """Runs the operations of the journaled run that didn't complete.
+    Operations that completed after the last journaled batch are recognized
+    by their files, and aren't run again"""
+    journal = Journal(journal_path)
+    plan, done = journal.load()
+    done.update(
+        index for index, operation in _pending(plan, done) if is_applied(operation)
+    )
+    report = _execute(_pending(plan, done), journal, workers)
+    if not report.failed:
+        journal.remove()
+    return Report(len(done) + report.done, report.failed)
+
+
+def rollback(journal_path: str, workers: int = DEFAULT_WORKERS) -> Report:
+    """Moves back the files the journaled run moved. The journal is kept when
+    some of them couldn't be moved back, so rollback can be retried. Removed
+    files can't be restored, they're reported as lost"""
+    journal = Journal(journal_path)
+    plan, done = journal.load()
+    moved = [
+        (index, Operation("move", operation.destination or "", operation.source))
+        for index, operation in enumerate(plan.operations)
+        if operation.kind == "move" and is_applied(operation)
+    ]
+    removed = tuple(
+        (operation, "removed files can't be restored")
+        for index, operation in enumerate(plan.operations)
+        if operation.kind == "remove" and (index in done or is_applied(operation))
+    )
+    report = _execute(moved, None, workers)
+    if not report.failed:
+        journal.remove()
+    return Report(report.done, report.failed, removed)
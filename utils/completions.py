@@ -0,0 +1,57 @@
+"""Completion caches: flat text files the shell completion functions
+(completions/scripts.bash and completions/scripts.zsh) read directly, so
+completing a name doesn't start Python.
+
+The first line is # and the path of the source the names come from (a
+mapping file, or a folder), the rest one name per line. The shell functions
+only ask the script to write the cache again when it's missing or older than
+its source, otherwise the scripts keep the caches that exist up to date
+whenever they see their source change.
+"""
+
+import contextlib
+import os
+from collections.abc import Iterable
+
+# The completion cache of a file is stored in its path + suffix
+SUFFIX = ".completions"
+
+
+def cache_path(path: str) -> str:
+    return path + SUFFIX
+
+
+def write(cache: str, source: str, names: Iterable[str]) -> None:
+    """Atomically replaces the completion cache.
+    Args:
+        cache (str): path to the completion cache
+        source (str): path of the file or folder the names come from, the
+            cache is stale once it's newer
+        names (Iterable[str]): names to complete, the ones spanning several
+            lines are left out
+    """
+    # only imported when writing, to keep startup fast
+    import tempfile  # pylint: disable=import-outside-toplevel
+
+    lines = [f"#{os.path.abspath(source)}\n"]
+    lines += [f"{name}\n" for name in names if "\n" not in name]
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(cache) or ".", prefix=".completions-"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.writelines(lines)
+        os.replace(tmp_path, cache)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def refresh(cache: str, source: str, names: Iterable[str]) -> None:
+    """Same as write, but only when the cache exists: caches are created by
+    setup.sh for the scripts with completions, the other sources don't get
+    one. A read-only location only costs the shell asking for it again"""
+    if os.path.exists(cache):
+        with contextlib.suppress(OSError):
+            write(cache, source, names)
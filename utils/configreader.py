@@ -1,56 +1,339 @@
-from collections.abc import Iterable
+import contextlib
+import os
+import time
+import zlib
+from collections.abc import Iterable, Iterator, Mapping
 from pathlib import Path
 
+from utils import completions
+from utils.filelock import locked
+from utils.sidecar import read_sidecar, write_sidecar
 
-def read_mapping_file(abs_path: str) -> dict[str, Path]:
-    """Reads a mapping file in the format of key=value and returns a dict.
+# The parsed mapping is cached next to the mapping file, in abs_path + suffix
+CACHE_SUFFIX = ".cache"
+
+# Edits hold an exclusive flock on abs_path + suffix
+LOCK_SUFFIX = ".lock"
+
+# A mapping file modified this recently may still change within the same mtime
+# tick, so its cache is validated against its contents too, see
+# dir_index.RACY_SECONDS
+RACY_SECONDS = 2
+
+# (mtime in nanoseconds, size, inode, crc32) of the contents a cache was built
+# from, with a 0 crc32 once the file is older than RACY_SECONDS
+SourceKey = tuple[int, int, int, int]
+
+
+class PathMapping(Mapping[str, Path]):
+    """Read-only mapping over the entries of a mapping file, backed by its
+    compiled table. Single keys are looked up directly in the table, the
+    entries are only parsed when the whole mapping is iterated, and the Path
+    of an entry is only built when it's accessed"""
+
+    def __init__(self, table: str):
+        self.table = table
+        self._entries: dict[str, str] | None = None
+
+    @property
+    def entries(self) -> dict[str, str]:
+        if self._entries is None:
+            self._entries = parse_mapping(self.table)
+        return self._entries
+
+    def get_value(self, key: str) -> str | None:
+        """Raw value of key, without parsing the table"""
+        if self._entries is not None:
+            return self._entries.get(key)
+        if "=" in key or "\n" in key:
+            return None
+        # the last entry of a repeated key wins, as when parsing
+        start = self.table.rfind(f"\n{key}=")
+        if start == -1:
+            return None
+        start += len(key) + 2
+        return self.table[start : self.table.index("\n", start)]
+
+    def __getitem__(self, key: str) -> Path:
+        value = self.get_value(key)
+        if value is None:
+            raise KeyError(key)
+        return Path(value)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.get_value(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def parse_mapping(text: str) -> dict[str, str]:
+    """Parses the key=value lines of a mapping file. Values may contain =,
+    lines starting with # or empty lines are ignored and the last entry of a
+    repeated key wins"""
+    mapping = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        key, value = line.split("=", 1)
+        mapping[key] = value
+    return mapping
+
+
+def compile_mapping(text: str) -> str:
+    """Compiles the contents of a mapping file into a table with one stripped
+    key=value entry per line, between newlines, without comments nor empty
+    lines. Keys can then be found with a plain substring search"""
+    entries = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line == "" or line.startswith("#"):
+            continue
+        if "=" not in line:
+            raise ValueError(f"Invalid mapping line: {line!r}")
+        entries.append(line)
+    return "\n" + "".join(f"{entry}\n" for entry in entries)
+
+
+def cache_path(abs_path: str) -> str:
+    return abs_path + CACHE_SUFFIX
+
+
+def _source_key(file_stat: os.stat_result, checksum: int) -> SourceKey:
+    return (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino, checksum)
+
+
+def _is_racy(file_stat: os.stat_result) -> bool:
+    return time.time_ns() - file_stat.st_mtime_ns <= RACY_SECONDS * 1_000_000_000
+
+
+def _write_cache(abs_path: str, key: SourceKey, table: str) -> None:
+    # a read-only location only costs compiling the file next time
+    with contextlib.suppress(OSError):
+        write_sidecar(cache_path(abs_path), key, table)
+
+
+def _refresh_completions(abs_path: str, table: str) -> None:
+    # the table changes along with the keys, keep their completions in sync
+    completions.refresh(completions.cache_path(abs_path), abs_path, PathMapping(table))
+
+
+def _read_table(abs_path: str) -> tuple[SourceKey, str]:
+    """Compiled table of the mapping file and the key identifying its
+    contents, from the cache when it was built from the same contents. The
+    file is only read when it's racy (see RACY_SECONDS) or the cache is stale"""
+    with open(abs_path, "rb") as file:
+        file_stat = os.fstat(file.fileno())
+        data = file.read() if _is_racy(file_stat) else None
+        key = _source_key(file_stat, 0 if data is None else zlib.crc32(data))
+        table = read_sidecar(cache_path(abs_path), key)
+        if table is not None:
+            return key, table
+        if data is None:
+            data = file.read()
+
+    table = compile_mapping(data.decode("utf-8"))
+    _write_cache(abs_path, key, table)
+    # the edits refresh the completions themselves, only a file edited by hand
+    # since they were written has to
+    with contextlib.suppress(OSError):
+        completions_stat = os.stat(completions.cache_path(abs_path))
+        if completions_stat.st_mtime_ns <= file_stat.st_mtime_ns:
+            _refresh_completions(abs_path, table)
+    return key, table
+
+
+def read_mapping_file(abs_path: str) -> PathMapping:
+    """Reads a mapping file in the format of key=value and returns a mapping.
     lines starting with # or empty lines are ignored
     Args:
         abs_path (str): absolute path to the file
     Returns:
-        dict[str, Path]: a dict with key as the key and value as the value
+        PathMapping: a mapping with key as the key and value as the value
     """
-    mapping = {}
-    with open(abs_path, encoding="utf-8") as file:
-        for line in file:
-            line = line.strip()
-            if line == "" or line.startswith("#"):
-                continue
-            key, value = line.split("=")
-            mapping[key] = Path(value)
-    return mapping
+    _, table = _read_table(abs_path)
+    return PathMapping(table)
+
+
+def lookup_mapping_file(abs_path: str, key: str) -> Path | None:
+    """Value of a single key of a mapping file, found in its compiled table
+    without parsing the rest of the entries.
+    Args:
+        abs_path (str): absolute path to the file
+        key (str): key to look up
+    Returns:
+        Path | None: the value of the key, or None if it isn't in the file
+    """
+    value = read_mapping_file(abs_path).get_value(key)
+    return None if value is None else Path(value)
 
 
 def add_to_mapping_file(new_entries: dict[str, str], abs_path: str) -> None:
     """Adds new entries to the mapping file.
-    This means appending to the mapping file.
+    This means appending to the mapping file, the cache is updated with the
+    new entries instead of being rebuilt. To replace existing entries, or to
+    apply many edits at once, use edit_mapping_file.
     Args:
         new_entries (Dict[str, str]): new key value pairs to add to the mapping
             file
         abs_path (str): absolute path to the mapping file
     """
-    with open(abs_path, "a", encoding="utf-8") as file:
-        file.writelines(f"{key}={value}\n" for key, value in new_entries.items())
+    with locked(abs_path + LOCK_SUFFIX):
+        try:
+            (_, size, _, _), table = _read_table(abs_path)
+        except FileNotFoundError:
+            size, table = 0, "\n"
+
+        text = "".join(f"{key}={value}\n" for key, value in new_entries.items())
+        table += compile_mapping(text)[1:]
+        if size > 0 and not _ends_with_newline(abs_path):
+            # otherwise the first new entry would be glued to the last line
+            text = "\n" + text
+        data = text.encode("utf-8")
+
+        with open(abs_path, "a+b") as file:
+            file.write(data)
+            file.flush()
+            file_stat = os.fstat(file.fileno())
+            # the file was just modified, so its key has the checksum
+            file.seek(0)
+            checksum = zlib.crc32(file.read())
+
+        # When the file was also changed without the lock, the size won't match and the cache will
+        # be rebuilt on the next read
+        if file_stat.st_size == size + len(data):
+            _write_cache(abs_path, _source_key(file_stat, checksum), table)
+            _refresh_completions(abs_path, table)
+
+
+def _ends_with_newline(abs_path: str) -> bool:
+    with open(abs_path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
 
 
 def remove_form_mapping_file(
     to_remove_entries: Iterable[str],
     abs_path: str,
 ) -> None:
-    """Removes entries from the mapping file. This implies reading the file,
-    removing the entries and writing the file again.
+    """Removes entries from the mapping file, see edit_mapping_file.
     Args:
-        to_remove_entries (Iterable[str]): _description_
-        abs_path (str): _description_
+        to_remove_entries (Iterable[str]): keys of the entries to remove
+        abs_path (str): absolute path to the mapping file
+    """
+    edit_mapping_file(abs_path, remove=to_remove_entries)
+
+
+# pylint: disable-next=too-many-locals
+def edit_mapping_file(
+    abs_path: str,
+    add: Mapping[str, str] | None = None,
+    remove: Iterable[str] = (),
+    rename: Mapping[str, str] | None = None,
+) -> None:
+    """Applies many edits to the mapping file in a single pass.
+    The file is streamed line by line into a temporary file which then
+    atomically replaces it, so readers see either the old or the new mapping
+    and a crash leaves the original untouched. Edits hold an advisory lock, so
+    concurrent edits are applied one after the other.
+    Comments and empty lines are kept, as is the order of the entries.
+    Args:
+        abs_path (str): absolute path to the mapping file, created if missing
+        add (Mapping[str, str] | None, optional): entries to set. Existing
+            entries of these keys are replaced in place, the rest are
+            appended. Defaults to None.
+        remove (Iterable[str], optional): keys to remove. Defaults to ().
+        rename (Mapping[str, str] | None, optional): old key to new key.
+            Existing entries of the new keys are replaced. Defaults to None.
+    Raises:
+        ValueError: if a key is edited more than once, or the file has a line
+            that isn't a comment nor a key=value entry
+        KeyError: if a renamed key has no entry, the file is then untouched
     """
-    with open(abs_path, encoding="utf-8") as file:
-        lines = file.readlines()
-    with open(abs_path, "w", encoding="utf-8") as file:
-        for line in lines:
-            line = line.strip()
-            if line.startswith("#") or line == "":
-                file.write(line)
-            else:
-                key = line.split("=")[0]
-                if key not in to_remove_entries:
-                    file.write(line)
+    add = dict(add or {})
+    remove = set(remove)
+    rename = dict(rename or {})
+    edited = [add.keys(), remove, rename.keys(), set(rename.values())]
+    if sum(map(len, edited)) != len(set().union(*edited)):
+        raise ValueError("Each key can only be added, removed or renamed once")
+
+    # only imported when editing, to keep startup fast
+    import shutil  # pylint: disable=import-outside-toplevel
+    import tempfile  # pylint: disable=import-outside-toplevel
+
+    with locked(abs_path + LOCK_SUFFIX):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(abs_path) or ".",
+            prefix=".mapping-",
+        )
+        try:
+            checksum = 0
+            table = ["\n"]
+            with os.fdopen(fd, "wb") as file, contextlib.ExitStack() as stack:
+                lines: Iterable[str] = ()
+                with contextlib.suppress(FileNotFoundError):
+                    lines = stack.enter_context(open(abs_path, encoding="utf-8"))
+                for line, entry in _edited_lines(lines, add, remove, rename):
+                    data = f"{line}\n".encode()
+                    file.write(data)
+                    checksum = zlib.crc32(data, checksum)
+                    if entry is not None:
+                        table.append(f"{entry}\n")
+                file.flush()
+                os.fsync(file.fileno())
+            with contextlib.suppress(FileNotFoundError):
+                shutil.copymode(abs_path, tmp_path)
+            os.replace(tmp_path, abs_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+
+        compiled = "".join(table)
+        _write_cache(abs_path, _source_key(os.stat(abs_path), checksum), compiled)
+        _refresh_completions(abs_path, compiled)
+
+
+def _edited_lines(
+    lines: Iterable[str],
+    add: dict[str, str],
+    remove: set[str],
+    rename: dict[str, str],
+) -> Iterator[tuple[str, str | None]]:
+    """Lines of the edited mapping file, without newline, each with its
+    compiled table entry (None for comments and empty lines). Raises KeyError
+    once all lines are read if a renamed key had no entry, as the entries of
+    the new keys were dropped"""
+    pending = dict(add)
+    replaced = set(rename.values())
+    renamed: set[str] = set()
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if stripped == "" or stripped.startswith("#"):
+            yield line, None
+            continue
+
+        if "=" not in stripped:
+            raise ValueError(f"Invalid mapping line: {stripped!r}")
+        key, value = stripped.split("=", 1)
+        if key in remove or key in replaced:
+            continue
+        if key in rename:
+            renamed.add(key)
+            line = stripped = f"{rename[key]}={value}"
+        elif key in add:
+            if key not in pending:
+                # already replaced by a previous entry of the key
+                continue
+            line = stripped = f"{key}={pending.pop(key)}"
+        yield line, stripped
+
+    if missing := rename.keys() - renamed:
+        raise KeyError(", ".join(sorted(missing)))
+    for key, value in pending.items():
+        yield f"{key}={value}", f"{key}={value}"
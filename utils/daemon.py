@@ -0,0 +1,131 @@
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+from collections.abc import Callable
+from typing import Any
+
+# How long a client waits for the server to answer
+TIMEOUT = 30.0
+
+
+def private_directory(path: str) -> str:
+    """Creates the directory holding a socket, readable only by the current
+    user. An existing one is only accepted if it belongs to the current user
+    and no one else can access it, so other users can neither take the socket
+    path first nor connect to it.
+    Raises:
+        PermissionError: if the directory isn't private to the current user
+    """
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(path, 0o700)
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(f"{path} is not a directory private to this user")
+    return path
+
+
+def peer_uid(connection: socket.socket) -> int:
+    """User id of the process at the other end of a Unix socket"""
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+def request(socket_path: str, payload: dict[str, Any]) -> dict[str, Any] | None:
+    """Sends a request to the server listening on socket_path.
+    Args:
+        socket_path (str): path of the server Unix socket
+        payload (dict[str, Any]): JSON serializable request
+    Returns:
+        dict[str, Any] | None: the server response, or None when no server is
+            listening, so the caller can handle the request itself
+    Raises:
+        PermissionError: if the socket directory isn't private or the server
+            runs as another user
+    """
+    private_directory(os.path.dirname(socket_path))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(TIMEOUT)
+        try:
+            client.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        if peer_uid(client) != os.getuid():
+            raise PermissionError(f"{socket_path} is served by another user")
+        client.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile("rb") as response:
+            return json.loads(response.read())
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "Server"
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            # a client checking whether the server is up
+            return
+        payload = json.loads(line)
+        response = self.server.handle_request_payload(payload)
+        self.wfile.write(json.dumps(response).encode("utf-8"))
+
+
+class Server(socketserver.UnixStreamServer):
+    """Serves one JSON request per connection on a Unix socket, one at a time.
+    A socket left behind by a server that died is replaced, but starting a
+    second server on the same socket fails. The socket lives in a directory
+    private to the user (see private_directory), and connections from other
+    users are dropped"""
+
+    def __init__(
+        self,
+        socket_path: str,
+        handler: Callable[[dict[str, Any]], dict[str, Any]],
+    ):
+        self.socket_path = socket_path
+        self.handler = handler
+        private_directory(os.path.dirname(socket_path))
+        if os.path.exists(socket_path):
+            if is_serving(socket_path):
+                raise OSError(f"A server is already listening on {socket_path}")
+            os.unlink(socket_path)
+        # Requests run commands on behalf of the user, no one else may send
+        # them, so the socket is created without permissions for others
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    # pylint: disable-next=redefined-outer-name
+    def verify_request(self, request: Any, client_address: Any) -> bool:
+        return peer_uid(request) == os.getuid()
+
+    def handle_request_payload(self, payload: dict[str, Any]) -> dict[str, Any]:
+        return self.handler(payload)
+
+    def server_close(self) -> None:
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+
+
+def is_serving(socket_path: str) -> bool:
+    """Whether a server is listening on socket_path"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
@@ -0,0 +1,70 @@
+import contextlib
+import os
+import time
+from collections.abc import Sequence
+
+from utils import completions
+from utils.sidecar import read_sidecar, write_sidecar
+
+# A directory modified this recently may still change within the same mtime
+# tick (coarse on network filesystems), so its index isn't persisted
+RACY_SECONDS = 2
+
+
+def fold(stem: str) -> str:
+    """Key under which a stem is indexed and looked up"""
+    return stem.casefold()
+
+
+def scan_stems(directory: str, extensions: Sequence[str]) -> dict[str, str]:
+    """Lists the directory once, indexing its files with one of the extensions
+    by their folded stem.
+    Args:
+        directory (str): directory to list
+        extensions (Sequence[str]): suffixes of the files to index (e.g.
+            ".md"), when several files share a stem the one whose extension
+            comes first wins
+    Returns:
+        dict[str, str]: file name by folded stem, sorted by file name
+    """
+    priorities = {extension: index for index, extension in enumerate(extensions)}
+    best: dict[str, tuple[int, str]] = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            stem, extension = os.path.splitext(entry.name)
+            priority = priorities.get(extension)
+            if priority is None or not entry.is_file():
+                continue
+            key = fold(stem)
+            if key not in best or priority < best[key][0]:
+                best[key] = (priority, entry.name)
+    return {key: name for key, (_, name) in sorted(best.items(), key=lambda x: x[1][1])}
+
+
+def stems(index: dict[str, str]) -> list[str]:
+    """Stems of the file names of an index, as the files are named"""
+    return [os.path.splitext(name)[0] for name in index.values()]
+
+
+def read_stem_index(
+    directory: str,
+    extensions: Sequence[str],
+    index_path: str,
+) -> dict[str, str]:
+    """Same as scan_stems, but persisted at index_path and keyed by the
+    directory mtime, so the directory is only listed again after files were
+    added, removed or renamed in it. The completion cache of index_path is
+    refreshed whenever it is, see utils.completions"""
+    mtime_ns = os.stat(directory).st_mtime_ns
+    key = (os.path.abspath(directory), tuple(extensions), mtime_ns)
+    index = read_sidecar(index_path, key)
+    if index is not None:
+        return index
+
+    index = scan_stems(directory, extensions)
+    completions.refresh(completions.cache_path(index_path), directory, stems(index))
+    if time.time_ns() - mtime_ns > RACY_SECONDS * 1_000_000_000:
+        # a read-only location only costs listing the directory next time
+        with contextlib.suppress(OSError):
+            write_sidecar(index_path, key, index)
+    return index
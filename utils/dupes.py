@@ -0,0 +1,162 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import stat
+from collections import defaultdict
+from collections.abc import Callable, Hashable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# Bytes hashed at each end of a file before hashing it whole, files that
+# differ usually already differ there
+PARTIAL_BYTES = 64 * 1024
+
+# Full hashes are computed in a process pool from this many files on,
+# starting the pool costs more than hashing a few
+MIN_FILES_PER_POOL = 8
+
+DIGEST_SIZE = 20
+
+
+class File(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+
+
+def partial_hash(path: str, size: int) -> bytes:
+    """Hash of the head and the tail of the file, the whole of small files"""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, "rb") as file:
+        digest.update(file.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            file.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            digest.update(file.read(PARTIAL_BYTES))
+    return digest.digest()
+
+
+def full_hash(path: str) -> bytes:
+    """Hash of the whole file, read through a memory map so it isn't copied
+    into the process"""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with (
+        open(path, "rb") as file,
+        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped,
+    ):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+        digest.update(mapped)
+    return digest.digest()
+
+
+def _hash_or_error(function: Callable[..., bytes], *args) -> bytes | str:
+    """The hash, or why the file couldn't be read (e.g. its permissions, or it
+    was truncated since it was listed)"""
+    try:
+        return function(*args)
+    except (OSError, ValueError) as e:
+        return str(e)
+
+
+def _full_hash_or_error(path: str) -> bytes | str:
+    return _hash_or_error(full_hash, path)
+
+
+def _readable(path: str, digest: bytes | str) -> bytes | None:
+    """The digest, None with a warning if the file couldn't be read"""
+    if isinstance(digest, str):
+        logger.warning("Skipping %s:  %s", path, digest)
+        return None
+    return digest
+
+
+def _regular_files(paths: Iterable[str]) -> list[File]:
+    """Regular files among paths, once per inode, since hard links to the
+    same file aren't copies of it. Symbolic links aren't followed"""
+    files = []
+    inodes = set()
+    for path in paths:
+        try:
+            file_stat = os.lstat(path)
+        except FileNotFoundError:
+            continue
+        inode = (file_stat.st_dev, file_stat.st_ino)
+        if (
+            stat.S_ISREG(file_stat.st_mode)
+            and file_stat.st_size
+            and inode not in inodes
+        ):
+            inodes.add(inode)
+            files.append(File(path, file_stat.st_size, file_stat.st_mtime))
+    return files
+
+
+def _refine(
+    groups: Iterable[list[File]],
+    key: Callable[[list[File]], list[Hashable]],
+) -> list[list[File]]:
+    """Splits each group by the keys of its files, dropping single files and
+    the files keyed None"""
+    refined = []
+    for group in groups:
+        by_key = defaultdict(list)
+        for file, file_key in zip(group, key(group)):
+            if file_key is not None:
+                by_key[file_key].append(file)
+        refined += [files for files in by_key.values() if len(files) > 1]
+    return refined
+
+
+def _full_hashes(groups: list[list[File]]) -> dict[str, bytes | None]:
+    """Full hashes of the files the partial hash didn't read whole, on a
+    single process pool for all the groups, None for the unreadable ones"""
+    paths = [
+        file.path for group in groups for file in group if file.size > 2 * PARTIAL_BYTES
+    ]
+    if len(paths) < MIN_FILES_PER_POOL:
+        digests = list(map(_full_hash_or_error, paths))
+    else:
+        # forking would copy the threads of the caller (the logging and
+        # directory walking ones) in an unknown state
+        with ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
+            digests = list(executor.map(_full_hash_or_error, paths, chunksize=4))
+    return {path: _readable(path, digest) for path, digest in zip(paths, digests)}
+
+
+def find_duplicates(paths: Iterable[str]) -> list[list[str]]:
+    """Groups the files with the same contents.
+    Files are only read when another file has the same size, and only read
+    whole when their partial hashes match too, so most files aren't read.
+    Args:
+        paths (Iterable[str]): files to compare, other entries, empty files
+            and files that can't be read are skipped
+    Returns:
+        list[list[str]]: groups of at least 2 paths, the groups of the
+            largest files first, the oldest file of each group first
+    """
+    groups = _refine(
+        [_regular_files(paths)], lambda group: [file.size for file in group]
+    )
+    groups = _refine(
+        groups,
+        lambda group: [
+            _readable(file.path, _hash_or_error(partial_hash, file.path, file.size))
+            for file in group
+        ],
+    )
+    hashes = _full_hashes(groups)
+    # the partial hash read the smaller files whole
+    groups = _refine(
+        groups, lambda group: [hashes.get(file.path, b"") for file in group]
+    )
+    groups.sort(key=lambda group: (-group[0].size, group[0].path))
+    return [
+        [file.path for file in sorted(group, key=lambda file: (file.mtime, file.path))]
+        for group in groups
+    ]
@@ -0,0 +1,15 @@
+import contextlib
+import fcntl
+from collections.abc import Iterator
+
+
+@contextlib.contextmanager
+def locked(lock_path: str) -> Iterator[None]:
+    """Holds an exclusive advisory lock on lock_path, created if missing,
+    while the block runs. Other processes locking the same path wait for it"""
+    with open(lock_path, "a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
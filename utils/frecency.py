@@ -0,0 +1,181 @@
+import contextlib
+import math
+import os
+import time
+from collections.abc import Iterable
+
+from utils.filelock import locked
+from utils.sidecar import read_sidecar, write_sidecar
+
+# A visit weighs half as much after this long
+HALF_LIFE_SECONDS = 7 * 24 * 60 * 60
+
+# Compaction drops the keys whose visits together weigh less than a fresh
+# visit times 2 ** this
+MIN_LOG2_WEIGHT = -20
+
+# The log is compacted once it has this many lines more than keys
+COMPACT_SLACK_LINES = 256
+
+# Keys ranked for each prefix, so a few removed keys don't hide the prefix
+PREFIX_RESULTS = 3
+
+# The ranking is cached in log_path + suffix, visits lock log_path + suffix
+CACHE_SUFFIX = ".cache"
+LOCK_SUFFIX = ".lock"
+
+
+def log2_weight(when: float) -> float:
+    """Weight of a visit at the time when, as a log2 so it doesn't overflow.
+    Weights grow with time instead of decaying, the decay of all the visits by
+    the same factor doesn't change their order"""
+    return when / HALF_LIFE_SECONDS
+
+
+def add_log2(first: float, second: float) -> float:
+    """log2(2 ** first + 2 ** second)"""
+    low, high = sorted((first, second))
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+class Ranking:
+    """Keys by frecency, a blend of the number of visits and how recent they
+    are, precomputed so the best keys starting with a prefix are a lookup"""
+
+    def __init__(self, weights: dict[str, float], lines: int = 0):
+        """
+        Args:
+            weights (dict[str, float]): log2 weight of the visits of each key
+            lines (int, optional): lines of the log weights were read from
+        """
+        self.weights = weights
+        self.lines = lines
+        self.prefixes: dict[str, list[str]] = {}
+        for key in sorted(weights, key=weights.__getitem__, reverse=True):
+            for end in range(1, len(key) + 1):
+                best = self.prefixes.setdefault(key[:end], [])
+                if len(best) < PREFIX_RESULTS:
+                    best.append(key)
+
+    def visits(self, key: str, now: float | None = None) -> float:
+        """Decayed number of visits of key, a visit now counts as 1"""
+        weight = self.weights.get(key)
+        if weight is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return 2 ** (weight - log2_weight(now))
+
+    def starting_with(self, prefix: str) -> list[str]:
+        """Up to PREFIX_RESULTS visited keys starting with prefix, best first"""
+        return self.prefixes.get(prefix, [])
+
+    def dump(self) -> tuple[dict[str, float], int, dict[str, list[str]]]:
+        return self.weights, self.lines, self.prefixes
+
+    @classmethod
+    def load(
+        cls, payload: tuple[dict[str, float], int, dict[str, list[str]]]
+    ) -> "Ranking":
+        ranking = cls({})
+        ranking.weights, ranking.lines, ranking.prefixes = payload
+        return ranking
+
+
+def parse_log(lines: Iterable[str]) -> Ranking:
+    """Ranking of the visits of a log with a "<log2 weight>\\t<key>" line per
+    visit. Malformed lines, left by an interrupted write, are skipped"""
+    weights: dict[str, float] = {}
+    count = 0
+    for count, line in enumerate(lines, 1):
+        weight, _, key = line.rstrip("\n").partition("\t")
+        try:
+            value = float(weight)
+        except ValueError:
+            continue
+        if key:
+            weights[key] = add_log2(weights[key], value) if key in weights else value
+    return Ranking(weights, count)
+
+
+class History:
+    """Visits of keys, appended to a log and compacted once it grows, with a
+    ranking cached next to it"""
+
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self.cache_path = log_path + CACHE_SUFFIX
+
+    def ranking(self, now: float | None = None) -> Ranking:
+        """Ranking of the visits. A log parsed because it changed since it was
+        cached is also compacted if it has grown (see COMPACT_SLACK_LINES),
+        dropping the visits too old at the time now, defaults to now"""
+        try:
+            with open(self.log_path, encoding="utf-8") as file:
+                stat = os.fstat(file.fileno())
+                key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                payload = read_sidecar(self.cache_path, key)
+                if payload is not None:
+                    return Ranking.load(payload)
+                ranking = parse_log(file)
+        except FileNotFoundError:
+            return Ranking({})
+
+        # a read-only location only costs parsing the log next time
+        with contextlib.suppress(OSError):
+            if ranking.lines > len(ranking.weights) + COMPACT_SLACK_LINES:
+                now = time.time() if now is None else now
+                ranking, key = self._compact(ranking, key, now)
+            write_sidecar(self.cache_path, key, ranking.dump())
+        return ranking
+
+    def record(self, key: str, when: float | None = None) -> None:
+        """Appends a visit of key at the time when, defaults to now. Only
+        appends, the next read of the ranking compacts the log"""
+        if not key or "\n" in key:
+            raise ValueError(f"Invalid key: {key!r}")
+        when = time.time() if when is None else when
+        with (
+            locked(self.log_path + LOCK_SUFFIX),
+            open(self.log_path, "a", encoding="utf-8") as file,
+        ):
+            file.write(f"{log2_weight(when):.6f}\t{key}\n")
+
+    def _compact(
+        self, ranking: Ranking, key: tuple[int, int, int], now: float
+    ) -> tuple[Ranking, tuple[int, int, int]]:
+        """Replaces the log ranking was parsed from, whose stat is key, with a
+        line per key holding all its visits. The compacted ranking and its
+        key, or the same ones if a visit was recorded since"""
+        # only imported when compacting, to keep startup fast
+        import tempfile  # pylint: disable=import-outside-toplevel
+
+        threshold = log2_weight(now) + MIN_LOG2_WEIGHT
+        weights = {
+            name: weight
+            for name, weight in ranking.weights.items()
+            if weight >= threshold
+        }
+        with locked(self.log_path + LOCK_SUFFIX):
+            stat = os.stat(self.log_path)
+            if (stat.st_ino, stat.st_size, stat.st_mtime_ns) != key:
+                return ranking, key
+
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.log_path) or ".",
+                prefix=".history-",
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as file:
+                    for name, weight in weights.items():
+                        file.write(f"{weight:.6f}\t{name}\n")
+                    stat = os.fstat(file.fileno())
+                os.replace(tmp_path, self.log_path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+        return Ranking(weights, len(weights)), (
+            stat.st_ino,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
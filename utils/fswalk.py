@@ -0,0 +1,213 @@
+import fnmatch
+import os
+import queue
+import re
+import threading
+from collections.abc import Callable, Iterator, Sequence
+
+from utils.logger import get_logger
+
+logger = get_logger()
+
+# Predicate over entry names, anything truthy is a match
+NameMatcher = Callable[[str], object]
+
+SYNTAXES = ("substring", "glob", "regex")
+
+# Threads listing directories in a recursive walk, the directory listing
+# syscalls release the GIL
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Workers hand their matches over in batches of up to this many paths, a
+# queue operation per path would cost more than listing the directories
+BATCH_SIZE = 256
+
+# Batches found by the workers but not consumed yet, producers wait beyond it
+# so memory stays bounded however large the directories are
+RESULTS_SIZE = 64
+
+# How often blocked workers check whether the walk was abandoned
+POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+def compile_pattern(
+    pattern: str,
+    syntax: str = "substring",
+    case_sensitive: bool = False,
+) -> NameMatcher:
+    """Compiles pattern once into a predicate over entry names.
+    Args:
+        pattern (str): text the names contain, shell glob the names match as
+            a whole (e.g. "*.pdf") or regular expression found in the names
+        syntax (str, optional): one of SYNTAXES. Defaults to "substring".
+        case_sensitive (bool, optional): Defaults to False.
+    Returns:
+        NameMatcher: whether a name matches the pattern
+    Raises:
+        ValueError: for an unknown syntax or an invalid regular expression
+    """
+    if syntax == "substring":
+        if not pattern:
+            return lambda name: True
+        expression = re.escape(pattern)
+    elif syntax == "glob":
+        expression = fnmatch.translate(pattern)
+    elif syntax == "regex":
+        expression = pattern
+    else:
+        raise ValueError(f"Unknown syntax {syntax!r}, expected one of {SYNTAXES}")
+
+    try:
+        # the regex engine ignores case without lowering every name first
+        compiled = re.compile(expression, 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern {pattern!r}: {e}") from e
+    # globs are anchored, searching them from every position is quadratic
+    return compiled.match if syntax == "glob" else compiled.search
+
+
+def compile_excludes(patterns: Sequence[str]) -> NameMatcher | None:
+    """Predicate over names matching any of the glob patterns, None without
+    patterns so callers can skip the check"""
+    if not patterns:
+        return None
+    return re.compile("|".join(map(fnmatch.translate, patterns))).match
+
+
+# pylint: disable-next=too-many-arguments
+def walk(
+    root: str = ".",
+    matches: NameMatcher = lambda name: True,
+    *,
+    recursive: bool = False,
+    max_depth: int | None = None,
+    exclude: Sequence[str] = (),
+    workers: int = DEFAULT_WORKERS,
+) -> Iterator[str]:
+    """Lazily finds the entries under root whose name matches.
+    The entries are yielded as they are listed, so callers get the first ones
+    right away and memory doesn't grow with the size of the directories.
+    Args:
+        root (str, optional): directory to search. Defaults to ".".
+        matches (NameMatcher, optional): predicate over entry names, see
+            compile_pattern. Defaults to matching everything.
+        recursive (bool, optional): also search the subdirectories, listed
+            concurrently by a pool of threads, so in no particular order.
+            Symbolic links to directories aren't followed. Defaults to False.
+        max_depth (int | None, optional): how many levels of subdirectories
+            to search, 0 being only root. Defaults to None, meaning no limit.
+        exclude (Sequence[str], optional): glob patterns of names that are
+            neither yielded nor searched. Defaults to ().
+        workers (int, optional): threads listing directories.
+    Returns:
+        Iterator[str]: paths of the matching entries, relative to root
+    """
+    excluded = compile_excludes(exclude)
+    if not recursive or max_depth == 0:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if matches(entry.name) and not (excluded and excluded(entry.name)):
+                    yield entry.name
+        return
+
+    yield from _ParallelWalk(root, matches, excluded, max_depth, workers)
+
+
+# pylint: disable-next=too-many-instance-attributes
+class _ParallelWalk:
+    """Recursive walk whose directories are listed by a pool of threads, that
+    hand the matching paths to the consuming thread through a bounded queue"""
+
+    def __init__(
+        self,
+        root: str,
+        matches: NameMatcher,
+        excluded: NameMatcher | None,
+        max_depth: int | None,
+        workers: int,
+    ):
+        self.root = root
+        self.matches = matches
+        self.excluded = excluded
+        self.max_depth = max_depth
+        self.workers = max(1, workers)
+        # (path relative to root, depth), joined to know when the walk ends
+        self.directories: queue.Queue[tuple[str, int] | None] = queue.Queue()
+        self.results: queue.Queue[object] = queue.Queue(RESULTS_SIZE)
+        self.stopped = threading.Event()
+
+    def __iter__(self) -> Iterator[str]:
+        self.directories.put(("", 0))
+        threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.workers)
+        ]
+        threads.append(threading.Thread(target=self._finish, daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            while (batch := self.results.get()) is not _DONE:
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield from batch  # type: ignore[misc]
+        finally:
+            # unblocks the workers when the caller stops iterating early
+            self.stopped.set()
+
+    def _finish(self) -> None:
+        self.directories.join()
+        for _ in range(self.workers):
+            self.directories.put(None)
+        self._put(_DONE)
+
+    def _put(self, batch: object) -> bool:
+        """Hands batch to the consumer, False if it stopped consuming"""
+        while not self.stopped.is_set():
+            try:
+                self.results.put(batch, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _work(self) -> None:
+        while (directory := self.directories.get()) is not None:
+            try:
+                if not self.stopped.is_set():
+                    self._scan(*directory)
+            # pylint: disable-next=broad-exception-caught
+            except Exception as e:  # noqa: BLE001 — raised by the consumer
+                self._put(e)
+                self.stopped.set()
+            finally:
+                self.directories.task_done()
+
+    def _scan(self, directory: str, depth: int) -> None:
+        descend = self.max_depth is None or depth < self.max_depth
+        try:
+            entries = os.scandir(os.path.join(self.root, directory))
+        except (PermissionError, FileNotFoundError) as e:
+            # like find, unreadable or vanished directories don't end the walk
+            logger.warning("Skipped directory:  %s", e)
+            return
+        # joined by hand, os.path.join costs as much as listing the entry
+        prefix = directory + os.sep if directory else ""
+        matches, excluded = self.matches, self.excluded
+        batch = []
+        with entries:
+            for entry in entries:
+                name = entry.name
+                if excluded and excluded(name):
+                    continue
+                if matches(name):
+                    batch.append(prefix + name)
+                    if len(batch) == BATCH_SIZE:
+                        if not self._put(batch):
+                            return
+                        batch = []
+                if descend and entry.is_dir(follow_symlinks=False):
+                    self.directories.put((prefix + name, depth + 1))
+        if batch:
+            self._put(batch)
@@ -0,0 +1,147 @@
+import ctypes
+import ctypes.util
+import math
+import os
+import select
+import struct
+import time
+from collections.abc import Iterator
+from typing import NamedTuple, Self
+
+# Event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# Entries that are complete, written then closed or moved in whole
+COMPLETED = IN_CLOSE_WRITE | IN_MOVED_TO
+
+_EVENT = struct.Struct("iIII")
+
+# Bytes read at once, fits a few thousand events
+READ_SIZE = 64 * 1024
+
+
+class Event(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+class Inotify:
+    """Minimal inotify(7) binding over the C library, Linux only"""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is only available on Linux")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+    @staticmethod
+    def _check(result: int) -> int:
+        if result < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return result
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """Watches path for the events of mask, returning the watch
+        descriptor of the events"""
+        return self._check(self._add_watch(self.fd, os.fsencode(path), mask))
+
+    def read(self, timeout: float | None = None) -> list[Event]:
+        """Waits up to timeout seconds, or forever when None, for events and
+        returns all the pending ones, an empty list on timeout"""
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        # poll takes milliseconds, shorter timeouts would round to 0 and spin
+        if not poller.poll(
+            None if timeout is None else max(1, math.ceil(timeout * 1000))
+        ):
+            return []
+        events: list[Event] = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                events.append(Event(wd, mask, cookie, name))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def batches(
+    directory: str,
+    debounce: float = 1.0,
+    max_delay: float = 10.0,
+) -> Iterator[list[str]]:
+    """Yields the names of the entries completed in directory, coalesced into
+    batches. Waiting for the first entry of a batch takes no CPU, then the
+    batch is yielded once no entry completed for debounce seconds, or max_delay
+    seconds after its first entry so a steady stream still gets handled.
+    Args:
+        directory (str): directory to watch, not its subdirectories
+        debounce (float, optional): seconds without events ending a batch.
+            Defaults to 1.0.
+        max_delay (float, optional): seconds a batch waits at most.
+            Defaults to 10.0.
+    Returns:
+        Iterator[list[str]]: names of the entries completed since the last
+            batch that still exist, in the order they completed. Stops when
+            the directory is removed or moved
+    """
+    with Inotify() as inotify:
+        watch = inotify.add_watch(
+            directory, COMPLETED | IN_ONLYDIR | IN_DELETE_SELF | IN_MOVE_SELF
+        )
+        while True:
+            # a dict, so names completed again are batched once in order
+            names: dict[str, None] = {}
+            deadline: float | None = None
+            now = time.monotonic()
+            while deadline is None or now < deadline:
+                timeout: float | None = (
+                    None if deadline is None else min(debounce, deadline - now)
+                )
+                events = inotify.read(timeout)
+                if not events:
+                    break
+                for event in events:
+                    if event.mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        return
+                    if event.mask & IN_Q_OVERFLOW:
+                        # events were dropped, the listing has them all
+                        names.update(dict.fromkeys(sorted(os.listdir(directory))))
+                    elif event.wd == watch and event.name:
+                        names[event.name] = None
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + max_delay
+            existing = [
+                name for name in names if os.path.lexists(os.path.join(directory, name))
+            ]
+            if existing:
+                yield existing
@@ -1,15 +1,32 @@
+import atexit
+import copy
+import functools
+import json
 import logging
+import os
+import queue
 import sys
+import weakref
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import ClassVar
+from typing import TYPE_CHECKING, ClassVar
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
 
 
 @dataclass(frozen=True, slots=True)
 class DefaultSettings:
     level = logging.DEBUG
     format: str = "%(asctime)s | %(levelname)s | %(module)s:%(lineno)d | %(message)s"
+    # Hand the log file records to a background thread instead of writing
+    # them in the caller. The console is always written in the caller, so
+    # logging on a hot path still pays for each write to it at DEBUG level
+    queued: bool = True
+    # One JSON object per line in the log file instead of the plain format
+    json: bool = False
 
 
 class Formatter(logging.Formatter):
@@ -24,21 +41,119 @@ class Formatter(logging.Formatter):
         "reset": "\x1b[0m",
     }
 
+    LEVEL_COLORS: ClassVar[dict[int, str]] = {
+        logging.DEBUG: "grey",
+        logging.INFO: "green",
+        logging.WARNING: "yellow",
+        logging.ERROR: "red",
+        logging.CRITICAL: "bold_red",
+    }
+
     def __init__(self, fmt, datefmt="%Y-%m-%d %H:%M:%S"):
         super().__init__(fmt, datefmt)
-        self.formats = {
-            logging.DEBUG: self.COLORS["grey"] + fmt + self.COLORS["reset"],
-            logging.INFO: self.COLORS["green"] + fmt + self.COLORS["reset"],
-            logging.WARNING: self.COLORS["yellow"] + fmt + self.COLORS["reset"],
-            logging.ERROR: self.COLORS["red"] + fmt + self.COLORS["reset"],
-            logging.CRITICAL: self.COLORS["bold_red"] + fmt + self.COLORS["reset"],
+        # Built once, instead of for every record
+        self.formatters = {
+            level: logging.Formatter(
+                self.COLORS[color] + fmt + self.COLORS["reset"],
+                datefmt,
+            )
+            for level, color in self.LEVEL_COLORS.items()
         }
 
     def format(self, record):
-        formatter = logging.Formatter(self.formats.get(record.levelno), self.datefmt)
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            return super().format(record)
         return formatter.format(record)
 
 
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a single line JSON object"""
+
+    def __init__(self, datefmt="%Y-%m-%d %H:%M:%S"):
+        super().__init__(datefmt=datefmt)
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class QueueHandler(logging.Handler):
+    """Puts the records on a queue for a QueueListener, like the handler of
+    logging.handlers, but with the traceback rendered apart from the message,
+    so the listener's formatters still tell them apart"""
+
+    def __init__(self, records: "queue.SimpleQueue[logging.LogRecord]"):
+        super().__init__()
+        self.records = records
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the arguments and traceback may change or be gone once the listener
+        # gets to the record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def formatException(self, exc_info) -> str:  # pylint: disable=invalid-name
+        return (self.formatter or logging.Formatter()).formatException(exc_info)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.records.put(self.prepare(record))
+        # pylint: disable-next=broad-exception-caught
+        except Exception:  # noqa: BLE001 — reported like logging does
+            self.handleError(record)
+
+
+class DeferredHandler(logging.Handler):
+    """Handler that builds the actual handlers on the first record it handles,
+    so that getting a logger at import time doesn't create the log directory
+    nor open the log file on runs that never log anything"""
+
+    def __init__(self, factory: Callable[[], list[logging.Handler]]):
+        super().__init__()
+        self.factory = factory
+        self.handlers: list[logging.Handler] | None = None
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if self.handlers is None:
+            self.handlers = self.factory()
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.handle(record)
+
+    def reset(self) -> None:
+        """Drops the handlers built so far, the next record builds new ones"""
+        self.handlers = None
+
+    def flush(self) -> None:
+        for handler in self.handlers or ():
+            handler.flush()
+
+    def close(self) -> None:
+        for handler in self.handlers or ():
+            handler.close()
+        super().close()
+
+
 class CustomLogger:
     """Enhanced logger with color formatting and file rotation"""
 
@@ -50,8 +165,15 @@ class CustomLogger:
     ):
         self.settings = settings or DefaultSettings()
         self.log_dir = log_dir or Path("logs")
-        self.log_dir.mkdir(exist_ok=True)
         self.formatter = formatter or Formatter(self.settings.format)
+        self.listener: QueueListener | None = None
+        self.deferred: list[DeferredHandler] = []
+        self.forked = False
+        # the listener thread isn't forked along, so a forked child would
+        # queue its records for nobody
+        os.register_at_fork(
+            after_in_child=functools.partial(_after_fork_in_child, weakref.ref(self))
+        )
 
     def get_logger(self, name: str) -> logging.Logger:
         logger = logging.getLogger(name)
@@ -61,33 +183,110 @@ class CustomLogger:
         if logger.handlers:
             return logger
 
+        handler = DeferredHandler(self.create_handlers)
+        self.deferred.append(handler)
+        logger.addHandler(handler)
+        return logger
+
+    def create_handlers(self) -> list[logging.Handler]:
+        console_handler, file_handler = self.create_output_handlers()
+        # Child processes write the file in the caller too, they may exit
+        # without stopping the listener (see _in_worker_process)
+        if not self.settings.queued or self.forked or _in_worker_process():
+            return [console_handler, file_handler]
+
+        # The caller only enqueues the record, the listener thread writes it
+        # to the file. The console is still written in the caller, so that
+        # logs and prints show up in the order they were made.
+        # logging.handlers pulls in socket and pickle, so it's only imported
+        # once something is logged
+        # pylint: disable-next=import-outside-toplevel
+        from logging.handlers import QueueListener
+
+        records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        self.listener = QueueListener(records, file_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+        return [console_handler, QueueHandler(records)]
+
+    def flush(self) -> None:
+        """Blocks until the records queued so far are written"""
+        if self.listener is not None:
+            # stopping the listener drains the queue, it's started right away
+            # again for the records logged afterwards
+            self.listener.stop()
+            self.listener.start()
+
+    def stop(self) -> None:
+        """Writes the records still queued and stops the listener thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            atexit.unregister(self.stop)
+
+    def after_fork(self) -> None:
+        """Drops the handlers inherited by a forked child, its records are
+        written without a listener from then on"""
+        self.forked = True
+        if self.listener is not None:
+            atexit.unregister(self.stop)
+            self.listener = None
+        for handler in self.deferred:
+            handler.reset()
+
+    def create_output_handlers(self) -> list[logging.Handler]:
         # Console handler with colors
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(self.formatter)
-        logger.addHandler(console_handler)
 
         # File handler - daily rotating log file (no colors)
         # .astimezone() makes this tz-aware without changing the value — still
         # today's date in local time, just explicit about which timezone that is.
+        self.log_dir.mkdir(exist_ok=True)
         today = datetime.now().astimezone().strftime("%Y-%m-%d")
         file_handler = logging.FileHandler(
             self.log_dir / f"{today}.log",
             encoding="utf-8",
         )
         # Use plain formatter without ANSI color codes for file output
-        plain_formatter = logging.Formatter(
-            self.settings.format,
-            datefmt="%Y-%m-%d %H:%M:%S",
+        plain_formatter = (
+            JsonFormatter()
+            if self.settings.json
+            else logging.Formatter(self.settings.format, datefmt="%Y-%m-%d %H:%M:%S")
         )
         file_handler.setFormatter(plain_formatter)
-        logger.addHandler(file_handler)
 
-        return logger
+        return [console_handler, file_handler]
+
 
+def _after_fork_in_child(reference: "weakref.ref[CustomLogger]") -> None:
+    custom_logger = reference()
+    if custom_logger is not None:
+        custom_logger.after_fork()
 
-_logger_instance = CustomLogger()
+
+def _in_worker_process() -> bool:
+    """Whether this is a multiprocessing child, which exits without running
+    atexit nor waiting for the listener thread"""
+    # never imported here, a process that didn't import it isn't a worker
+    multiprocessing = sys.modules.get("multiprocessing")
+    return multiprocessing is not None and multiprocessing.parent_process() is not None
+
+
+@functools.cache
+def _logger_instance() -> CustomLogger:
+    # LOG_FORMAT=json writes the log file as JSON lines
+    return CustomLogger(
+        settings=DefaultSettings(json=os.environ.get("LOG_FORMAT") == "json"),
+    )
 
 
 def get_logger() -> logging.Logger:
     """Get a logger instance with the specified name."""
-    return _logger_instance.get_logger(__name__)
+    return _logger_instance().get_logger(__name__)
+
+
+def flush_logs() -> None:
+    """Writes the pending log records, for when the process may be killed
+    before exiting normally"""
+    _logger_instance().flush()
@@ -0,0 +1,171 @@
+"""Interactive picker: a query line above the best matches of a word list,
+ranked again on every keystroke. Typing extends the DP rows kept by a
+string_fuzzy_matcher.PrefixSearch instead of searching from scratch, and
+deleting goes back to the rows kept for the shorter query. When ranking
+takes longer than a frame, the query is echoed as it's typed and only ranked
+again once the typing pauses."""
+
+import curses
+import time
+from collections.abc import Callable
+from typing import Protocol
+
+from utils.string_fuzzy_matcher import WordDistance
+
+ENTER = ("\n", "\r", curses.KEY_ENTER)
+ESCAPE = ("\x1b", "\x07")  # Esc, Ctrl-G
+BACKSPACE = ("\x7f", "\b", curses.KEY_BACKSPACE)
+CLEAR = ("\x15",)  # Ctrl-U
+UP = ("\x10", curses.KEY_UP)  # Ctrl-P
+DOWN = ("\x0e", curses.KEY_DOWN)  # Ctrl-N
+
+# Seconds a ranking can take before the picker debounces the typing, one
+# frame at 60 Hz
+FRAME_BUDGET = 1 / 60
+# Pause in the typing after which a slow search ranks the query again
+DEBOUNCE_MS = 150
+
+
+class Search(Protocol):
+    query: str
+
+    def __len__(self) -> int: ...
+
+    def push(self, char: str) -> None: ...
+
+    def pop(self) -> None: ...
+
+    def best(self, num_results: int = 10) -> list[WordDistance]: ...
+
+
+def retype(search: Search, query: str) -> None:
+    """Moves search to query, only popping the chars after the prefix both
+    queries share and pushing the new ones"""
+    while not query.startswith(search.query):
+        search.pop()
+    for char in query[len(search.query) :]:
+        search.push(char)
+
+
+class Picker:
+    """State of the picker, driven by keys as returned by curses get_wch, so
+    it can be used without a terminal"""
+
+    def __init__(
+        self,
+        search: Search,
+        query: str = "",
+        fold: Callable[[str], str] = str.lower,
+    ):
+        self.search = search
+        self.fold = fold
+        self.query = fold(query)
+        self.selected = 0
+        self.matches: list[WordDistance] = []
+        self.chosen: str | None = None
+
+    def update(self, num_results: int) -> None:
+        """Ranks the matches of the current query"""
+        retype(self.search, self.query)
+        self.matches = self.search.best(num_results)
+        self.selected = max(0, min(self.selected, len(self.matches) - 1))
+
+    def handle(self, key: str | int) -> bool:
+        """Applies a key, returns whether the picker is done. chosen is then
+        the selected word, or None if it was cancelled"""
+        if key in ENTER:
+            if self.matches:
+                self.chosen = self.matches[self.selected].word
+            return True
+        if key in ESCAPE:
+            return True
+        if key in BACKSPACE:
+            self.query = self.query[:-1]
+        elif key in CLEAR:
+            self.query = ""
+        elif key in UP:
+            self.selected = max(0, self.selected - 1)
+        elif key in DOWN:
+            self.selected = min(len(self.matches) - 1, self.selected + 1)
+        elif isinstance(key, str) and key.isprintable():
+            self.query += self.fold(key)
+            self.selected = 0
+        return False
+
+
+def pick(
+    search: Search,
+    query: str = "",
+    prompt: str = "> ",
+    fold: Callable[[str], str] = str.lower,
+) -> str | None:
+    """Lets the user pick a word of search in the terminal.
+    Args:
+        search (Search): the words, e.g. Corpus.prefix_search(max_distance)
+        query (str, optional): initial query. Defaults to "".
+        prompt (str, optional): shown before the query. Defaults to "> ".
+        fold (Callable[[str], str], optional): applied to the typed chars,
+            as to the words. Defaults to str.lower.
+    Returns:
+        str | None: the picked word, or None if cancelled
+    """
+    picker = Picker(search, query, fold)
+    try:
+        return curses.wrapper(_run, picker, prompt)
+    except KeyboardInterrupt:
+        return None
+
+
+def _run(screen: curses.window, picker: Picker, prompt: str) -> str | None:
+    # Esc shouldn't wait for the rest of an escape sequence
+    curses.set_escdelay(25)
+    while True:
+        height, _ = screen.getmaxyx()
+        started = time.perf_counter()
+        picker.update(max(1, height - 1))
+        slow = time.perf_counter() - started > FRAME_BUDGET
+        _draw(screen, picker, prompt)
+
+        # the keys typed while ranking are applied together, so a fast typist
+        # or a paste only costs one ranking. When ranking takes longer than a
+        # frame, the typed keys are only echoed until the typing pauses
+        key: str | int | None = screen.get_wch()
+        while key is not None:
+            if picker.handle(key):
+                return picker.chosen
+            if slow:
+                _draw_query(screen, picker, prompt)
+            key = _next_key(screen, DEBOUNCE_MS if slow else 0)
+
+
+def _next_key(screen: curses.window, timeout_ms: int) -> str | int | None:
+    """The next key typed within timeout_ms, None if there is none"""
+    screen.timeout(timeout_ms)
+    try:
+        return screen.get_wch()
+    except curses.error:
+        return None
+    finally:
+        screen.timeout(-1)
+
+
+def _draw_query(screen: curses.window, picker: Picker, prompt: str) -> None:
+    _, width = screen.getmaxyx()
+    screen.move(0, 0)
+    screen.clrtoeol()
+    count = f" {len(picker.search)}"
+    line = f"{prompt}{picker.query}"
+    screen.addnstr(0, 0, line, width - 1)
+    if len(line) + len(count) < width:
+        screen.addstr(0, width - len(count) - 1, count, curses.A_DIM)
+    screen.move(0, min(len(line), width - 1))
+    screen.refresh()
+
+
+def _draw(screen: curses.window, picker: Picker, prompt: str) -> None:
+    height, width = screen.getmaxyx()
+    screen.erase()
+    for row, match in enumerate(picker.matches[: height - 1], start=1):
+        attribute = curses.A_REVERSE if row - 1 == picker.selected else curses.A_NORMAL
+        screen.addnstr(row, 0, f"  {match.word}", width - 1, attribute)
+    _draw_query(screen, picker, prompt)
@@ -1,19 +1,208 @@
+import contextlib
+import functools
+import importlib
+import os
+import time
+from collections.abc import Mapping
+from types import ModuleType
+from typing import Any
+
 from utils.logger import get_logger
+from utils.sidecar import read_sidecar, write_sidecar
 
 logger = get_logger()
 
-try:
-    # using the rust module
-    import fuzzy_string_matcher as sfm  # type: ignore[import]
+# Algorithms suggesting similar names, chosen with the SFM_ALGORITHM
+# environment variable: the edit distance suits typos, the subsequence score
+# suits abbreviations (e.g. "pmgr" for "project-manager")
+DAMERAU_LEVENSHTEIN = "damerau-levenshtein"
+SUBSEQUENCE = "subsequence"
+ALGORITHMS = (DAMERAU_LEVENSHTEIN, SUBSEQUENCE)
+
+# Backend modules by name, in order of preference
+BACKENDS = {
+    "rust": "fuzzy_string_matcher",
+    "python": "utils.string_fuzzy_matcher",
+}
+# Selections besides the backend names, chosen with the SFM_BACKEND
+# environment variable: the first installed backend, or the fastest one for
+# the size of each word list, measured on its first call (see Calibration)
+AUTO = "auto"
+CALIBRATE = "calibrate"
+
+# Functions taking the word list as second argument, which calibration routes
+ROUTED = frozenset(
+    {
+        "find_most_similar_words",
+        "find_most_similar_words_batch",
+        "find_best_subsequence_matches",
+    }
+)
+
+CALIBRATION_PATH = os.path.join(os.path.dirname(__file__), ".env.sfm_calibration")
+# Calls per backend when calibrating, the fastest one counts. Calls taking
+# longer than CALIBRATION_LONG_CALL seconds are timed reliably enough once
+CALIBRATION_ROUNDS = 3
+CALIBRATION_LONG_CALL = 0.05
+# The routed functions take num_results third, which the Rust
+# find_most_similar_words requires
+DEFAULT_NUM_RESULTS = 10
+
+
+@functools.cache
+def load_backend(name: str = AUTO) -> ModuleType:
+    """Imports a fuzzy string matcher implementation.
+    Args:
+        name (str, optional): one of BACKENDS, or AUTO for the Rust extension
+            if installed, the pure-Python one otherwise. Defaults to AUTO.
+    Returns:
+        ModuleType: the backend module
+    Raises:
+        ImportError: if the named backend isn't installed
+        ValueError: for an unknown name
+    """
+    if name == AUTO:
+        for backend_name in BACKENDS:
+            with contextlib.suppress(ImportError):
+                return load_backend(backend_name)
+        raise ImportError("No fuzzy string matcher backend is installed")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {list(BACKENDS)}")
+
+    module = importlib.import_module(BACKENDS[name])
+    logger.debug("Using %s fuzzy string matcher <%s>", name, BACKENDS[name])
+    return module
+
+
+def available_backends() -> dict[str, ModuleType]:
+    """The installed backends by name"""
+    backends = {}
+    for name in BACKENDS:
+        with contextlib.suppress(ImportError):
+            backends[name] = load_backend(name)
+    return backends
+
+
+def algorithm(environ: Mapping[str, str] = os.environ) -> str:
+    """The algorithm chosen with SFM_ALGORITHM, one of ALGORITHMS, defaults to
+    DAMERAU_LEVENSHTEIN"""
+    name = environ.get("SFM_ALGORITHM", DAMERAU_LEVENSHTEIN)
+    if name not in ALGORITHMS:
+        logger.warning("Unknown SFM_ALGORITHM %r, expected one of %s", name, ALGORITHMS)
+        return DAMERAU_LEVENSHTEIN
+    return name
+
+
+class Calibration:
+    """Fastest backend for each routed function and word list size bucket
+    (powers of two). The first call in a bucket times every backend at the
+    smallest size of the bucket and the choice is persisted, so later calls
+    and processes go straight to it"""
+
+    def __init__(self, backends: dict[str, ModuleType], path: str | None = None):
+        self.backends = backends
+        self.path = path or CALIBRATION_PATH
+        # recalibrates when the installed backends change
+        self.key = sorted(
+            (name, getattr(module, "__file__", None) or "")
+            for name, module in backends.items()
+        )
+        self.choices: dict[str, str] = read_sidecar(self.path, self.key) or {}
+
+    def call(self, function: str, *args: Any, **kwargs: Any) -> Any:
+        if len(args) < 3 and "num_results" not in kwargs:
+            kwargs["num_results"] = DEFAULT_NUM_RESULTS
+        # the word list is iterated again when calibrating
+        if "word_list" in kwargs:
+            words = kwargs["word_list"] = list(kwargs["word_list"])
+        else:
+            words = list(args[1])
+            args = (args[0], words, *args[2:])
+        bucket = f"{function}/{len(words).bit_length()}"
+
+        name = self.choices.get(bucket)
+        if name not in self.backends:
+            name = self.calibrate(bucket, function, args, kwargs)
+        return getattr(self.backends[name], function)(*args, **kwargs)
+
+    def calibrate(
+        self,
+        bucket: str,
+        function: str,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> str:
+        """Times every backend on as many of the call's words as the smallest
+        size of the bucket, so each bucket is decided at its own size (e.g. on
+        the parallel and vectorized paths of the large ones), and persists the
+        fastest one as the choice for the bucket"""
+        words = kwargs["word_list"] if "word_list" in kwargs else args[1]
+        sample = words[: 1 << max(0, len(words).bit_length() - 1)]
+        if "word_list" in kwargs:
+            kwargs = {**kwargs, "word_list": sample}
+        else:
+            args = (args[0], sample, *args[2:])
+
+        timings = {}
+        for name, module in self.backends.items():
+            implementation = getattr(module, function)
+            best = float("inf")
+            for _ in range(CALIBRATION_ROUNDS):
+                start = time.perf_counter()
+                implementation(*args, **kwargs)
+                best = min(best, time.perf_counter() - start)
+                if best > CALIBRATION_LONG_CALL:
+                    break
+            timings[name] = best
+        self.choices[bucket] = min(timings, key=timings.__getitem__)
+        logger.debug("Calibrated %s:  %s", bucket, timings)
+        # an unwritable location only costs calibrating again next time
+        with contextlib.suppress(OSError):
+            write_sidecar(self.path, self.key, self.choices)
+        return self.choices[bucket]
+
+
+@functools.cache
+def calibration() -> Calibration:
+    return Calibration(available_backends())
+
+
+class _LazyBackend:
+    """Stands for the selected backend module, which is only imported the
+    first time one of its attributes is used so that commands that never fuzzy
+    match don't pay for loading it. Without an explicit name, the SFM_BACKEND
+    environment variable selects it, AUTO by default"""
+
+    def __init__(self, name: str | None = None):
+        self.name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        name = self.name or os.environ.get("SFM_BACKEND", AUTO)
+        if name == CALIBRATE:
+            if attribute in ROUTED:
+                return functools.partial(calibration().call, attribute)
+            name = AUTO
+        return getattr(load_backend(name), attribute)
+
+
+def backend(name: str | None = None) -> Any:
+    """The backend named name, one of BACKENDS, AUTO or CALIBRATE, loaded on
+    first use. Defaults to the one selected with SFM_BACKEND"""
+    if name is not None and name not in (*BACKENDS, AUTO, CALIBRATE):
+        raise ValueError(f"Unknown backend {name!r}")
+    return _LazyBackend(name)
 
-    logger.debug("Using Rust utils module")
-except ImportError:
-    # fallback to the python module
-    import utils.string_fuzzy_matcher as sfm  # type: ignore[no-redef]
 
-    logger.debug(
-        "Rust implementation <fuzzy_string_matcher> not found using "
-        "Python implementation <utils.string_fuzzy_matcher>",
-    )
+sfm: Any = _LazyBackend()
 
-__all__ = ["sfm"]
+__all__ = [
+    "ALGORITHMS",
+    "AUTO",
+    "BACKENDS",
+    "CALIBRATE",
+    "DAMERAU_LEVENSHTEIN",
+    "SUBSEQUENCE",
+    "algorithm",
+    "backend",
+    "sfm",
+]
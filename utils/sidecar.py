@@ -0,0 +1,50 @@
+import contextlib
+import marshal
+import os
+from typing import Any
+
+FORMAT_VERSION = 1
+
+
+def read_sidecar(path: str, key: Any) -> Any | None:
+    """Reads a payload previously stored with write_sidecar.
+    Args:
+        path (str): path to the sidecar file
+        key (Any): marshallable value identifying the state of the source the
+            payload was derived from (e.g. a fingerprint or an mtime)
+    Returns:
+        Any | None: the stored payload, or None if the file is missing,
+            unreadable or was written for a different key
+    """
+    try:
+        with open(path, "rb") as file:
+            version, stored_key, payload = marshal.loads(file.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != FORMAT_VERSION or stored_key != key:
+        return None
+    return payload
+
+
+def write_sidecar(path: str, key: Any, payload: Any) -> None:
+    """Atomically stores a marshallable payload next to its source file.
+    The payload is written to a temporary file in the same directory and then
+    moved over path, so readers never observe a partially written sidecar.
+    Args:
+        path (str): path to the sidecar file
+        key (Any): marshallable value identifying the source state
+        payload (Any): marshallable value to store
+    """
+    # only imported when writing, to keep startup fast
+    import tempfile  # pylint: disable=import-outside-toplevel
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sidecar-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            marshal.dump((FORMAT_VERSION, key, payload), file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
@@ -1,5 +1,19 @@
-from collections.abc import Iterable
-from typing import NamedTuple
+import functools
+import heapq
+import itertools
+from collections.abc import Iterable, Sequence
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from utils.vectorized_distance import EncodedBuckets
+    from utils.vectorized_distance import PrefixSearch as VectorizedPrefixSearch
+
+# Batches with fewer (query, word) pairs are searched one query at a time,
+# the vectorized engine costs more to set up than it saves
+MIN_VECTORIZED_PAIRS = 4096
+# Largest corpus searched as you type without NumPy: a keystroke over all its
+# words then takes a few frames, and the picker debounces the typing
+MAX_PYTHON_PREFIX_WORDS = 20_000
 
 
 class WordDistance(NamedTuple):
@@ -9,10 +23,19 @@ class WordDistance(NamedTuple):
     distance: int
 
 
+class WordScore(NamedTuple):
+    """Tuple containing a word and its subsequence match score, the higher the
+    better"""
+
+    word: str
+    score: int
+
+
 def find_most_similar_words(
     obj_word: str,
     word_list: Iterable[str],
     num_results: int = 10,
+    max_distance: int | None = None,
 ) -> list[WordDistance]:
     """Finds the most similar words to the obj_word in the given word_list
     Args:
@@ -20,22 +43,347 @@ def find_most_similar_words(
         word_list (Iterable[str]): list of words to compare with
         num_results (int, optional): number of results to retrieve.
             Defaults to 10.
+        max_distance (int | None, optional): discard words farther than this
+            distance. Defaults to None, meaning no limit.
     Returns:
-        list[WordDistance]: list of WordDistance objects
+        list[WordDistance]: list of WordDistance objects sorted by distance,
+            ties in word_list order
     """
-    distances = [
-        WordDistance(
-            word=word,
-            distance=damerau_levenshtein_distance(obj_word, word),
+    return [
+        WordDistance(word=word, distance=distance)
+        for distance, _, word in _closest_words(
+            obj_word,
+            enumerate(word_list),
+            num_results,
+            max_distance,
         )
-        for word in word_list
     ]
-    distances.sort(key=lambda x: x[1])
-    return distances[:num_results]
 
 
-def damerau_levenshtein_distance(str1: str, str2: str) -> int:
-    """Damerau-Levenshtein distance
+def find_most_similar_words_batch(
+    obj_words: Sequence[str],
+    word_list: Iterable[str],
+    num_results: int = 10,
+    max_distance: int | None = None,
+) -> list[list[WordDistance]]:
+    """Same as find_most_similar_words for each of obj_words, see
+    Corpus.search_batch
+    Args:
+        obj_words (Sequence[str]): words to compare to
+        word_list (Iterable[str]): list of words to compare with
+        num_results (int, optional): number of results per word.
+            Defaults to 10.
+        max_distance (int | None, optional): discard words farther than this
+            distance. Defaults to None, meaning no limit.
+    Returns:
+        list[list[WordDistance]]: the results of each of obj_words, in order
+    """
+    return Corpus(word_list).search_batch(obj_words, num_results, max_distance)
+
+
+class Corpus:
+    """List of words prepared once to be searched repeatedly, mirroring the
+    Rust extension's Corpus. Words are bucketed by length, so searches bounded
+    by max_distance only compare the query against words whose length is
+    within max_distance of its own.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = list(words)
+        self.indices_by_length: dict[int, list[int]] = {}
+        for index, word in enumerate(self.words):
+            self.indices_by_length.setdefault(len(word), []).append(index)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __getitem__(self, index: int) -> str:
+        return self.words[index]
+
+    def search(
+        self,
+        obj_word: str,
+        num_results: int = 10,
+        max_distance: int | None = None,
+    ) -> list[WordDistance]:
+        """Finds the most similar words to obj_word in the corpus
+        Args:
+            obj_word (str): word to compare to
+            num_results (int, optional): number of results to retrieve.
+                Defaults to 10.
+            max_distance (int | None, optional): discard words farther than
+                this distance. Defaults to None, meaning no limit.
+        Returns:
+            list[WordDistance]: list of WordDistance objects sorted by
+                distance, ties in corpus order
+        """
+        return [
+            WordDistance(word=self.words[index], distance=distance)
+            for index, distance in self.search_indices(
+                obj_word,
+                num_results,
+                max_distance,
+            )
+        ]
+
+    def search_batch(
+        self,
+        obj_words: Sequence[str],
+        num_results: int = 10,
+        max_distance: int | None = None,
+    ) -> list[list[WordDistance]]:
+        """Same as search for each of obj_words. With NumPy installed, the
+        distances of all the words to the corpus are computed together (see
+        utils.vectorized_distance), otherwise one word at a time"""
+        encoded = None
+        if len(obj_words) * len(self.words) >= MIN_VECTORIZED_PAIRS:
+            encoded = self.encoded_buckets
+        if encoded is None:
+            return [self.search(word, num_results, max_distance) for word in obj_words]
+
+        # Only imported when needed, numpy is an optional dependency
+        # pylint: disable-next=import-outside-toplevel
+        from utils import vectorized_distance
+
+        # longer words don't fit the vectorized engine, they are searched alone
+        fits = [len(word) <= vectorized_distance.MAX_QUERY_LENGTH for word in obj_words]
+        found = iter(
+            vectorized_distance.search(
+                [word for word, fit in zip(obj_words, fits) if fit],
+                encoded,
+                num_results,
+                max_distance,
+            )
+        )
+        return [
+            (
+                [
+                    WordDistance(self.words[index], distance)
+                    for index, distance in next(found)
+                ]
+                if fit
+                else self.search(word, num_results, max_distance)
+            )
+            for word, fit in zip(obj_words, fits)
+        ]
+
+    @functools.cached_property
+    def encoded_buckets(self) -> "EncodedBuckets | None":
+        """The words encoded for the vectorized engine, None without NumPy"""
+        try:
+            # Only imported when needed, numpy is an optional dependency
+            # pylint: disable-next=import-outside-toplevel
+            from utils.vectorized_distance import EncodedBuckets
+        except ImportError:
+            return None
+        return EncodedBuckets(self.words)
+
+    def prefix_search(
+        self, max_distance: int | None = None
+    ) -> "PrefixSearch | VectorizedPrefixSearch":
+        """PrefixSearch over the corpus, vectorized with NumPy when installed
+        and the corpus is large enough for it to pay off.
+        Raises:
+            ImportError: if NumPy is missing and the corpus has more than
+                MAX_PYTHON_PREFIX_WORDS words
+        """
+        encoded = None
+        if len(self.words) >= MIN_VECTORIZED_PAIRS:
+            encoded = self.encoded_buckets
+        if encoded is None:
+            if len(self.words) > MAX_PYTHON_PREFIX_WORDS:
+                raise ImportError(
+                    f"Searching {len(self.words)} words as you type needs NumPy: "
+                    "pip install .[numpy]",
+                    name="numpy",
+                )
+            return PrefixSearch(self.words, max_distance)
+
+        # Only imported when needed, numpy is an optional dependency
+        # pylint: disable-next=import-outside-toplevel
+        from utils import vectorized_distance
+
+        return vectorized_distance.PrefixSearch(self.words, encoded, max_distance)
+
+    @functools.cached_property
+    def masks(self) -> list[int]:
+        """char_mask of each word, computed on the first subsequence search"""
+        return [char_mask(word) for word in self.words]
+
+    def subsequence_search(self, query: str, num_results: int = 10) -> list[WordScore]:
+        """Same as find_best_subsequence_matches over the corpus, with the char
+        masks of the words computed once"""
+        return [
+            WordScore(self.words[index], score)
+            for index, score in _best_subsequence_matches(
+                query, self.words, self.masks, num_results
+            )
+        ]
+
+    def search_indices(
+        self,
+        obj_word: str,
+        num_results: int = 10,
+        max_distance: int | None = None,
+    ) -> list[tuple[int, int]]:
+        """Same as search, but returns (index, distance) pairs"""
+        if max_distance is None:
+            candidates: Iterable[int] = range(len(self.words))
+        else:
+            length = len(obj_word)
+            candidates = heapq.merge(
+                *(
+                    self.indices_by_length.get(candidate_length, [])
+                    for candidate_length in range(
+                        length - max_distance,
+                        length + max_distance + 1,
+                    )
+                ),
+            )
+        return [
+            (index, distance)
+            for distance, index, _ in _closest_words(
+                obj_word,
+                ((index, self.words[index]) for index in candidates),
+                num_results,
+                max_distance,
+            )
+        ]
+
+
+def _closest_words(
+    obj_word: str,
+    indexed_words: Iterable[tuple[int, str]],
+    num_results: int,
+    max_distance: int | None,
+) -> list[tuple[int, int, str]]:
+    """Selects the num_results (distance, index, word) closest to obj_word,
+    sorted by distance and index. indexed_words must be in index order.
+    """
+    if num_results <= 0:
+        return []
+
+    pattern = BitPattern.compile(obj_word)
+    # max-heap (through negation) of the best (distance, index, word) so far
+    best: list[tuple[int, int, str]] = []
+    bound = max_distance
+    for index, word in indexed_words:
+        distance = bit_parallel_distance(pattern, word, bound)
+        if bound is not None and distance > bound:
+            continue
+
+        if len(best) < num_results:
+            heapq.heappush(best, (-distance, -index, word))
+        else:
+            heapq.heapreplace(best, (-distance, -index, word))
+        if len(best) == num_results:
+            # later words must be strictly closer to displace the worst one
+            worst = -best[0][0]
+            if worst == 0:
+                break
+            bound = worst - 1 if bound is None else min(bound, worst - 1)
+
+    return [
+        (-distance, -index, word)
+        for distance, index, word in sorted(best, reverse=True)
+    ]
+
+
+def damerau_levenshtein_distance(
+    str1: str,
+    str2: str,
+    max_distance: int | None = None,
+) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, computed with
+    the bit-parallel engine.
+    Args:
+        str1 (str): first word
+        str2 (str): second word
+        max_distance (int | None, optional): stop computing once the distance
+            is known to exceed this value. Defaults to None, meaning no limit.
+    Returns:
+        int: the distance, or max_distance + 1 if it exceeds max_distance
+    """
+    return bit_parallel_distance(BitPattern.compile(str1), str2, max_distance)
+
+
+class BitPattern(NamedTuple):
+    """Word pre-processed for the bit-parallel engine: bit i of
+    match_masks[char] is set when word[i] == char"""
+
+    match_masks: dict[str, int]
+    length: int
+
+    @classmethod
+    def compile(cls, word: str) -> "BitPattern":
+        match_masks: dict[str, int] = {}
+        for i, char in enumerate(word):
+            match_masks[char] = match_masks.get(char, 0) | 1 << i
+        return cls(match_masks, len(word))
+
+
+# pylint: disable-next=too-many-locals
+def bit_parallel_distance(
+    pattern: BitPattern,
+    text: str,
+    max_distance: int | None = None,
+) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance between the
+    pattern and the text, using Hyyro's bit-vector algorithm.
+    "A Bit-Vector Algorithm for Computing Levenshtein and Damerau Edit
+    Distances" (Hyyro, 2003)
+
+    Each column of the dynamic programming matrix is encoded as the bit
+    vectors of its vertical positive and negative deltas (vp, vn), so a whole
+    column is computed with a handful of integer operations however long the
+    pattern is. Only the bottom cell, the distance to the text read so far, is
+    tracked explicitly. It can't decrease by more than one per remaining text
+    char, which allows abandoning as soon as max_distance can't be reached.
+    """
+    length, text_length = pattern.length, len(text)
+    if max_distance is None:
+        max_distance = max(length, text_length)
+    limit = max_distance + 1
+    if abs(length - text_length) > max_distance:
+        return limit
+    if length == 0:
+        return text_length
+
+    match_masks = pattern.match_masks
+    mask = (1 << length) - 1
+    last_bit = 1 << (length - 1)
+    vp, vn, d0, previous_match = mask, 0, 0, 0
+    distance = length
+    remaining = text_length
+    for char in text:
+        match = match_masks.get(char, 0)
+        transposition = ((~d0 & match) << 1) & previous_match
+        d0 = (((match & vp) + vp) ^ vp) | match | vn | transposition
+        hp = vn | ~(d0 | vp)
+        hn = d0 & vp
+        if hp & last_bit:
+            distance += 1
+        elif hn & last_bit:
+            distance -= 1
+        hp = (hp << 1) | 1
+        vp = ((hn << 1) | ~(d0 | hp)) & mask
+        vn = hp & d0 & mask
+        previous_match = match
+
+        remaining -= 1
+        if distance - remaining > max_distance:
+            return limit
+
+    return distance
+
+
+def damerau_levenshtein_distance_dp(
+    str1: str,
+    str2: str,
+    max_distance: int | None = None,
+) -> int:
+    """Damerau-Levenshtein distance, computed with the dynamic programming
+    matrix. Reference implementation for the bit-parallel engine.
     https://en.wikipedia.org/wiki/Damerau%E2%80%93Levenshtein_distance
 
     d_a,b[i,j] = min(
@@ -47,36 +395,300 @@ def damerau_levenshtein_distance(str1: str, str2: str) -> int:
     )
     where
         cost = 1 if a[i] != b[j] else 0
+
+    When max_distance is given only the cells within max_distance of the
+    diagonal are computed, and the computation is abandoned as soon as a whole
+    row exceeds it, returning max_distance + 1.
     """
     len_str1, len_str2 = len(str1), len(str2)
+    if max_distance is None:
+        max_distance = max(len_str1, len_str2)
+    limit = max_distance + 1
+    if abs(len_str1 - len_str2) > max_distance:
+        return limit
 
-    # Create a matrix of size (len_str1 + 1) x (len_str2 + 1)
-    distances = [[0] * (len_str2 + 1) for _ in range(len_str1 + 1)]
-
-    # Initialize the first row and first column of the matrix
-    for i in range(len_str1 + 1):
-        distances[i][0] = i
-    for j in range(len_str2 + 1):
-        distances[0][j] = j
+    # Only the last three rows of the matrix are kept, cells outside the band
+    # hold the limit value
+    before_previous: list[int] = []
+    previous = [j if j <= max_distance else limit for j in range(len_str2 + 1)]
 
     # Calculate the minimum number of operations required
     for i in range(1, len_str1 + 1):
-        for j in range(1, len_str2 + 1):
-            cost = 0 if str1[i - 1] == str2[j - 1] else 1
-            distances[i][j] = min(
-                distances[i - 1][j] + 1,  # Deletion
-                distances[i][j - 1] + 1,  # Insertion
-                distances[i - 1][j - 1] + cost,  # Substitution
+        current = [limit] * (len_str2 + 1)
+        current[0] = i if i <= max_distance else limit
+        row_min = current[0]
+        char1 = str1[i - 1]
+        for j in range(max(1, i - max_distance), min(len_str2, i + max_distance) + 1):
+            cost = 0 if char1 == str2[j - 1] else 1
+            distance = min(
+                previous[j] + 1,  # Deletion
+                current[j - 1] + 1,  # Insertion
+                previous[j - 1] + cost,  # Substitution
             )
-            if (
-                i > 1
-                and j > 1
-                and str1[i - 1] == str2[j - 2]
-                and str1[i - 2] == str2[j - 1]
-            ):
-                distances[i][j] = min(
-                    distances[i][j],
-                    distances[i - 2][j - 2] + cost,
+            if i > 1 and j > 1 and char1 == str2[j - 2] and str1[i - 2] == str2[j - 1]:
+                distance = min(
+                    distance,
+                    before_previous[j - 2] + cost,
                 )  # Transposition
+            distance = min(distance, limit)
+            current[j] = distance
+            row_min = min(row_min, distance)
+
+        # Every alignment goes through this row (a transposition skipping it
+        # costs at least one more than its previous row), so it bounds the result
+        if row_min > max_distance:
+            return limit
+        before_previous, previous = previous, current
+
+    return previous[len_str2]
+
+
+class PrefixSearch:
+    """Words ranked by their distance to a query typed one char at a time, as
+    in an interactive picker. The distance of a word is the smallest one
+    between the query and any of its prefixes (its best DP row cell), ties
+    shortest word first and then in word order.
+
+    Each live word keeps the DP row of the query typed so far, which a new
+    char extends by one row instead of computing the distance again. A row's
+    smallest cell never decreases as chars are appended, so words beyond
+    max_distance are dropped for good, until the char is popped, and only the
+    cells within max_distance of the diagonal are computed.
+    """
+
+    def __init__(self, words: Sequence[str], max_distance: int | None = None):
+        self.words = words
+        self.max_distance = max_distance
+        self.query = ""
+        self.longest = max(map(len, words), default=0)
+        # live words after each typed char, by index: (DP row, its minimum)
+        self.levels: list[dict[int, tuple[list[int], int]]] = [
+            {index: (list(range(len(word) + 1)), 0) for index, word in enumerate(words)}
+        ]
+
+    def __len__(self) -> int:
+        """Number of live words"""
+        return len(self.levels[-1])
+
+    # pylint: disable-next=too-many-locals
+    def push(self, char: str) -> None:
+        """Appends char to the query"""
+        before_previous = self.levels[-2] if len(self.levels) > 1 else {}
+        previous_char = self.query[-1:]
+        self.query += char
+        length = len(self.query)
+
+        # cells farther than max_distance from the diagonal are beyond it, so
+        # only the band around it is computed and the others are set just past
+        # max_distance, which keeps the cells within it exact. Without one,
+        # the band covers every cell
+        bound = self.max_distance
+        if bound is None:
+            bound = length + self.longest
+        start = max(1, length - bound)
+
+        level = {}
+        for index, (previous, _) in self.levels[-1].items():
+            word = self.words[index]
+            end = min(len(word), length + bound)
+            row = [bound + 1] * (len(word) + 1)
+            row[0] = length
+            for j in range(start, end + 1):
+                word_char = word[j - 1]
+                cost = 0 if char == word_char else 1
+                distance = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+                if j > 1 and char == word[j - 2] and previous_char == word_char:
+                    distance = min(distance, before_previous[index][0][j - 2] + cost)
+                row[j] = distance
+            row_min = min(row[start - 1 : end + 1], default=length)
+            if row_min <= bound:
+                level[index] = (row, row_min)
+        self.levels.append(level)
+
+    def pop(self) -> None:
+        """Removes the last char of the query"""
+        if self.query:
+            self.query = self.query[:-1]
+            self.levels.pop()
+
+    def best(self, num_results: int = 10) -> list[WordDistance]:
+        """The num_results best ranked live words, in word order while the
+        query is empty"""
+        if not self.query:
+            return [
+                WordDistance(self.words[index], 0)
+                for index in itertools.islice(self.levels[-1], num_results)
+            ]
+        return [
+            WordDistance(self.words[index], distance)
+            for distance, _, index in heapq.nsmallest(
+                num_results,
+                (
+                    (row_min, len(self.words[index]), index)
+                    for index, (_, row_min) in self.levels[-1].items()
+                ),
+            )
+        ]
+
+
+# Scores of the subsequence matcher, after fzf's. Matched chars score
+# SCORE_MATCH, gaps between them cost, and chars at word boundaries (the start
+# of the word, after a separator, camelCase humps and digits) get bonuses
+SCORE_MATCH = 16
+SCORE_GAP_START = -3
+SCORE_GAP_EXTENSION = -1
+BONUS_BOUNDARY = SCORE_MATCH // 2
+BONUS_CAMEL = BONUS_BOUNDARY + SCORE_GAP_EXTENSION
+BONUS_CONSECUTIVE = -(SCORE_GAP_START + SCORE_GAP_EXTENSION)
+BONUS_FIRST_CHAR_MULTIPLIER = 2
+
+_OTHER, _LETTER, _UPPER, _DIGIT = range(4)
+
+
+def fold(char: str) -> str:
+    """Case folded char, chars lowering to several chars are kept as is"""
+    lowered = char.lower()
+    return lowered if len(lowered) == 1 else char
+
+
+def char_mask(word: str) -> int:
+    """Bitmask of the case folded chars of word, 64 bits wide. A word can only
+    contain query as a subsequence if its mask has all the bits of the
+    query's, which rules out most words without scanning them"""
+    mask = 0
+    for char in set(word):
+        char = fold(char)
+        if "a" <= char <= "z":
+            mask |= 1 << (ord(char) - ord("a"))
+        elif "0" <= char <= "9":
+            mask |= 1 << (26 + ord(char) - ord("0"))
+        else:
+            mask |= 1 << (36 + ord(char) % 28)
+    return mask
+
+
+def _char_class(char: str) -> int:
+    if char.isnumeric():
+        return _DIGIT
+    if char.isupper():
+        return _UPPER
+    if char.isalpha():
+        return _LETTER
+    return _OTHER
+
+
+def _bonus(previous_class: int, char_class: int) -> int:
+    if char_class == _OTHER:
+        return 0
+    if previous_class == _OTHER:
+        return BONUS_BOUNDARY
+    if (previous_class == _LETTER and char_class == _UPPER) or (
+        previous_class != _DIGIT and char_class == _DIGIT
+    ):
+        return BONUS_CAMEL
+    return 0
+
+
+def subsequence_score(query: str, word: str) -> int | None:
+    """Score of the chars of query appearing in order in word, ignoring case.
+    As fzf's first algorithm, the match ending first is shrunk from its end to
+    the shortest one, then scored in a single pass, so the cost is linear in
+    the length of word rather than the product of both lengths.
+    Args:
+        query (str): chars to find, case folded (see fold)
+        word (str): word to find them in
+    Returns:
+        int | None: the score, higher for matches at the start of the word, at
+            word boundaries or consecutive, None if word doesn't contain query
+    """
+    if not query:
+        return 0
+    folded = word.lower() if word.isascii() else "".join(map(fold, word))
+
+    end = -1
+    for char in query:
+        end = folded.find(char, end + 1)
+        if end < 0:
+            return None
+    start = end
+    for char in reversed(query[:-1]):
+        start = folded.rfind(char, 0, start)
+
+    score, in_gap, consecutive, first_bonus = 0, False, 0, 0
+    previous_class = _char_class(word[start - 1]) if start else _OTHER
+    query_index = 0
+    for index in range(start, end + 1):
+        char_class = _char_class(word[index])
+        if folded[index] == query[query_index]:
+            score += SCORE_MATCH
+            bonus = _bonus(previous_class, char_class)
+            if consecutive == 0:
+                first_bonus = bonus
+            else:
+                # a consecutive run keeps the bonus of its first char
+                if bonus >= BONUS_BOUNDARY and bonus > first_bonus:
+                    first_bonus = bonus
+                bonus = max(bonus, first_bonus, BONUS_CONSECUTIVE)
+            score += bonus * BONUS_FIRST_CHAR_MULTIPLIER if query_index == 0 else bonus
+            in_gap, consecutive = False, consecutive + 1
+            query_index += 1
+        else:
+            score += SCORE_GAP_EXTENSION if in_gap else SCORE_GAP_START
+            in_gap, consecutive, first_bonus = True, 0, 0
+        previous_class = char_class
+    return score
+
+
+def find_best_subsequence_matches(
+    query: str,
+    word_list: Iterable[str],
+    num_results: int = 10,
+) -> list[WordScore]:
+    """Finds the words containing the chars of query in order, ignoring case,
+    with the best subsequence scores (see subsequence_score). Suits
+    abbreviations, like "pmgr" for "project-manager", better than
+    find_most_similar_words
+    Args:
+        query (str): chars to find
+        word_list (Iterable[str]): list of words to search through
+        num_results (int, optional): number of results to retrieve.
+            Defaults to 10.
+    Returns:
+        list[WordScore]: list of WordScore objects sorted by score, ties
+            shortest first then in word_list order
+    """
+    words = list(word_list)
+    return [
+        WordScore(words[index], score)
+        for index, score in _best_subsequence_matches(
+            query, words, map(char_mask, words), num_results
+        )
+    ]
+
 
-    return distances[len_str1][len_str2]
+def _best_subsequence_matches(
+    query: str,
+    words: list[str],
+    masks: Iterable[int],
+    num_results: int,
+) -> list[tuple[int, int]]:
+    """Selects the num_results best (index, score) pairs, the words whose mask
+    lacks bits of the query's aren't scanned"""
+    if num_results <= 0:
+        return []
+    folded = "".join(map(fold, query))
+    query_mask = char_mask(folded)
+    # min-heap of the best (score, -length, -index) so far
+    best: list[tuple[int, int, int]] = []
+    for index, (word, mask) in enumerate(zip(words, masks)):
+        if query_mask & ~mask:
+            continue
+        score = subsequence_score(folded, word)
+        if score is None:
+            continue
+        entry = (score, -len(word), -index)
+        if len(best) < num_results:
+            heapq.heappush(best, entry)
+        elif entry > best[0]:
+            heapq.heapreplace(best, entry)
+    return [(-index, score) for score, _, index in sorted(best, reverse=True)]
@@ -0,0 +1,422 @@
+import contextlib
+import glob
+import hashlib
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from utils.filelock import locked
+from utils.logger import get_logger
+from utils.sidecar import read_sidecar, write_sidecar
+
+logger = get_logger()
+
+# Tokens are words, optionally prefixed by the dashes of a command line flag,
+# and may contain the dots, pluses and dashes of names like docker-compose
+TOKEN_PATTERN = re.compile(r"-{0,2}\w[\w.+-]*")
+PART_PATTERN = re.compile(r"\w+")
+
+# Postings are split in shards by token, so a query only loads the shards of
+# its own tokens
+NUM_SHARDS = 64
+# Every update writes its postings as a new segment, once there are more than
+# this many segments the newer ones are merged together, or with the oldest
+# (largest) one too when they index at least as many files as it does
+MAX_SEGMENTS = 8
+# Below this many files to index, starting a process pool costs more than it
+# saves
+MIN_FILES_PER_POOL = 16
+
+# Type code of the arrays postings are encoded with
+POSTING_TYPECODE = "I"
+# Bumped when the layout of the index files changes
+INDEX_FORMAT = 1
+
+
+class SearchResult(NamedTuple):
+    name: str
+    score: float
+    # (1-based line number, stripped line) of the best matching lines
+    snippets: list[tuple[int, str]]
+
+
+def split_tokens(text: str) -> dict[str, list[str]]:
+    """Tokens of the text, each with its parts (e.g. --force-with-lease has
+    force, with and lease) when it's a compound token"""
+    tokens: dict[str, list[str]] = {}
+    for match in set(TOKEN_PATTERN.findall(text.casefold())):
+        if match.isalnum():
+            tokens[match] = []
+            continue
+        token = match.rstrip(".+-")
+        parts = PART_PATTERN.findall(token)
+        tokens[token] = [] if parts == [token] else [p for p in parts if len(p) > 1]
+    return tokens
+
+
+def line_tokens(line: str) -> set[str]:
+    """Tokens of a line. Compound tokens are also indexed by their parts, so
+    that searching any of them finds the line"""
+    tokens = set()
+    for token, parts in split_tokens(line).items():
+        tokens.add(token)
+        tokens.update(parts)
+    return tokens
+
+
+def shard_of(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) % NUM_SHARDS
+
+
+def extract_lines(path: str) -> list[str]:
+    """Lines of text of a cheatsheet, PDFs are converted with pdftotext"""
+    if path.endswith(".pdf"):
+        completed = subprocess.run(
+            ["pdftotext", "-layout", path, "-"],
+            capture_output=True,
+            check=True,
+            text=True,
+            errors="replace",
+        )
+        return completed.stdout.splitlines()
+    with open(path, encoding="utf-8", errors="replace") as file:
+        return file.read().splitlines()
+
+
+def index_file(path: str, text_path: str | None) -> dict[str, list[int]]:
+    """Line numbers of every token of a file. The extracted text is also
+    saved to text_path when given (for PDFs). Runs on the worker pool"""
+    try:
+        lines = extract_lines(path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning("Failed to extract the text of %s: %s", path, e)
+        return {}
+    if text_path is not None:
+        with open(text_path, "w", encoding="utf-8") as file:
+            file.writelines(f"{line}\n" for line in lines)
+
+    postings: dict[str, list[int]] = {}
+    for number, line in enumerate(lines):
+        for token in line_tokens(line):
+            if token in postings:
+                postings[token].append(number)
+            else:
+                postings[token] = [number]
+    return postings
+
+
+def encode_postings(postings: Mapping[int, Sequence[int]]) -> bytes:
+    """Encodes the line numbers of a token by document id as
+    id, count, line numbers... for every document"""
+    encoded = array(POSTING_TYPECODE)
+    for doc_id, numbers in postings.items():
+        encoded.append(doc_id)
+        encoded.append(len(numbers))
+        encoded.extend(numbers)
+    return encoded.tobytes()
+
+
+def decode_postings(data: bytes) -> Iterator[tuple[int, array[int]]]:
+    """(document id, line numbers) encoded with encode_postings"""
+    decoded = array(POSTING_TYPECODE, data)
+    position = 0
+    while position < len(decoded):
+        count = decoded[position + 1]
+        yield decoded[position], decoded[position + 2 : position + 2 + count]
+        position += 2 + count
+
+
+class TextIndex:
+    """On-disk inverted index over the text of the files of a folder.
+    The index directory holds:
+        meta: (mtime_ns, size, document id) of every indexed file by name,
+            and the live segments with the number of files they indexed
+        seg-<segment>-<shard>: token -> encoded postings of the documents
+            indexed by one update
+        text/: text extracted from the PDFs, to show snippets without
+            converting them again
+    A modified file is indexed again under a new document id, postings of
+    ids no longer in meta are skipped, and dropped when segments are merged.
+    Every file is keyed by the folder it indexes and the index format.
+    """
+
+    def __init__(self, folder: str, index_dir: str, extensions: Sequence[str]):
+        self.folder = os.path.abspath(folder)
+        self.index_dir = index_dir
+        self.extensions = tuple(extensions)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _read(self, name: str) -> dict:
+        return read_sidecar(self._path(name), (INDEX_FORMAT, self.folder)) or {}
+
+    def _write(self, name: str, payload: dict) -> None:
+        write_sidecar(self._path(name), (INDEX_FORMAT, self.folder), payload)
+
+    def _read_meta(self) -> dict:
+        return self._read("meta") or {
+            "files": {},
+            "segments": [],
+            "next_id": 0,
+            "next_segment": 0,
+        }
+
+    def _text_path(self, name: str) -> str:
+        digest = hashlib.blake2b(name.encode("utf-8"), digest_size=16).hexdigest()
+        return self._path(os.path.join("text", f"{digest}.txt"))
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        """(mtime_ns, size) of the files to index, by name"""
+        index_pdfs = shutil.which("pdftotext") is not None
+        skipped_pdfs = 0
+        stats = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                extension = os.path.splitext(entry.name)[1]
+                if extension not in self.extensions or not entry.is_file():
+                    continue
+                if extension == ".pdf" and not index_pdfs:
+                    skipped_pdfs += 1
+                    continue
+                entry_stat = entry.stat()
+                stats[entry.name] = (entry_stat.st_mtime_ns, entry_stat.st_size)
+        if skipped_pdfs:
+            logger.warning("pdftotext not found, %d PDFs aren't indexed", skipped_pdfs)
+        return stats
+
+    def _changes(
+        self,
+        stats: dict[str, tuple[int, int]],
+        files: dict[str, tuple[int, int, int]],
+    ) -> tuple[list[str], list[str]]:
+        """Names of the files changed or added, and of the files removed"""
+        changed = [
+            name for name, stat in stats.items() if files.get(name, ())[:2] != stat
+        ]
+        return changed, [name for name in files if name not in stats]
+
+    def _index_files(self, names: list[str]) -> list[dict[str, list[int]]]:
+        paths = [os.path.join(self.folder, name) for name in names]
+        text_paths = [
+            self._text_path(name) if name.endswith(".pdf") else None for name in names
+        ]
+        if len(names) < MIN_FILES_PER_POOL:
+            return list(map(index_file, paths, text_paths))
+        # forking would copy the threads of the caller (the logging one) in an
+        # unknown state
+        with ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("forkserver")
+        ) as executor:
+            return list(executor.map(index_file, paths, text_paths, chunksize=4))
+
+    def update(self) -> int:
+        """Re-indexes the files added, modified (by mtime or size) or removed
+        since the last update. Text extraction and tokenization run on a pool
+        of worker processes.
+        Returns:
+            int: number of files indexed or removed from the index
+        """
+        stats = self._scan()
+        if self._changes(stats, self._read_meta()["files"]) == ([], []):
+            return 0
+
+        os.makedirs(self._path("text"), exist_ok=True)
+        with locked(self._path("lock")):
+            # another process may have updated the index meanwhile
+            meta = self._read_meta()
+            changed, removed = self._changes(stats, meta["files"])
+
+            docs = {}
+            for name, postings in zip(changed, self._index_files(changed)):
+                docs[meta["next_id"]] = postings
+                meta["files"][name] = (*stats[name], meta["next_id"])
+                meta["next_id"] += 1
+            for name in removed:
+                del meta["files"][name]
+                if name.endswith(".pdf"):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(self._text_path(name))
+
+            self._write_segment(meta, docs)
+            if len(meta["segments"]) > MAX_SEGMENTS:
+                oldest, *newer = meta["segments"]
+                if sum(num_docs for _, num_docs in newer) >= oldest[1]:
+                    newer = meta["segments"]
+                meta["segments"] = [
+                    *meta["segments"][: -len(newer)],
+                    self._merge(meta, newer),
+                ]
+            # meta is written last, segments it doesn't list are never read
+            self._write("meta", meta)
+            self._remove_unlisted_segments(segment for segment, _ in meta["segments"])
+
+        return len(changed) + len(removed)
+
+    def _write_segment(self, meta: dict, docs: dict[int, dict[str, list[int]]]) -> None:
+        """Writes the postings of the documents as a new segment"""
+        shards: dict[int, dict[str, dict[int, list[int]]]] = {}
+        for doc_id, postings in docs.items():
+            for token, numbers in postings.items():
+                shard_postings = shards.setdefault(shard_of(token), {})
+                shard_postings.setdefault(token, {})[doc_id] = numbers
+
+        segment = meta["next_segment"]
+        meta["next_segment"] += 1
+        for shard, shard_postings in shards.items():
+            self._write(
+                f"seg-{segment}-{shard}",
+                {token: encode_postings(p) for token, p in shard_postings.items()},
+            )
+        meta["segments"].append((segment, len(docs)))
+
+    def _merge(
+        self,
+        meta: dict,
+        segments: list[tuple[int, int]],
+    ) -> tuple[int, int]:
+        """Merges the segments into a new one, without the postings of files
+        that were modified or removed since they were indexed. Returns the new
+        segment and the number of files it indexes"""
+        live = {doc_id for _, _, doc_id in meta["files"].values()}
+        segment = meta["next_segment"]
+        meta["next_segment"] += 1
+        merged_docs: set[int] = set()
+        for shard in range(NUM_SHARDS):
+            merged: dict[str, bytes] = {}
+            for old_segment, _ in segments:
+                for token, data in self._read(f"seg-{old_segment}-{shard}").items():
+                    docs = {
+                        doc_id: numbers
+                        for doc_id, numbers in decode_postings(data)
+                        if doc_id in live
+                    }
+                    if docs:
+                        merged[token] = merged.get(token, b"") + encode_postings(docs)
+                        merged_docs.update(docs)
+            if merged:
+                self._write(f"seg-{segment}-{shard}", merged)
+        return segment, len(merged_docs)
+
+    def _remove_unlisted_segments(self, segments: Iterable[int]) -> None:
+        listed = {str(segment) for segment in segments}
+        for path in glob.glob(self._path("seg-*-*")):
+            if os.path.basename(path).split("-")[1] not in listed:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+    def _postings(
+        self, meta: dict, tokens: Iterable[str]
+    ) -> dict[str, dict[int, array]]:
+        """Line numbers of every token by live document id"""
+        live = {doc_id for _, _, doc_id in meta["files"].values()}
+        found: dict[str, dict[int, array]] = {token: {} for token in tokens}
+        by_shard: dict[int, list[str]] = {}
+        for token in found:
+            by_shard.setdefault(shard_of(token), []).append(token)
+
+        for shard, shard_tokens in by_shard.items():
+            for segment, _ in meta["segments"]:
+                postings = self._read(f"seg-{segment}-{shard}")
+                for token in shard_tokens:
+                    if token in postings:
+                        found[token].update(
+                            (doc_id, numbers)
+                            for doc_id, numbers in decode_postings(postings[token])
+                            if doc_id in live
+                        )
+        return found
+
+    def _lines(self, name: str) -> list[str]:
+        path = self._text_path(name) if name.endswith(".pdf") else None
+        try:
+            with open(
+                path or os.path.join(self.folder, name),
+                encoding="utf-8",
+                errors="replace",
+            ) as file:
+                return file.read().splitlines()
+        except OSError:
+            return []
+
+    def search(
+        self,
+        query: str,
+        num_results: int = 10,
+        num_snippets: int = 3,
+    ) -> list[SearchResult]:
+        """Finds the files containing every token of the query
+        Args:
+            query (str): words, commands or flags to look for
+            num_results (int, optional): number of files to retrieve.
+                Defaults to 10.
+            num_snippets (int, optional): number of matching lines to show per
+                file. Defaults to 3.
+        Returns:
+            list[SearchResult]: files sorted by decreasing tf-idf score, with
+                the lines matching most tokens of the query
+        """
+        meta = self._read_meta()
+        postings = self._query_postings(meta, query)
+        matching = set.intersection(*(set(docs) for docs in postings))
+        if not matching:
+            return []
+
+        num_files = len(meta["files"])
+        scores = dict.fromkeys(matching, 0.0)
+        for docs in postings:
+            idf = math.log(1 + num_files / len(docs))
+            for doc_id in matching:
+                scores[doc_id] += idf * (1 + math.log(len(docs[doc_id])))
+
+        names = {doc_id: name for name, (_, _, doc_id) in meta["files"].items()}
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], names[doc_id]))
+        return [
+            SearchResult(
+                names[doc_id],
+                scores[doc_id],
+                self._snippets(
+                    names[doc_id],
+                    [number for docs in postings for number in docs[doc_id]],
+                    num_snippets,
+                ),
+            )
+            for doc_id in ranked[:num_results]
+        ]
+
+    def _query_postings(self, meta: dict, query: str) -> list[dict[int, array[int]]]:
+        """Postings of every term of the query"""
+        query_tokens = split_tokens(query)
+        found = self._postings(meta, line_tokens(query))
+        # A compound token that isn't indexed as a whole (e.g. --force when
+        # only --force-with-lease is) matches the lines with all its parts
+        terms = set()
+        for token, parts in query_tokens.items():
+            terms.update(parts if parts and not found[token] else [token])
+        return [found[term] for term in terms] or [{}]
+
+    def _snippets(
+        self,
+        name: str,
+        line_numbers: list[int],
+        num_snippets: int,
+    ) -> list[tuple[int, str]]:
+        """The lines matching most terms, line_numbers holding the line
+        number of every match"""
+        matches = Counter(line_numbers)
+        best = sorted(matches, key=lambda number: (-matches[number], number))
+        lines = self._lines(name)
+        return [
+            (number + 1, lines[number].strip())
+            for number in sorted(best[:num_snippets])
+            if number < len(lines)
+        ]
@@ -0,0 +1,350 @@
+"""Damerau-Levenshtein (optimal string alignment) distances between many
+queries and many words at once, with NumPy. Needs the optional numpy
+dependency, see string_fuzzy_matcher.Corpus.search_batch"""
+
+from collections.abc import Sequence
+from typing import NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from utils.string_fuzzy_matcher import WordDistance
+
+# Queries are bit vectors of one machine word, longer ones can't be searched
+MAX_QUERY_LENGTH = 64
+
+# Words are grouped by length in buckets this wide, so the shorter words of a
+# group don't wait long for the longer ones
+LENGTH_BUCKET = 8
+
+# (query, word) pairs advanced at once, bounds the memory of a step to a few
+# tens of MiB
+MAX_PAIRS = 1 << 18
+
+# Distances computed before selecting the closest words, queries are handled
+# in groups so the (queries, words) array stays below it
+MAX_DISTANCES = 1 << 22
+
+Distances = npt.NDArray[np.int32]
+_Bits = npt.NDArray[np.uint64]
+# DP rows of the prefix search, words are far shorter than its range
+_ROW = np.int16
+_Row = npt.NDArray[np.int16]
+
+
+class EncodedBuckets:
+    """Words encoded once for the vectorized engine: each char is replaced by
+    its index in the sorted alphabet of the words plus one, 0 standing for
+    chars outside of it, and the words are grouped in length buckets"""
+
+    def __init__(self, words: Sequence[str]):
+        self.size = len(words)
+        codes = _code_points("".join(words))
+        self.alphabet = np.unique(codes)
+        ids = np.append(self.char_ids(codes), 0)
+        lengths = np.array([len(word) for word in words], dtype=np.intp)
+        starts = np.cumsum(lengths) - lengths
+
+        # (indices, lengths, char ids) per bucket, padded with the last id 0
+        self.buckets = []
+        buckets = lengths // LENGTH_BUCKET
+        for bucket in np.unique(buckets):
+            indices = np.flatnonzero(buckets == bucket)
+            columns = np.arange((bucket + 1) * LENGTH_BUCKET)
+            positions = np.where(
+                columns < lengths[indices, None],
+                starts[indices, None] + columns,
+                len(codes),
+            )
+            self.buckets.append((indices, lengths[indices], ids[positions]))
+
+    def char_ids(self, codes: npt.NDArray[np.uint32]) -> npt.NDArray[np.intp]:
+        ids = np.searchsorted(self.alphabet, codes)
+        known = ids < len(self.alphabet)
+        known[known] = self.alphabet[ids[known]] == codes[known]
+        return np.where(known, ids + 1, 0)
+
+
+def _code_points(text: str) -> npt.NDArray[np.uint32]:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def _match_masks(queries: Sequence[str], words: EncodedBuckets) -> _Bits:
+    """Bit i of masks[q, id] is set when queries[q][i] is the char id"""
+    masks = np.zeros((len(queries), len(words.alphabet) + 1), dtype=np.uint64)
+    for row, query in enumerate(queries):
+        ids = words.char_ids(_code_points(query))
+        known = ids > 0
+        bits = np.left_shift(np.uint64(1), np.arange(len(ids), dtype=np.uint64))
+        np.bitwise_or.at(masks[row], ids[known], bits[known])
+    return masks
+
+
+def distances(queries: Sequence[str], words: EncodedBuckets) -> Distances:
+    """Distances of every query, at most MAX_QUERY_LENGTH long, to every word.
+    Runs the bit-parallel algorithm of string_fuzzy_matcher.bit_parallel_distance
+    on all the (query, word) pairs of a bucket together, one word char at a
+    time, so a step is a handful of array operations whatever the number of
+    pairs.
+    Args:
+        queries (Sequence[str]): words to compare
+        words (EncodedBuckets): words to compare them with
+    Returns:
+        Distances: (len(queries), number of words) array of distances
+    """
+    result = np.empty((len(queries), words.size), dtype=np.int32)
+    if not queries:
+        return result
+    match_masks = _match_masks(queries, words)
+    lengths = np.array([len(query) for query in queries], dtype=np.uint64)
+
+    step = max(1, MAX_PAIRS // len(queries))
+    for indices, word_lengths, word_ids in words.buckets:
+        for start in range(0, len(indices), step):
+            chunk = slice(start, start + step)
+            result[:, indices[chunk]] = _bucket_distances(
+                match_masks, lengths, word_ids[chunk], word_lengths[chunk]
+            )
+    return result
+
+
+# pylint: disable-next=too-many-locals
+def _bucket_distances(
+    match_masks: _Bits,
+    query_lengths: npt.NDArray[np.uint64],
+    word_ids: npt.NDArray[np.intp],
+    word_lengths: npt.NDArray[np.intp],
+) -> Distances:
+    """Distances between the queries and the words, arrays are indexed by
+    (query, word). Bits beyond the length of a query are garbage, the
+    uint64 overflows only lose those"""
+    one, shape = np.uint64(1), (len(match_masks), len(word_ids))
+    # 64 ones, or one per query char
+    mask = np.where(
+        query_lengths == MAX_QUERY_LENGTH,
+        np.uint64(np.iinfo(np.uint64).max),
+        np.left_shift(one, query_lengths % MAX_QUERY_LENGTH) - one,
+    )[:, None]
+    last_bit = np.left_shift(one, np.maximum(query_lengths, one) - one)[:, None]
+    empty = (query_lengths == 0)[:, None]
+
+    vp = np.broadcast_to(mask, shape).copy()
+    vn = np.zeros(shape, dtype=np.uint64)
+    d0 = np.zeros(shape, dtype=np.uint64)
+    previous_match = np.zeros(shape, dtype=np.uint64)
+    distance = np.broadcast_to(query_lengths.astype(np.int32)[:, None], shape).copy()
+    for j in range(word_ids.shape[1]):
+        active = j < word_lengths
+        if not active.any():
+            break
+        match = match_masks[:, word_ids[:, j]]
+        transposition = ((~d0 & match) << one) & previous_match
+        d0 = (((match & vp) + vp) ^ vp) | match | vn | transposition
+        hp = vn | ~(d0 | vp)
+        hn = d0 & vp
+        # +1 when the last bit of hp is set, else -1 when hn's is
+        delta = ((hp & last_bit) != 0).astype(np.int32)
+        delta -= (((hn & last_bit) != 0) & (delta == 0)).astype(np.int32)
+        # empty queries are one insertion farther per char
+        distance += np.where(empty, 1, delta) * active
+        hp = (hp << one) | one
+        vp = ((hn << one) | ~(d0 | hp)) & mask
+        vn = hp & d0 & mask
+        previous_match = match
+    return distance
+
+
+def top_k(
+    row: Distances, num_results: int, max_distance: int | None
+) -> list[tuple[int, int]]:
+    """The num_results (index, distance) pairs of the smallest distances, ties
+    in index order, discarding distances beyond max_distance"""
+    if num_results <= 0:
+        return []
+    if max_distance is not None:
+        candidates = np.flatnonzero(row <= max_distance)
+    else:
+        candidates = np.arange(len(row))
+    if num_results < len(candidates):
+        # the candidates up to the num_results-th distance, still in order
+        kth = np.partition(row[candidates], num_results - 1)[num_results - 1]
+        candidates = candidates[row[candidates] <= kth]
+    order = candidates[np.argsort(row[candidates], kind="stable")][:num_results]
+    return [(int(index), int(row[index])) for index in order]
+
+
+def search(
+    queries: Sequence[str],
+    words: EncodedBuckets,
+    num_results: int,
+    max_distance: int | None,
+) -> list[list[tuple[int, int]]]:
+    """The top_k (index, distance) pairs of each query, in groups small
+    enough for their distances to every word to stay within MAX_DISTANCES"""
+    results = []
+    group = max(1, MAX_DISTANCES // max(1, words.size))
+    for start in range(0, len(queries), group):
+        rows = distances(queries[start : start + group], words)
+        results += [top_k(row, num_results, max_distance) for row in rows]
+    return results
+
+
+class _Live(NamedTuple):
+    """Live words of a bucket: their indices and lengths, their char ids, the
+    ids of their pairs of consecutive chars, their DP rows for the query
+    typed so far and for the query one char shorter, and their row minimums.
+    2D arrays are indexed by (column, word), so that the operations on a
+    column of all the words run over contiguous memory"""
+
+    indices: npt.NDArray[np.intp]
+    lengths: npt.NDArray[np.intp]
+    ids: npt.NDArray[np.integer]
+    pairs: npt.NDArray[np.integer]
+    rows: _Row
+    previous: _Row
+    minimums: _Row
+
+
+class PrefixSearch:
+    """string_fuzzy_matcher.PrefixSearch with NumPy: a typed char extends the
+    DP rows of all the live words of a length bucket together, one column at
+    a time. With a max_distance, only the band of columns where the distance
+    can be within it is computed"""
+
+    def __init__(
+        self,
+        words: Sequence[str],
+        encoded: EncodedBuckets,
+        max_distance: int | None = None,
+    ):
+        self.words = words
+        self.encoded = encoded
+        self.max_distance = max_distance
+        self.query = ""
+        self.longest = max((len(word) for word in words), default=0)
+        self.pair_base = len(encoded.alphabet) + 1
+        # the live words of each bucket after each typed char, None once
+        # there are none left
+        first: list[_Live | None] = []
+        # the smallest types holding the pair ids, pruning copies the arrays
+        ids_type = np.min_scalar_type(self.pair_base**2)
+        for indices, lengths, ids in encoded.buckets:
+            columns = ids.T.astype(ids_type)
+            rows = np.repeat(
+                np.arange(len(columns) + 1, dtype=_ROW)[:, None], len(indices), axis=1
+            )
+            first.append(
+                _Live(
+                    indices,
+                    lengths,
+                    columns,
+                    columns[:-1] * self.pair_base + columns[1:],
+                    rows,
+                    rows,
+                    np.zeros(len(indices), dtype=_ROW),
+                )
+            )
+        self.levels = [first]
+
+    def __len__(self) -> int:
+        """Number of live words"""
+        return sum(len(live.indices) for live in self.levels[-1] if live is not None)
+
+    def push(self, char: str) -> None:
+        """Appends char to the query"""
+        chars = self.encoded.char_ids(_code_points(self.query[-1:] + char))
+        # chars missing from the words match none of them, nor the padding
+        char_id = int(chars[-1]) or -1
+        # the pair of char and the previous char, transposed in the words
+        swap = char_id * self.pair_base + int(chars[0]) if self.query else -1
+        if min(chars) == 0:
+            swap = -1
+        self.query += char
+
+        # columns farther right than max_distance from the length of the
+        # query only hold distances beyond it
+        if self.max_distance is None:
+            band = len(self.query) + self.longest
+        else:
+            band = len(self.query) + self.max_distance
+        level: list[_Live | None] = []
+        for live in self.levels[-1]:
+            if live is not None:
+                rows = _extend_rows(live, len(self.query), char_id, swap, band)
+                live = live._replace(
+                    rows=rows,
+                    previous=live.rows,
+                    minimums=rows[: band + 1].min(axis=0),
+                )
+                if self.max_distance is not None:
+                    keep = np.flatnonzero(live.minimums <= self.max_distance)
+                    if keep.size == 0:
+                        live = None
+                    elif len(keep) < len(live.indices):
+                        live = _Live._make(array[..., keep] for array in live)
+            level.append(live)
+        self.levels.append(level)
+
+    def pop(self) -> None:
+        """Removes the last char of the query"""
+        if self.query:
+            self.query = self.query[:-1]
+            self.levels.pop()
+
+    def best(self, num_results: int = 10) -> list[WordDistance]:
+        """The num_results best ranked live words, in word order while the
+        query is empty"""
+        size = max(1, self.encoded.size)
+        # keys pack (row minimum, length, index) in one sortable integer
+        bound = self.longest + 1
+        keys = []
+        for live in self.levels[-1]:
+            if live is None:
+                continue
+            index = live.indices.astype(np.int64)
+            if self.query:
+                index += (live.minimums.astype(np.int64) * bound + live.lengths) * size
+            keys.append(index)
+        if not keys or num_results <= 0:
+            return []
+
+        best = np.concatenate(keys)
+        if num_results < len(best):
+            best = np.partition(best, num_results - 1)[:num_results]
+        best.sort()
+        return [
+            WordDistance(self.words[key % size], key // size // bound)
+            for key in best.tolist()
+        ]
+
+
+def _extend_rows(live: _Live, length: int, char_id: int, swap: int, band: int) -> _Row:
+    """DP rows of the query of the given length ending in char_id, whose
+    last two chars are the pair swap reversed, from the rows of the live
+    words. Only the columns up to band are computed, the next one is set
+    beyond max_distance so the next rows only read cells set here. Cells
+    beyond the length of a word never flow back into the others, and never
+    go below their row minimum since the padding matches no char"""
+    rows = np.empty(live.rows.shape, dtype=_ROW)
+    width = min(band + 1, len(rows))
+    if width < len(rows):
+        rows[width] = band + 1 - length
+    previous, before_previous = live.rows, live.previous
+    rows[0] = length
+    mismatch = np.empty(live.ids.shape[1], dtype=_ROW)
+    for j in range(1, width):
+        np.not_equal(live.ids[j - 1], char_id, out=mismatch, casting="unsafe")
+        row = rows[j]
+        # substitution or match
+        np.add(previous[j - 1], mismatch, out=row)
+        # deletion and insertion
+        np.minimum(row, previous[j] + 1, out=row)
+        np.minimum(row, rows[j - 1] + 1, out=row)
+        if j > 1 and swap >= 0:
+            np.minimum(
+                row,
+                before_previous[j - 2] + mismatch,
+                out=row,
+                where=live.pairs[j - 2] == swap,
+            )
+    return rows
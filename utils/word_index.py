@@ -0,0 +1,201 @@
+import contextlib
+import hashlib
+import heapq
+from collections.abc import Iterable
+
+from utils.sfm import sfm
+from utils.sidecar import read_sidecar, write_sidecar
+from utils.string_fuzzy_matcher import WordDistance
+
+
+def unrestricted_damerau_levenshtein_distance(str1: str, str2: str) -> int:
+    """Damerau-Levenshtein distance with unrestricted adjacent transpositions
+    (Lowrance-Wagner). Unlike the optimal string alignment distance computed by
+    sfm.damerau_levenshtein_distance it satisfies the triangle inequality, and
+    it is never greater than it, which makes it usable as the BK-tree metric.
+    https://en.wikipedia.org/wiki/Damerau%E2%80%93Levenshtein_distance
+    """
+    len_str1, len_str2 = len(str1), len(str2)
+    max_dist = len_str1 + len_str2
+    last_row_of: dict[str, int] = {}
+
+    # The matrix is shifted by one so that index 0 can hold the max_dist guard
+    distances = [[max_dist] * (len_str2 + 2) for _ in range(len_str1 + 2)]
+    for i in range(len_str1 + 1):
+        distances[i + 1][1] = i
+    for j in range(len_str2 + 1):
+        distances[1][j + 1] = j
+
+    for i in range(1, len_str1 + 1):
+        last_match_col = 0
+        for j in range(1, len_str2 + 1):
+            k = last_row_of.get(str2[j - 1], 0)
+            last = last_match_col
+            if str1[i - 1] == str2[j - 1]:
+                cost = 0
+                last_match_col = j
+            else:
+                cost = 1
+            distances[i + 1][j + 1] = min(
+                distances[i][j] + cost,  # Substitution
+                distances[i + 1][j] + 1,  # Insertion
+                distances[i][j + 1] + 1,  # Deletion
+                distances[k][last] + (i - k - 1) + 1 + (j - last - 1),  # Transposition
+            )
+        last_row_of[str1[i - 1]] = i
+
+    return distances[len_str1 + 1][len_str2 + 1]
+
+
+def corpus_fingerprint(words: Iterable[str]) -> str:
+    """Digest identifying a corpus (including its order), used to detect
+    stale persisted indexes"""
+    digest = hashlib.blake2b(digest_size=16)
+    for word in words:
+        digest.update(word.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class BKTree:
+    """Burkhard-Keller tree over a corpus of words.
+    Nodes are stored in insertion order, node 0 being the root, and each node
+    maps the tree distance to its parent onto the index of the child node.
+    Searches return the same results, in the same order, as
+    sfm.find_most_similar_words over the words in insertion order, but only
+    compare the query against the subtrees the triangle inequality can't rule
+    out.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self.words: list[str] = []
+        self.children: list[dict[int, int]] = []
+        self.fingerprint = ""
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def add(self, word: str) -> None:
+        """Inserts a word in the tree, duplicates are ignored"""
+        if not self.words:
+            self._append(word)
+            return
+
+        node = 0
+        while True:
+            distance = unrestricted_damerau_levenshtein_distance(
+                word,
+                self.words[node],
+            )
+            if distance == 0:
+                return
+            child = self.children[node].get(distance)
+            if child is None:
+                self.children[node][distance] = len(self.words)
+                self._append(word)
+                return
+            node = child
+
+    def _append(self, word: str) -> None:
+        self.words.append(word)
+        self.children.append({})
+        self.fingerprint = ""
+
+    def search(
+        self,
+        obj_word: str,
+        max_distance: int | None = None,
+        num_results: int = 10,
+    ) -> list[WordDistance]:
+        """Finds the most similar words to obj_word in the tree
+        Args:
+            obj_word (str): word to compare to
+            max_distance (int | None, optional): discard words farther than
+                this distance. Defaults to None, meaning no limit.
+            num_results (int, optional): number of results to retrieve.
+                Defaults to 10.
+        Returns:
+            list[WordDistance]: up to num_results WordDistance objects sorted
+                by distance, ties in insertion order
+        """
+        if not self.words or num_results <= 0:
+            return []
+
+        radius = max_distance
+        # max-heap (through negation) of the best (distance, node) found so far
+        best: list[tuple[int, int]] = []
+        pending = [0]
+        while pending:
+            node = pending.pop()
+            word = self.words[node]
+            tree_distance = unrestricted_damerau_levenshtein_distance(
+                obj_word,
+                word,
+            )
+            # The tree distance is a lower bound of the reported distance
+            if radius is None or tree_distance <= radius:
+                distance = sfm.damerau_levenshtein_distance(  # type: ignore[attr-defined]
+                    obj_word,
+                    word,
+                    radius,
+                )
+                if radius is None or distance <= radius:
+                    heapq.heappush(best, (-distance, -node))
+                    if len(best) > num_results:
+                        heapq.heappop(best)
+                    if len(best) == num_results:
+                        radius = -best[0][0]
+
+            pending.extend(
+                child
+                for edge, child in self.children[node].items()
+                if radius is None or abs(edge - tree_distance) <= radius
+            )
+
+        return [
+            WordDistance(word=self.words[-node], distance=-distance)
+            for distance, node in sorted(best, reverse=True)
+        ]
+
+    def save(self, path: str) -> None:
+        """Persists the tree to path"""
+        if not self.fingerprint:
+            self.fingerprint = corpus_fingerprint(self.words)
+        write_sidecar(path, self.fingerprint, (self.words, self.children))
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> "BKTree | None":
+        """Loads a tree persisted with save, if it was built from the corpus
+        identified by fingerprint"""
+        payload = read_sidecar(path, fingerprint)
+        if payload is None:
+            return None
+        tree = cls()
+        tree.words, tree.children = payload
+        tree.fingerprint = fingerprint
+        return tree
+
+
+def load_or_build(index_path: str, words: Iterable[str]) -> BKTree:
+    """Loads the index persisted at index_path, rebuilding and persisting it
+    when the corpus changed since it was saved.
+    Args:
+        index_path (str): path to the persisted index
+        words (Iterable[str]): current corpus
+    Returns:
+        BKTree: an index over words
+    """
+    words = list(words)
+    fingerprint = corpus_fingerprint(words)
+    tree = BKTree.load(index_path, fingerprint)
+    if tree is not None:
+        return tree
+
+    tree = BKTree(words)
+    tree.fingerprint = fingerprint
+    # a read-only location only costs rebuilding the index next time
+    with contextlib.suppress(OSError):
+        tree.save(index_path)
+    return tree